@@ -29,4 +29,6 @@ admin.site.register(Flight)
 admin.site.register(GroupFlight)
 admin.site.register(Vehicle)
 admin.site.register(ImportedTelemetryFile)
+admin.site.register(ImportCheckpoint)
+admin.site.register(ImportedFileFingerprint)
 admin.site.register(RemoteRestService)
@@ -89,6 +89,17 @@ XGDS_DATA_IMPORTS = {}
 
 # Add mappings to the importer for csv importers defined by yaml files
 XGDS_CORE_CSV_IMPORTER = {}
+# Number of rows per transaction when the csv importer loads in batches
+XGDS_CORE_IMPORT_BATCH_SIZE = 10000
+# Number of worker processes converting files when the csv set importer loads, None for the cpu count
+XGDS_CORE_IMPORT_PROCESSES = None
+# Imports are recognized by the content hash of the file.  Data imported before hashes were kept is only found
+# by querying for the first row of the file, which is slow on big tables; set this to False once it is not needed.
+XGDS_CORE_IMPORT_CHECK_FIRST_ROW = True
+# Number of imports the import handler runs at once, unless its config sets a concurrency
+XGDS_CORE_IMPORT_CONCURRENCY = 4
+# Directory for the parsed caches of csv files, None for xgds_import_cache in the temporary directory
+XGDS_CORE_IMPORT_CACHE_DIR = None
 XGDS_CORE_IMPORT_URL_PREFIX = 'localhost'
 
 # Override this to provide a function that will return a dictionary of current state information.
@@ -99,6 +110,9 @@ XGDS_CORE_FLIGHT_MODEL = "xgds_core.Flight"
 XGDS_CORE_ACTIVE_FLIGHT_MODEL = "xgds_core.ActiveFlight"
 XGDS_CORE_GROUP_FLIGHT_MODEL = "xgds_core.GroupFlight"
 XGDS_CORE_VEHICLE_MODEL = 'xgds_core.Vehicle'
+# Seconds the flight times looked up by imports are kept before they are loaded again, to see flights saved by
+# other processes
+XGDS_CORE_FLIGHT_INDEX_MAX_AGE = 60
 XGDS_CORE_VEHICLE_MONIKER = 'Vehicle'
 XGDS_CORE_FLIGHT_MONIKER = "Flight"
 XGDS_CORE_GROUP_FLIGHT_MONIKER = "Group Flight"
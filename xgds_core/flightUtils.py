@@ -17,6 +17,8 @@
 
 import pytz
 import json
+import time
+from bisect import bisect_right
 from geocamUtil.datetimeJsonEncoder import DatetimeJsonEncoder
 
 from uuid import uuid4
@@ -82,6 +84,178 @@ def getFlight(event_time, vehicle=None):
         return found_flights[0]
 
 
+class FlightIntervalIndex(object):
+    """
+    The start and end times of all the completed flights, loaded once and sorted so that the flight containing
+    a time is found with a binary search instead of queries.  Answers the same as getFlight.
+    The index is loaded when first used; call invalidate when flights change.  Saving or deleting a flight or an
+    active flight invalidates FLIGHT_INTERVAL_INDEX, but only in this process, so it is also loaded again once it
+    is older than XGDS_CORE_FLIGHT_INDEX_MAX_AGE seconds.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.load_time = None
+        self.intervals = {}
+        self.active_flights = []
+
+    def invalidate(self):
+        self.loaded = False
+        self.load_time = None
+        self.intervals = {}
+        self.active_flights = []
+
+    def check_age(self):
+        """
+        Invalidate the index if it was loaded more than XGDS_CORE_FLIGHT_INDEX_MAX_AGE seconds ago
+        """
+        max_age = settings.XGDS_CORE_FLIGHT_INDEX_MAX_AGE
+        if self.loaded and max_age is not None and time.time() - self.load_time > max_age:
+            self.invalidate()
+
+    def load(self):
+        """
+        Load the flights and active flights, with one query each.
+        Intervals are kept for each vehicle id and for None, meaning any vehicle, as sorted start times, end times,
+        the running maximum of the end times, and the (rank, vehicle id, flight id) of each flight.  The rank is
+        the position in the default ordering of the flights, which decides between matches like getFlight does.
+        """
+        flights = FLIGHT_MODEL.get().objects.exclude(end_time__isnull=True).exclude(start_time__isnull=True)
+        by_vehicle = {None: []}
+        for rank, (vehicle_id, start_time, end_time, flight_id) in enumerate(
+                flights.values_list('vehicle_id', 'start_time', 'end_time', 'id')):
+            interval = (start_time, end_time, (rank, vehicle_id, flight_id))
+            by_vehicle[None].append(interval)
+            by_vehicle.setdefault(vehicle_id, []).append(interval)
+
+        self.intervals = {}
+        for vehicle_id, intervals in by_vehicle.iteritems():
+            intervals.sort(key=lambda interval: interval[0])
+            max_ends = []
+            max_end = None
+            for interval in intervals:
+                if max_end is None or interval[1] > max_end:
+                    max_end = interval[1]
+                max_ends.append(max_end)
+            self.intervals[vehicle_id] = ([interval[0] for interval in intervals],
+                                          [interval[1] for interval in intervals],
+                                          max_ends,
+                                          [interval[2] for interval in intervals])
+
+        # (vehicle id, start time, flight id) in the order of .last()
+        self.active_flights = list(ACTIVE_FLIGHT_MODEL.get().objects.order_by('pk').values_list(
+            'flight__vehicle_id', 'flight__start_time', 'flight_id'))
+        self.loaded = True
+        self.load_time = time.time()
+
+    def get_flight_id(self, event_time, vehicle=None):
+        """
+        :param event_time: the event time to find a flight for
+        :param vehicle: the vehicle or its id, will default to the default vehicle for active flights
+        :return: the id of the flight that getFlight would return, or None
+        """
+        if not event_time:
+            return None
+        self.check_age()
+        if not self.loaded:
+            self.load()
+        vehicle_id = getattr(vehicle, 'pk', vehicle)
+
+        if settings.GEOCAM_UTIL_LIVE_MODE:
+            if not vehicle_id:
+                vehicle_id = settings.XGDS_CORE_DEFAULT_VEHICLE_PK
+            active_ids = [a[2] for a in self.active_flights if a[0] == vehicle_id]
+            if active_ids:
+                return active_ids[-1]
+
+        intervals = self.intervals.get(vehicle_id or None)
+        if intervals:
+            start_times, end_times, max_ends, flights = intervals
+            found = []
+            # every flight starting by the event time, back to where none can still be running
+            index = bisect_right(start_times, event_time) - 1
+            while index >= 0 and max_ends[index] >= event_time:
+                if end_times[index] >= event_time:
+                    found.append(flights[index])
+                index -= 1
+            if found:
+                found.sort()
+                if len(found) > 1:
+                    for rank, flight_vehicle_id, flight_id in found:
+                        if flight_vehicle_id == settings.XGDS_CORE_DEFAULT_VEHICLE_PK:
+                            return flight_id
+                return found[0][2]
+
+        active = self.get_active_flight(vehicle_id)
+        if active and active[1] and event_time >= active[1]:
+            return active[2]
+        return None
+
+    def get_active_flight(self, vehicle_id=None):
+        """
+        :param vehicle_id: the vehicle id
+        :return: the (vehicle id, start time, flight id) of the flight getActiveFlight would return, or None
+        """
+        if vehicle_id is not None:
+            found = [a for a in self.active_flights if a[0] == vehicle_id]
+        else:
+            found = [a for a in self.active_flights if a[0] == settings.XGDS_CORE_DEFAULT_VEHICLE_PK]
+            if not found:
+                found = self.active_flights
+        if found:
+            return found[-1]
+        return None
+
+    def get_flight_ids(self, event_times, vehicle=None):
+        """
+        :param event_times: the event times to find flights for
+        :param vehicle: the vehicle or its id
+        :return: list of the flight id for each time, or None
+        """
+        return [self.get_flight_id(event_time, vehicle) for event_time in event_times]
+
+
+# Shared by get_flights; see invalidate_flight_index in models
+FLIGHT_INTERVAL_INDEX = FlightIntervalIndex()
+
+
+def get_flights(event_times, vehicle=None):
+    """
+    Returns the flight that contains each event time, like getFlight but with two queries for all of the times.
+    :param event_times: the event times to find flights for
+    :param vehicle: the vehicle, will default to the default vehicle
+    :return: list of the flight for each time, or None
+    """
+    flight_ids = FLIGHT_INTERVAL_INDEX.get_flight_ids(event_times, vehicle)
+    flights = FLIGHT_MODEL.get().objects.in_bulk([flight_id for flight_id in set(flight_ids) if flight_id])
+    return [flights.get(flight_id) for flight_id in flight_ids]
+
+
+def get_flight_for_time_span(start_time, end_time, vehicle=None):
+    """
+    Returns the flight for data covering a span of time, ie a file.
+    This is the flight containing the start time, or else the first completed flight overlapping the span,
+    or else the flight containing the end time.  The start and end times are looked up in FLIGHT_INTERVAL_INDEX.
+    :param start_time: the earliest time of the data
+    :param end_time: the latest time of the data
+    :param vehicle: the vehicle, will default to the default vehicle
+    :return: the flight, or None
+    """
+    if not vehicle:
+        vehicle = get_default_vehicle()
+    flight, end_flight = get_flights([start_time, end_time], vehicle)
+    if flight or not end_time:
+        return flight
+    if start_time:
+        found_flights = FLIGHT_MODEL.get().objects.exclude(end_time__isnull=True).filter(vehicle=vehicle,
+                                                                                         start_time__lte=end_time,
+                                                                                         end_time__gte=start_time)
+        flight = found_flights.order_by('start_time').first()
+        if flight:
+            return flight
+    return end_flight
+
+
 def getNextAlphabet(character):
     """
     For getting the next letter of the alphabet for prefix.
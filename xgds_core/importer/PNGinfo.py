@@ -17,6 +17,9 @@
 
 import sys
 import re
+import mmap
+import struct
+import zlib
 from dateutil.parser import parse as dateparser
 import json
 import pytz
@@ -30,49 +33,125 @@ import pytz
 # more details.
 
 
+# PNG file signature must be these exact 8 bytes
+PNG_SIGNATURE = b'\x89\x50\x4e\x47\x0d\x0a\x1a\x0a'
+
+# Length and type at the start of each chunk, and the CRC at its end
+CHUNK_HEADER = struct.Struct('>I4s')
+CHUNK_CRC_SIZE = 4
+
+# The chunks whose data is read; the others are skipped
+TEXT_CHUNKS = ('tEXt', 'zTXt', 'iTXt')
+
+
 def to_int(binary_data):
     return int(binary_data.encode('hex'),16)
 
-class PNGinfo():
-    def __init__(self,filename):
-        # Open and parse the data in a PNG
-        fp = open(filename,'rb')
-        file_data = fp.read()
-        fp.close()
 
-        # PNG file signature must be these exact 8 bytes:
-        signature = ''.join(file_data[:8])
-        if not signature==bytearray(b'\x89\x50\x4e\x47\x0d\x0a\x1a\x0a'):
-            raise ValueError('Image is not a valid PNG, signature mismatch')
+class FileReader(object):
+    """
+    Reads parts of a file by seeking, without a buffer, so only the bytes asked for are read
+    """
+
+    def __init__(self, filename):
+        self.fp = open(filename, 'rb', 0)
+
+    def read(self, offset, length):
+        self.fp.seek(offset)
+        return self.fp.read(length)
+
+    def close(self):
+        self.fp.close()
+
 
+class MmapReader(object):
+    """
+    Reads parts of a memory mapped file, so only the pages touched are read
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as fp:
+            self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, offset, length):
+        return self.map[offset:offset + length]
+
+    def close(self):
+        self.map.close()
+
+
+class PNGinfo():
+    def __init__(self, filename, stop_at_image=False, use_mmap=False):
+        """
+        Read the header and text of a PNG, chunk by chunk, reading only the data of the IHDR and text chunks
+        :param filename: the PNG file
+        :param stop_at_image: stop at the first IDAT chunk, for files whose text is known to come before the image.
+        Otherwise the image data is skipped over to find text which follows it.
+        :param use_mmap: memory map the file instead of seeking and reading
+        """
         # extract strings from tEXt chunks and standard PNG header
         self.text = []
         self.header = {}
 
-        # index into binary data from the file
-        byteidx = 0
+        reader = MmapReader(filename) if use_mmap else FileReader(filename)
+        try:
+            if reader.read(0, len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                raise ValueError('Image is not a valid PNG, signature mismatch')
+            self.read_chunks(reader, stop_at_image)
+        finally:
+            reader.close()
+
+    def read_chunks(self, reader, stop_at_image):
+        # offset of the current chunk in the file
+        offset = len(PNG_SIGNATURE)
 
         # PNG chunk type code
         chunk_type = None
 
         while 'IEND' != chunk_type:
+            chunk_header = reader.read(offset, CHUNK_HEADER.size)
+            if len(chunk_header) < CHUNK_HEADER.size:
+                # truncated
+                break
             # Length: 4-byte unsigned integer, number of bytes in the data field.
-            chunk_length = to_int(file_data[byteidx+8:byteidx+12])
             # Chunk Type: A 4-byte type code, upper/lowercase letters (A-Z, a-z).
-            chunk_type =''.join(file_data[byteidx+12:byteidx+16])
-            # Chunk Data: The data, if any, can be zero length.
-            chunk_data =''.join(file_data[byteidx+16:byteidx+16+chunk_length])
-        
+            chunk_length, chunk_type = CHUNK_HEADER.unpack(chunk_header)
+            data_offset = offset + CHUNK_HEADER.size
+
             # IHDR is always required and always at the top
             if chunk_type == 'IHDR':
-                self.extract_png_header(chunk_data)
-            # tEXt contains free-form strings, can me more than one, keep a list
-            elif chunk_type == 'tEXt':
-                self.text.append(chunk_data.decode('utf-8'))
+                self.extract_png_header(reader.read(data_offset, chunk_length))
+            # text chunks contain free-form strings, can be more than one, keep a list
+            elif chunk_type in TEXT_CHUNKS:
+                self.extract_text(chunk_type, reader.read(data_offset, chunk_length))
+            elif chunk_type == 'IDAT' and stop_at_image:
+                break
             # There are other chunk types we don't care about at the moment
 
-            # jump the byte index to the beginning of the next chunk
-            byteidx += chunk_length + 12
+            # jump to the beginning of the next chunk
+            offset = data_offset + chunk_length + CHUNK_CRC_SIZE
+
+    def extract_text(self, chunk_type, data):
+        """
+        Add the text of a text chunk as keyword, null, text
+        :param chunk_type: tEXt, zTXt or iTXt
+        :param data: the chunk data
+        """
+        if chunk_type == 'tEXt':
+            self.text.append(data.decode('utf-8'))
+            return
+        keyword, rest = data.split('\0', 1)
+        if chunk_type == 'zTXt':
+            # compression method, always zlib
+            text = zlib.decompress(rest[1:]).decode('latin-1')
+        else:
+            # iTXt: compression flag, compression method, language tag, translated keyword
+            compressed = rest[0] == '\x01'
+            language, translated, text = rest[2:].split('\0', 2)
+            if compressed:
+                text = zlib.decompress(text)
+            text = text.decode('utf-8')
+        self.text.append(keyword.decode('latin-1') + u'\0' + text)
 
     def get_text(self):
         return self.text
@@ -0,0 +1,304 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+A columnar backend for the csv importer.  The file is read in chunks and each column of a chunk is converted
+as a whole using numpy, driven by the same yaml specification as CsvImporter and producing the same rows.
+see ../../docs/dataImportYml.rst
+"""
+
+import logging
+import math
+import re
+from collections import OrderedDict
+from itertools import islice, imap
+
+import numpy as np
+import pytz
+
+from django.conf import settings
+
+from xgds_core.importer.csvImporter import CsvImporter
+from xgds_core.importer.timestampParser import UNIXTIME_FLOAT_SECOND, UNIXTIME_INT_MICROSECOND
+from xgds_core.importer.importProfiler import READ, TYPE
+
+# Marks a cell whose key is not in the row, ie a value that was not required and could not be converted
+MISSING = object()
+
+# numpy versions of the unit converters in CsvImporter
+UFUNCS = {math.degrees: np.degrees,
+          math.radians: np.radians}
+
+# Range of unix times that datetime can represent, 0001-01-01 to 9999-12-31
+MIN_UNIX_TIME = -62135596800
+MAX_UNIX_TIME = 253402300799
+
+
+def unix_times_to_datetimes(seconds):
+    """
+    Convert an array of unix times to timezone aware utc datetimes, rounding to the microsecond the same
+    way as datetime.utcfromtimestamp
+    :param seconds: numpy array of float seconds since the epoch
+    :return: list of datetimes
+    """
+    if not np.isfinite(seconds).all():
+        raise ValueError('Invalid unix time')
+    if len(seconds) and (seconds.min() < MIN_UNIX_TIME or seconds.max() > MAX_UNIX_TIME):
+        raise ValueError('Unix time out of range')
+    whole = np.trunc(seconds)
+    fraction = (seconds - whole) * 1e6
+    # round half away from zero
+    micros = np.where(fraction >= 0, np.floor(fraction + 0.5), np.ceil(fraction - 0.5))
+    return unix_microseconds_to_datetimes(whole.astype(np.int64) * 1000000 + micros.astype(np.int64))
+
+
+def unix_microseconds_to_datetimes(microseconds):
+    """
+    Convert an array of unix times to timezone aware utc datetimes
+    :param microseconds: numpy int64 array of microseconds since the epoch
+    :return: list of datetimes
+    """
+    if len(microseconds) and (microseconds.min() < MIN_UNIX_TIME * 1000000 or
+                              microseconds.max() > MAX_UNIX_TIME * 1000000 + 999999):
+        raise ValueError('Unix time out of range')
+    return [t.replace(tzinfo=pytz.utc) for t in microseconds.astype('datetime64[us]').tolist()]
+
+
+class ColumnarCsvImporter(CsvImporter):
+    """
+    Loads csv files a chunk of rows at a time, converting whole columns instead of single values.
+    A column that cannot be converted as an array (missing values, regex misses, unsupported types) falls back
+    to the per field converters of CsvImporter for that chunk, so the resulting rows are identical.
+    """
+
+    def __iter__(self):
+        batch_size = self.batch_size or settings.XGDS_CORE_IMPORT_BATCH_SIZE
+        for rows in self.iter_batches(batch_size):
+            for row in rows:
+                yield row
+
+    def convert_batches(self, batch_size):
+        """
+        Read the CSV file a chunk at a time and convert each chunk by columns
+        :param batch_size: the maximum number of rows in each chunk
+        :return: a generator of lists of rows as updated dicts
+        """
+        self.reset_csv()
+        # DictReader skips blank lines
+        raw_rows = (r for r in self.csv_reader.reader if r)
+        while True:
+            with self.profile_stage(READ):
+                chunk = list(islice(raw_rows, batch_size))
+            if not chunk:
+                break
+            # columns are converted as a whole, so only the per value fallback is timed by stage
+            with self.profile_stage(TYPE):
+                rows = self.convert_chunk(chunk)
+            yield rows
+        self.csv_file.close()
+
+    def convert_chunk(self, chunk):
+        """
+        Convert a chunk of raw csv rows
+        :param chunk: list of lists of strings as read by the csv reader
+        :return: list of the rows as updated dicts
+        """
+        count = len(chunk)
+        fieldnames = self.config['fieldnames']
+        width = len(fieldnames)
+        columns = OrderedDict()
+        if all(len(r) == width for r in chunk):
+            for name, values in zip(fieldnames, zip(*chunk)):
+                columns[name] = list(values)
+        else:
+            # pad and collect extras the way DictReader does
+            for index, name in enumerate(fieldnames):
+                columns[name] = [r[index] if index < len(r) else None for r in chunk]
+            if any(len(r) > width for r in chunk):
+                columns[None] = [r[width:] if len(r) > width else MISSING for r in chunk]
+
+        result = self.convert_columns(columns, self.config, count)
+        keys = list(result.keys())
+        rows = []
+        for values in zip(*result.values()):
+            rows.append({k: v for k, v in zip(keys, values) if v is not MISSING})
+        return rows
+
+    def convert_columns(self, columns, config, count):
+        """
+        Convert columns of values per the config, see update_row
+        :param columns: OrderedDict of name to list of values
+        :param config: the config (or the config of a delimited field)
+        :param count: the number of rows
+        :return: OrderedDict of name to list of converted values, with MISSING for values not in a row
+        """
+        result = OrderedDict(columns)
+        if 'defaults' in config:
+            for key, value in config['defaults'].iteritems():
+                result[key] = [value] * count
+
+        plan = config.get('plan')
+        if plan is None:
+            plan = self.compile_plan(config)
+        for (field_name, field_config), convert in zip(config['fields'].iteritems(), plan):
+            if field_name in result:
+                cells = result.pop(field_name)
+            else:
+                cells = [MISSING] * count
+            try:
+                converted = self.convert_column(field_name, field_config, cells, count)
+            except (ValueError, TypeError, OverflowError) as e:
+                # the per field converter decides whether the bad value is dropped or raises
+                logging.info('Converting %s one value at a time: %s', field_name, e)
+                converted = None
+            else:
+                if converted is None:
+                    logging.info('Converting %s one value at a time', field_name)
+            if converted is None:
+                converted = self.convert_cells(field_name, convert, cells)
+            result.update(converted)
+        return result
+
+    def convert_cells(self, field_name, convert, cells):
+        """
+        Convert a column one value at a time with the converter from the plan
+        :param field_name: the name of the field
+        :param convert: the converter for the field, see compile_field
+        :param cells: the values
+        :return: OrderedDict of name to list of converted values
+        """
+        converted = OrderedDict()
+        for index, cell in enumerate(cells):
+            row = {} if cell is MISSING else {field_name: cell}
+            convert(row)
+            for key, value in row.iteritems():
+                if key not in converted:
+                    converted[key] = [MISSING] * len(cells)
+                converted[key][index] = value
+        return converted
+
+    def convert_column(self, field_name, field_config, cells, count):
+        """
+        Convert a whole column.  Raises ValueError or returns None if the column has to be converted one value at
+        a time.
+        :param field_name: the name of the field
+        :param field_config: the config for the field
+        :param cells: the values
+        :param count: the number of rows
+        :return: OrderedDict of name to list of converted values, or None
+        """
+        if 'skip' in field_config and field_config['skip']:
+            if any(c is MISSING for c in cells):
+                return None
+            return {}
+        if any(c is MISSING or c is None for c in cells):
+            return None
+
+        values = cells
+        if 'regex' in field_config:
+            if not field_config['regex']:
+                return None
+            regex = re.compile(field_config['regex'])
+            matches = [regex.search(c) if c else None for c in values]
+            if None in matches:
+                return None
+            values = [m.groups()[-1] for m in matches]
+
+        if field_config.get('type') == 'delimited':
+            if 'None' in values:
+                return None
+            delimiter = field_config.get('delimiter')
+            parts = [v.split(delimiter) for v in values]
+            sub_columns = OrderedDict()
+            for index, name in enumerate(field_config['fields']):
+                sub_columns[name] = [p[index] if index < len(p) else MISSING for p in parts]
+            return self.convert_columns(sub_columns, field_config, count)
+
+        # Independent of type, the string 'None' becomes a python None
+        none_mask = [v == 'None' for v in values]
+        if any(none_mask):
+            converted = self.convert_values(field_name, field_config,
+                                            [v for v, is_none in zip(values, none_mask) if not is_none])
+            if converted is None:
+                return None
+            converted = iter(converted)
+            values = [None if is_none else next(converted) for is_none in none_mask]
+        else:
+            values = self.convert_values(field_name, field_config, values)
+        if values is None:
+            return None
+        return {field_name: values}
+
+    def convert_values(self, field_name, field_config, values):
+        """
+        Convert a list of values to the type of the field, and then to its storage units.
+        Raises ValueError if any value cannot be converted.
+        :param field_name: the name of the field
+        :param field_config: the config for the field
+        :param values: list of strings
+        :return: list of converted values, or None if they have to be converted one at a time
+        """
+        field_type = field_config.get('type')
+        convert_units = self.compile_units_converter(field_config)
+        array = None
+
+        if field_type is None or field_type == 'string' or field_type == 'text':
+            pass
+        elif field_type == 'float':
+            array = np.array(values, dtype=np.float64)
+        elif field_type == 'integer':
+            values = list(imap(int, values))
+        elif field_type == 'datetime' or field_type == 'date' or field_type == 'time':
+            time_format = self.get_time_parser(field_name).time_format
+            if time_format == UNIXTIME_FLOAT_SECOND:
+                values = unix_times_to_datetimes(np.array(values, dtype=np.float64))
+            elif time_format == UNIXTIME_INT_MICROSECOND:
+                values = unix_microseconds_to_datetimes(np.array(list(imap(int, values)), dtype=np.int64))
+            else:
+                return self.convert_time_values(field_name, values)
+        elif field_type == 'boolean' or field_type == 'nullboolean':
+            lookup = {'true': True, 'false': False}
+            if field_type == 'nullboolean':
+                lookup.update({'null': None, 'none': None})
+            values = [v.lower() for v in values]
+            if not all(v in lookup for v in values):
+                # other values are read as integers by the per field converter
+                return None
+            values = [lookup[v] for v in values]
+        else:
+            raise ValueError('%s is not supported by the columnar importer' % field_type)
+
+        if convert_units:
+            converter = self.converters[field_config['units']][field_config['storage_units']]
+            if array is not None and converter in UFUNCS:
+                array = UFUNCS[converter](array)
+            else:
+                if array is not None:
+                    values = array.tolist()
+                    array = None
+                values = [convert_units(v) if v else v for v in values]
+        if array is not None:
+            values = array.tolist()
+        return values
+
+    def convert_time_values(self, field_name, values):
+        """
+        Convert a list of time strings which have no array conversion, one at a time with the field's time parser
+        :param field_name: the name of the time field
+        :param values: list of strings
+        :return: list of datetimes
+        """
+        return map(self.get_time_parser(field_name).parse, values)
@@ -24,7 +24,7 @@ import csvImporter
 def main():
     import optparse
 
-    parser = optparse.OptionParser('usage: -c config -i input')
+    parser = optparse.OptionParser('usage: -c config -i input [more inputs]')
     parser.add_option('-c', '--config', help='path to config file (yaml)')
     parser.add_option('-i', '--input', help='path to csv file to import')
     parser.add_option('-v', '--vehicle', help='name of vehicle')
@@ -35,6 +35,27 @@ def main():
     parser.add_option('-z', '--timezone', help='timezone, defaults to UTC.  example: America/Los_Angeles')
     parser.add_option('-s', '--skip_bad', action="store_true", dest="skip_bad", default=False,
                       help='Skip bad rows, importing all other data')
+    parser.add_option('-b', '--batch_size', type='int', default=None,
+                      help='stream the file, committing this many rows per transaction')
+    parser.add_option('-e', '--engine', type='choice', choices=['row', 'columnar'], default='row',
+                      help='row to convert one row at a time, columnar to convert chunks of columns with numpy')
+    parser.add_option('-j', '--processes', type='int', default=None,
+                      help='with more than one input, the number of processes converting files')
+    parser.add_option('-k', '--checkpoint', action="store_true", dest="checkpoint", default=False,
+                      help='save progress after each batch, and continue from it if the import is rerun')
+    parser.add_option('-n', '--native', action="store_true", dest="native", default=False,
+                      help='create rows with COPY on PostgreSQL or LOAD DATA LOCAL INFILE on MySQL')
+    parser.add_option('-C', '--cache', action="store_true", dest="cache", default=False,
+                      help='keep the converted rows in a binary cache in XGDS_CORE_IMPORT_CACHE_DIR, and read them '
+                           'from it when the same file is imported again with the same config')
+    parser.add_option('-F', '--follow', action="store_true", dest="follow", default=False,
+                      help='keep importing lines as they are appended to the file, like tail -f; progress is '
+                           'saved as with --checkpoint, so a restarted follow continues where it stopped')
+    parser.add_option('--idle', type='float', default=None,
+                      help='with --follow, stop once nothing has been appended for this many seconds')
+    parser.add_option('--profile', action="store_true", dest="profile", default=False,
+                      help='report rows/s and the time spent in each stage of the import')
+    parser.add_option('--cprofile', help='with --profile, also dump cProfile stats to this path')
 
     opts, args = parser.parse_args()
 
@@ -43,10 +64,49 @@ def main():
     if not opts.input:
         parser.error('input is required')
 
-    importer = csvImporter.CsvImporter(opts.config, opts.input, opts.vehicle, opts.flight, opts.timezone, opts.reload,
-                                       force=opts.replace, skip_bad=opts.skip_bad)
-    result = importer.load_csv()
-    print 'loaded %d ' % len(result)
+    if args:
+        # a set of files which continue one another, loaded in lexicographic order
+        importer = csvImporter.CsvSetImporter(opts.config, sorted([opts.input] + args), opts.vehicle, opts.flight,
+                                              opts.timezone, opts.reload, force=opts.replace,
+                                              skip_bad=opts.skip_bad, batch_size=opts.batch_size)
+        profiler = start_profile(importer.csv_importer, opts)
+        count = importer.load_csv_in_batches(processes=opts.processes)
+        print 'loaded %d ' % count
+        stop_profile(profiler, count)
+        return
+
+    importer_class = csvImporter.CsvImporter
+    if opts.engine == 'columnar':
+        import columnarCsvImporter
+        importer_class = columnarCsvImporter.ColumnarCsvImporter
+
+    importer = importer_class(opts.config, opts.input, opts.vehicle, opts.flight, opts.timezone, opts.reload,
+                             force=opts.replace, skip_bad=opts.skip_bad, batch_size=opts.batch_size,
+                             checkpoint=opts.checkpoint, native=opts.native, cache=opts.cache,
+                             follow=opts.follow)
+    profiler = start_profile(importer, opts)
+    if opts.follow:
+        count = importer.follow(idle_seconds=opts.idle)
+    elif opts.batch_size or opts.checkpoint or opts.native:
+        count = importer.load_csv_in_batches()
+    else:
+        count = len(importer.load_csv())
+    print 'loaded %d ' % count
+    stop_profile(profiler, count)
+
+
+def start_profile(importer, opts):
+    if not opts.profile and not opts.cprofile:
+        return None
+    profiler = importer.profile(opts.cprofile)
+    profiler.start()
+    return profiler
+
+
+def stop_profile(profiler, count):
+    if profiler:
+        profiler.stop()
+        print profiler.report(count)
 
 
 if __name__ == '__main__':
@@ -19,8 +19,11 @@ Utilities for loading a csv file into the database per the yaml specification.
 see ../../docs/dataImportYml.rst
 """
 
+import hashlib
 import math
+import os
 import yaml
+from bisect import bisect_left
 import re
 import time
 import traceback
@@ -33,13 +36,19 @@ except ImportError:
 import pytz
 import csv
 import datetime
+import multiprocessing
 from pydoc import locate
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from itertools import islice, izip
 
 from geocamUtil.loader import getModelByName
-from xgds_core.flightUtils import get_default_vehicle, getFlight, create_group_flight, \
-    get_next_available_group_flight_name, lookup_vehicle, lookup_flight, get_or_create_flight
-from xgds_core.util import persist_error
+from xgds_core.flightUtils import get_default_vehicle, get_flights, create_group_flight, \
+    get_next_available_group_flight_name, lookup_vehicle, lookup_flight, get_or_create_flight, \
+    get_flight_for_time_span, FLIGHT_INTERVAL_INDEX
+from xgds_core.util import persist_error, get_content_hash
+from xgds_core.importer.timestampParser import TimestampParser, is_supported_format
+from xgds_core.importer.importProfiler import ImportProfiler, NULL_STAGE, READ, REGEX, TYPE, UNITS, LOOKUP, WRITE
+from xgds_core.importer.nativeLoader import native_load
 from geocamUtil.loader import LazyGetModelByName
 from geocamTrack.utils import getClosestPosition
 
@@ -48,13 +57,35 @@ from datetime import timedelta
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Case, Value, When
 
 
 VEHICLE_MODEL = LazyGetModelByName(settings.XGDS_CORE_VEHICLE_MODEL)
 FLIGHT_MODEL = LazyGetModelByName(settings.XGDS_CORE_FLIGHT_MODEL)
+PAST_POSITION_MODEL = LazyGetModelByName(settings.GEOCAM_TRACK_PAST_POSITION_MODEL)
+IMPORT_CHECKPOINT_MODEL = LazyGetModelByName('xgds_core.ImportCheckpoint')
+FINGERPRINT_MODEL = LazyGetModelByName('xgds_core.ImportedFileFingerprint')
 
 POSITION_LOOKUP_DELAY = 1 # seconds
 
+# How many rows from the start of a file to sample when looking for its time span
+SAMPLE_ROWS = 100
+# How many bytes from the end of a file to read to find its last row
+TAIL_BYTES = 64 * 1024
+# How long to wait before looking for new lines in a file we are following
+FOLLOW_POLL_SECONDS = 1
+# At most how many bytes from the start of a file are hashed to tell whether a checkpoint is for the same file
+FINGERPRINT_BYTES = 64 * 1024
+# Reports the counts of update_stored_data when replacing
+REPLACE_STATS = 'matched %(matched)d, updated %(updated)d, created %(created)d, missing %(missing)d records'
+
+# Shared by clean_time, remembers the layout of the last time string
+CLEAN_TIME_PARSER = TimestampParser()
+
+# The importer used by the worker processes of CsvSetImporter, inherited when the pool forks
+WORKER_IMPORTER = None
+
 
 def clean_time(input_string):
     """
@@ -64,7 +95,7 @@ def clean_time(input_string):
     :return: the parsed time
     """
     try:
-        result = dateparser(input_string)
+        result = CLEAN_TIME_PARSER.parse_datetime(input_string)
         return result
     except Exception as e:
         regex_pattern = '(.*\d{2}:\d{2})(:60\.?0*)(\s*\w*)'
@@ -118,6 +149,158 @@ def lookup_position(row, timestamp_key='timestamp', position_id_key='position_id
     return row
 
 
+def bulk_update(the_model, changes, batch_size=1000):
+    """
+    Update many stored rows with few queries: one UPDATE ... CASE WHEN per field for each batch of primary keys.
+    No model instances are built; like bulk_create, save is not called and no signals are sent.
+    :param the_model: the model we are working with
+    :param changes: dictionary of model field to dictionary of primary key to new value
+    :param batch_size: the maximum number of primary keys per query
+    :return:
+    """
+    for field, values in changes.iteritems():
+        pks = list(values.keys())
+        for index in range(0, len(pks), batch_size):
+            batch = pks[index:index + batch_size]
+            whens = [When(pk=pk, then=Value(values[pk], output_field=field)) for pk in batch]
+            the_model.objects.filter(pk__in=batch).update(**{field.attname: Case(*whens, output_field=field)})
+
+
+class PositionIndex(object):
+    """
+    The timestamps and ids of a track's positions within a time window, or of all positions if there is no track
+    as with getClosestPosition, sorted so that the closest position to a time is found with a binary search rather
+    than a query per time.
+    """
+
+    def __init__(self, track, start_time, end_time, max_time_difference_seconds=None):
+        """
+        Load the positions, in one query
+        :param track: the track, if None the positions of all tracks
+        :param start_time: the first time that will be looked up
+        :param end_time: the last time that will be looked up
+        :param max_time_difference_seconds: how far a position can be from a time, defaults to the geocamTrack setting
+        """
+        if max_time_difference_seconds is None:
+            max_time_difference_seconds = settings.GEOCAM_TRACK_INTERPOLATE_MAX_SECONDS
+        self.max_difference = timedelta(seconds=max_time_difference_seconds)
+        self.timestamps = []
+        self.ids = []
+        positions = PAST_POSITION_MODEL.get().objects.filter(timestamp__gte=start_time - self.max_difference,
+                                                             timestamp__lte=end_time + self.max_difference)
+        if track:
+            positions = positions.filter(track=track)
+        for timestamp, position_id in positions.order_by('timestamp').values_list('timestamp', 'id'):
+            self.timestamps.append(timestamp)
+            self.ids.append(position_id)
+
+    def get_position_id(self, timestamp):
+        """
+        :param timestamp: the time
+        :return: the id of the position closest to the time, or None if there is none close enough
+        """
+        index = bisect_left(self.timestamps, timestamp)
+        found_id = None
+        found_difference = None
+        for candidate in (index - 1, index):
+            if 0 <= candidate < len(self.timestamps):
+                difference = abs(self.timestamps[candidate] - timestamp)
+                if difference <= self.max_difference and (found_difference is None or difference < found_difference):
+                    found_id = self.ids[candidate]
+                    found_difference = difference
+        return found_id
+
+
+def lookup_positions(rows, track, timestamp_key='timestamp', position_id_key='position_id', position_found_key=None):
+    """
+    Look up the positions for a batch of rows with one query, see lookup_position
+    :param rows: the dictionaries to use
+    :param track: the track to find positions on, or None for any track
+    :param timestamp_key: which key contains the timestamp
+    :param position_id_key: which key should contain the position id
+    :param position_found_key: if the row should store whether or not the position is found
+    :return: the rows for which no position was found
+    """
+    times = [row[timestamp_key] for row in rows]
+    if not times:
+        return []
+    index = PositionIndex(track, min(times), max(times))
+    missing = []
+    for row in rows:
+        position_id = index.get_position_id(row[timestamp_key])
+        if position_id is not None:
+            row[position_id_key] = position_id
+        else:
+            missing.append(row)
+        if position_found_key:
+            row[position_found_key] = position_id is not None
+    return missing
+
+
+def get_file_fingerprint(file_path, length):
+    """
+    :param file_path: the path to the file
+    :param length: how many bytes from the start of the file to hash
+    :return: the sha1 of the start of the file as hex
+    """
+    with open(file_path, 'rb') as the_file:
+        return hashlib.sha1(the_file.read(length)).hexdigest()
+
+
+class LineReader(object):
+    """
+    Reads the lines of a file with readline, keeping the offset after the last line read, so the csv reader
+    can be checkpointed.  Iterating a file reads ahead, so its tell is not where the csv reader is.
+    """
+
+    def __init__(self, the_file):
+        self.file = the_file
+        self.offset = the_file.tell()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.file.readline()
+        if not line:
+            raise StopIteration
+        self.offset = self.file.tell()
+        return line
+
+    def seek(self, offset):
+        self.file.seek(offset)
+        self.offset = offset
+
+
+class FollowLineReader(LineReader):
+    """
+    Reads only complete lines from a file that is being written, stopping before a partial last line.
+    It can be read again once more has been written.
+    """
+
+    def next(self):
+        line = self.file.readline()
+        if not line:
+            raise StopIteration
+        if not line.endswith('\n'):
+            # the rest of the line is not written yet
+            self.file.seek(self.offset)
+            raise StopIteration
+        self.offset = self.file.tell()
+        return line
+
+
+def convert_csv_file(csv_file_path):
+    """
+    Read and convert all the rows of a csv file with WORKER_IMPORTER, in a worker process.
+    This does not touch the database.
+    :param csv_file_path: the path to the csv file
+    :return: list of the rows as updated dicts
+    """
+    WORKER_IMPORTER.open_csv(csv_file_path)
+    return WORKER_IMPORTER.load_to_list()
+
+
 def ordered_load(stream, Loader=Loader, object_pairs_hook=OrderedDict):
     """
     Create an ordered load function for yaml, to keep the dictionary keys in order.
@@ -169,7 +352,8 @@ class CsvImporter(object):
     """
 
     def __init__(self, yaml_file_path, csv_file_path, vehicle_name=None, flight_name=None, timezone_name='UTC',
-                 defaults=None, force=False, replace=False, skip_bad=False):
+                 defaults=None, force=False, replace=False, skip_bad=False, batch_size=None, checkpoint=False,
+                 native=False, cache=False, follow=False):
         """
         Initialize with a path to a configuration yaml file and a path to a csv file
         :param yaml_file_path: The path to the yaml self.configuration file for import
@@ -180,11 +364,32 @@ class CsvImporter(object):
         :param defaults: Optional additional defaults to add to objects
         :param force: force load even if data already exists
         :param replace: replace rows instead of creating new ones, matches based on timestamp.
+        Rows with no match are created.
         :param skip_bad: True to skip loading a row if it has bad/unparsable data
+        :param batch_size: number of rows per transaction for load_csv_in_batches
+        :param checkpoint: True to save the progress of load_csv_in_batches and continue from it if rerun
+        :param native: True for load_csv_in_batches to create rows with the database's bulk loader, see nativeLoader
+        :param cache: True to keep the converted rows in a binary cache in XGDS_CORE_IMPORT_CACHE_DIR, and read them
+        from it when the same file is imported again with the same yaml, see parsedCache
+        :param follow: True if the file will be imported with follow.  Following always checkpoints, so a restarted
+        follow continues after the rows it stored rather than stopping because they exist.
         :return: the imported items
         """
         self.csv_reader = None
         self.csv_file = None
+        self.csv_file_path = None
+        # see get_source_hash
+        self.source_hash = None
+        self.yaml_file_path = yaml_file_path
+        # reads the csv file when checkpointing, see LineReader
+        self.line_reader = None
+        # where reading starts, past the rows already imported when continuing from a checkpoint
+        self.start_offset = 0
+        self.use_checkpoint = checkpoint or follow
+        self.following = follow
+        self.checkpoint = None
+        self.native = native
+        self.cache = cache
         self.config = None
         self.vehicle = None
         self.flight = None
@@ -193,6 +398,11 @@ class CsvImporter(object):
         self.timezone = self.get_timezone(timezone_name)
         self.replace = replace
         self.skip_bad = skip_bad
+        self.batch_size = batch_size
+        # set by profile
+        self.profiler = None
+        # rows waiting for a position, see lookup_positions
+        self.deferred_rows = []
 
         # converters, from: to
         self.converters = {'radians': {'degrees': math.degrees},
@@ -215,6 +425,9 @@ class CsvImporter(object):
                 't' in self.config['delimiter']:
             self.config['delimiter'] = '\t'
 
+        # Time parsers by field name, see get_time
+        self.time_parsers = {}
+
         self.config['timefields'] = []
         for key, value in self.config['fields'].iteritems():
             if 'skip' not in value or not value['skip']:
@@ -228,6 +441,9 @@ class CsvImporter(object):
         if 'flight_required' not in self.config:
             self.config['flight_required'] = False
 
+        # Resolve the per-field conversions once rather than for every row
+        self.compile_plan(self.config)
+
     def get_timezone(self, timezone_name=None):
         """
         Builds a pytz timezone to use with times; we store times in utc
@@ -253,29 +469,35 @@ class CsvImporter(object):
 
         value = row[field_name]
         if not isinstance(value, datetime.datetime):
-            time_format = self.config['fields'][field_name]['format']
-            if time_format == 'iso8601':
-                # iso8601 format should include the timezone
-                the_time = dateparser(row[field_name])
-            elif time_format == 'unixtime_float_second':
-                # unix time is always UTC
-                the_time = datetime.datetime.utcfromtimestamp(float(row[field_name])).replace(tzinfo=pytz.utc)
-            elif time_format == 'unixtime_int_microsecond':
-                # unix time is always UTC and we should retain the fractional part
-                the_time = datetime.datetime.utcfromtimestamp(int(row[field_name]) / 1000000.).replace(tzinfo=pytz.utc)
-            else:
-                # TODO: Should we support general strptime() format strings?
-                raise Exception('Unsupported time format %s for row %s' % (time_format, field_name))
-        else:
-            the_time = value
+            return self.get_time_parser(field_name).parse(value)
+
+        the_time = value
         if not the_time.tzinfo or the_time.tzinfo.utcoffset(the_time) is None:
             the_time = self.timezone.localize(the_time)
         the_time = the_time.astimezone(pytz.utc)
 
         return the_time
 
-    def open_csv(self, csv_file_path):
-        """ Open the CSV file and return a tuple of the file, dictreader"""
+    def get_time_parser(self, field_name):
+        """
+        Get the parser for the time field, which detects and remembers the layout of its values.
+        The format is iso8601, unixtime_float_second, unixtime_int_microsecond or a strptime format string.
+        :param field_name: key for the time field
+        :return: the TimestampParser
+        """
+        parser = self.time_parsers.get(field_name)
+        if parser is None:
+            time_format = self.config['fields'][field_name]['format']
+            if not is_supported_format(time_format):
+                raise Exception('Unsupported time format %s for row %s' % (time_format, field_name))
+            parser = TimestampParser(time_format, self.timezone)
+            self.time_parsers[field_name] = parser
+        return parser
+
+    def open_csv(self, csv_file_path, follow=False):
+        """ Open the CSV file and return a tuple of the file, dictreader
+        :param follow: True to read only complete lines, and records, as the file grows, see follow
+        """
         delimiter = ','
         if 'delimiter' in self.config:
             delimiter = self.config['delimiter']
@@ -285,9 +507,21 @@ class CsvImporter(object):
             quotechar = self.config['quotechar']
 
         self.csv_file = open(csv_file_path, 'rbU')
+        self.csv_file_path = csv_file_path
+        self.source_hash = None
+        self.start_offset = 0
+        self.line_reader = None
+        lines = self.csv_file
+        if follow:
+            self.line_reader = FollowLineReader(self.csv_file)
+            lines = self.line_reader
+        elif self.use_checkpoint:
+            self.line_reader = LineReader(self.csv_file)
+            lines = self.line_reader
         try:
-            self.csv_reader = csv.DictReader(self.csv_file, fieldnames=self.config['fieldnames'], delimiter=delimiter,
-                                             quotechar=quotechar)
+            # strict, so that a record whose closing quote is not written yet is an error rather than a short row
+            self.csv_reader = csv.DictReader(lines, fieldnames=self.config['fieldnames'], delimiter=delimiter,
+                                             quotechar=quotechar, strict=follow)
         except Exception as e:
             self.csv_file.close()
             raise e
@@ -299,142 +533,154 @@ class CsvImporter(object):
             row.update(config['defaults'])
         return row
 
-    def delete_skip_fields(self, row, config=None):
-        if config is None:
-            config = self.config
-        for field_name in config['fields']:
-            field_config = config['fields'][field_name]
-            if 'skip' in field_config and field_config['skip']:
-                # delete entry from row dictionary
-                if field_name in row:
-                    del row[field_name]
-        return row
+    def compile_plan(self, config):
+        """
+        Build the conversion plan for a config: one converter per field which does its regex parsing,
+        type conversion, unit conversion and skip handling in a single step.  The plan is stored in config['plan'].
+        If you change config['fields'] after loading, call this again.
+        :param config: the config (or the config of a delimited field)
+        :return: the list of converters, each of which takes a row and updates it in place
+        """
+        plan = []
+        for field_name, field_config in config['fields'].iteritems():
+            plan.append(self.compile_field(field_name, field_config))
+        config['plan'] = plan
+        return plan
 
-    def parse_regex(self, row, config=None):
-        if config is None:
-            config = self.config
-        for field_name in config['fields']:
-            field_config = config['fields'][field_name]
-            if 'skip' in field_config and field_config['skip']:
-                continue
+    def compile_field(self, field_name, field_config):
+        """
+        Build the converter for one field.  Regexes are compiled and unit converters resolved here.
+        :param field_name: the name of the field
+        :param field_config: the config for the field
+        :return: a function that takes a row and updates the value for this field in place
+        """
+        # default to required true
+        required = 'required' not in field_config or field_config['required']
+        skip = 'skip' in field_config and field_config['skip']
+
+        if skip:
+            def convert(row):
+                if field_name not in row:
+                    if required:
+                        raise ValueError('Required value %s is missing in %s' % (field_name, str(row)))
+                    return
+                del row[field_name]
+            return convert
+
+        has_regex = 'regex' in field_config
+        search = None
+        if has_regex and field_config['regex']:
+            search = re.compile(field_config['regex']).search
+        convert_type = self.compile_type_converter(field_name, field_config, required)
+        convert_units = self.compile_units_converter(field_config)
+        if self.profiler:
+            if search:
+                search = self.profiler.timed(REGEX, search)
+            if convert_type:
+                convert_type = self.profiler.timed(TYPE, convert_type)
+            if convert_units:
+                convert_units = self.profiler.timed(UNITS, convert_units)
+
+        def convert(row):
             # Extract desired value using defined regex
-            if 'regex' in field_config:
-                regex_string = field_config['regex']
+            if has_regex:
                 cell = row[field_name]
-                match = False
-                if regex_string and cell:
-                    match = re.search(regex_string, cell)
-                    if match:
-                        row[field_name] = match.groups()[-1]
-                if not match:
-                    if 'required' not in field_config or field_config['required']:
+                match = None
+                if search and cell:
+                    match = search(cell)
+                if match:
+                    row[field_name] = match.groups()[-1]
+                else:
+                    if required:
                         raise ValueError('No match for regex %s' % field_config['regex'])
-                    else:
-                        del row[field_name]
-        return row
-
-    def convert_type(self, row, config=None):
-        if config is None:
-            config = self.config
-        for field_name in config['fields']:
-            field_config = config['fields'][field_name]
+                    del row[field_name]
+                    return
             if field_name not in row:
-                # default to required true
-                if 'required' in field_config and not field_config['required']:
-                    continue
-                else:
-                    error_string = 'Required value %s is missing in %s' % (field_name, str(row))
-                    raise ValueError(error_string)
-            if 'skip' in field_config and field_config['skip']:
-                continue
+                if required:
+                    raise ValueError('Required value %s is missing in %s' % (field_name, str(row)))
+                return
             # Independent of type, if the value is the string 'None' convert to a python None
             if row[field_name] == 'None':
                 row[field_name] = None
-                continue
-            # If the type is not specified, leave it alone
-            if 'type' not in field_config:
-                continue
-            elif field_config['type'] == 'string' or field_config['type'] == 'text':
-                continue
-            elif field_config['type'] == 'datetime' or \
-                    field_config['type'] == 'date' or \
-                    field_config['type'] == 'time':
-                try:
-                    row[field_name] = self.get_time(row, field_name)
-                except ValueError as e:
-                    if 'required' not in field_config or field_config['required']:
-                        raise e
-                    else:
-                        del row[field_name]
-            elif field_config['type'] == 'integer':
+                return
+            # Cast strings to the specified types
+            if convert_type:
+                convert_type(row)
+            # Convert between provided and desired units
+            if convert_units and row.get(field_name):
+                row[field_name] = convert_units(row[field_name])
+        return convert
+
+    def compile_type_converter(self, field_name, field_config, required=True):
+        """
+        Build the type conversion for one field
+        :param field_name: the name of the field
+        :param field_config: the config for the field
+        :param required: False to drop the value from the row instead of raising if it cannot be converted
+        :return: a function that takes a row and converts the value for this field in place, or None
+        """
+        if 'type' not in field_config:
+            return None
+        field_type = field_config['type']
+
+        def cast(fcn):
+            def convert(row):
                 try:
-                    row[field_name] = int(row[field_name])
+                    row[field_name] = fcn(row[field_name])
                 except ValueError as e:
-                    if 'required' not in field_config or field_config['required']:
+                    if required:
                         raise e
-                    else:
-                        del row[field_name]
-            elif field_config['type'] == 'float':
+                    del row[field_name]
+            return convert
+
+        if field_type == 'string' or field_type == 'text':
+            return None
+        elif field_type == 'datetime' or field_type == 'date' or field_type == 'time':
+            def convert(row):
                 try:
-                    row[field_name] = float(row[field_name])
+                    row[field_name] = self.get_time(row, field_name)
                 except ValueError as e:
-                    if 'required' not in field_config or field_config['required']:
+                    if required:
                         raise e
-                    else:
-                        del row[field_name]
-            elif field_config['type'] == 'boolean':
-                if row[field_name].lower() == 'true':
-                    row[field_name] = True
-                elif row[field_name].lower() == 'false':
-                    row[field_name] = False
-                else:
-                    try:
-                        row[field_name] = int(row['field_name'])
-                    except ValueError as e:
-                        if 'required' not in field_config or field_config['required']:
-                            raise e
-                        else:
-                            del row[field_name]
-            elif field_config['type'] == 'nullboolean':
-                if row[field_name].lower() == 'true':
-                    row[field_name] = True
-                elif row[field_name].lower() == 'false':
-                    row[field_name] = False
-                elif row[field_name].lower() == 'null' or row[field_name].lower() == 'none':
-                    row[field_name] = None
-                else:
-                    try:
-                        row[field_name] = int(row['field_name'])
-                    except ValueError as e:
-                        if 'required' not in field_config or field_config['required']:
-                            raise e
-                        else:
-                            del row[field_name]
-            elif field_config['type'] == 'key_value':
-                if row[field_name] is None:
-                    if 'required' not in field_config or field_config['required']:
-                        error_string = 'Key value pair not found in %s: %s' % (field_name, str(row))
-                        raise ValueError(error_string)
-                    else:
-                        del row[field_name]
+                    del row[field_name]
+            return convert
+        elif field_type == 'integer':
+            return cast(int)
+        elif field_type == 'float':
+            return cast(float)
+        elif field_type == 'boolean' or field_type == 'nullboolean':
+            values = {'true': True, 'false': False}
+            if field_type == 'nullboolean':
+                values.update({'null': None, 'none': None})
+
+            def to_boolean(value):
+                lower_value = value.lower()
+                if lower_value in values:
+                    return values[lower_value]
+                return int(value)
+            return cast(to_boolean)
+        elif field_type == 'key_value':
+            def convert(row):
                 # split the value into a dictionary
-                parts = row[field_name].split(':')
+                value = row[field_name]
+                parts = value.split(':') if value is not None else []
                 if len(parts) > 1:
                     row[field_name] = {parts[0]: ':'.join(parts[1:])}
                 else:
-                    if 'required' not in field_config or field_config['required']:
+                    if required:
                         error_string = 'Key value pair not found in %s: %s' % (field_name, str(row))
                         raise ValueError(error_string)
-                    else:
-                        del row[field_name]
-            elif field_config['type'] == 'delimited':
-                # This is for the case where for example the full row is tab delimited, and one entry
-                # is a comma separated list.
+                    del row[field_name]
+            return convert
+        elif field_type == 'delimited':
+            # This is for the case where for example the full row is tab delimited, and one entry
+            # is a comma separated list.
+            delimiter = field_config.get('delimiter')
+            self.compile_plan(field_config)
+
+            def convert(row):
                 try:
-                    if 'delimiter' in field_config:
-                        parts = row[field_name].split(field_config['delimiter'])
-                    else:
-                        parts = row[field_name].split()
+                    parts = row[field_name].split(delimiter)
                     partsdict = {k: v for k, v in zip(field_config['fields'], parts)}
                     # delete the formerly lumped together delimited string
                     del row[field_name]
@@ -443,41 +689,54 @@ class CsvImporter(object):
                     # merge the separated and labeled values into the row dict
                     row.update(partsdict)
                 except Exception as e:
-                    if 'required' not in field_config or field_config['required']:
+                    if required:
                         raise e
-                    else:
-                        del row[field_name]
-            else:
-                raise ValueError('%s is not a valid type identifier' % field_config['type'])
-        return row
+                    row.pop(field_name, None)
+            return convert
+        else:
+            def convert(row):
+                raise ValueError('%s is not a valid type identifier' % field_type)
+            return convert
 
-    def convert_units(self, row, config=None):
+    def compile_units_converter(self, field_config):
         """
-        For any values in the row that have different storage units from units, look for a converter and invoke it
-        Also removes any values that are marked skip
-        Also processes any regex
-        :param row: the row to process
-        :return: the row, or None if it had to be skipped
+        Look up the unit converter for one field
+        :param field_config: the config for the field
+        :return: a function converting a value from units to storage_units, or None if there is nothing to do
         """
-        if config is None:
-            config = self.config
-        for field_name in config['fields']:
-            if field_name not in row or not row[field_name]:
-                continue
-            field_config = config['fields'][field_name]
-            if 'skip' in field_config and field_config['skip']:
-                continue
-            # If storage units are different from provided units, convert values
-            if 'storage_units' in field_config and 'units' in field_config:
-                storage_units = field_config['storage_units']
-                units = field_config['units']
-                if units in self.converters:
-                    converters = self.converters[units]
-                    if storage_units in converters:
-                        fcn = locate(field_config['type'])
-                        new_value = converters[storage_units](fcn(row[field_name]))
-                        row[field_name] = new_value
-        return row
+        if 'storage_units' not in field_config or 'units' not in field_config:
+            return None
+        converters = self.converters.get(field_config['units'], {})
+        if field_config['storage_units'] not in converters:
+            return None
+        converter = converters[field_config['storage_units']]
+        fcn = locate(field_config['type'])
+        return lambda value: converter(fcn(value))
+
+    def profile(self, cprofile_path=None):
+        """
+        Time the stages of the import: reading, regex parsing, type conversion, unit conversion, position lookup
+        and database writes.  Call start and stop on the returned profiler around the load, then report.
+        With a CsvSetImporter, only the stages in this process are timed.
+        :param cprofile_path: if given, also dump cProfile stats to this path
+        :return: the ImportProfiler
+        """
+        if not self.profiler:
+            self.profiler = ImportProfiler(cprofile_path)
+            # the plan is compiled again with timed converters
+            self.compile_plan(self.config)
+            self.lookup_positions = self.profiler.timed(LOOKUP, self.lookup_positions)
+            self.retry_positions = self.profiler.timed(LOOKUP, self.retry_positions)
+        return self.profiler
+
+    def profile_stage(self, name):
+        """
+        :param name: the name of the stage, see importProfiler.STAGES
+        :return: a context timing the stage if we are profiling
+        """
+        if self.profiler:
+            return self.profiler.stage(name)
+        return NULL_STAGE
 
     def update_row(self, row, config=None):
         """
@@ -491,14 +750,11 @@ class CsvImporter(object):
             # Replace missing fields with default values
             # TODO: resolve what happens or should happen if a value and default are both given
             row = self.update_defaults(row, config)
-            # Parse any regexes
-            row = self.parse_regex(row, config)
-            # Cast strings to the specified types
-            row = self.convert_type(row, config)
-            # Convert between provided and desired units
-            row = self.convert_units(row, config)
-            # Delete fields marked skip=True
-            row = self.delete_skip_fields(row, config)
+            plan = config.get('plan')
+            if plan is None:
+                plan = self.compile_plan(config)
+            for convert in plan:
+                convert(row)
         return row
 
     def update_flight_end(self, end):
@@ -531,23 +787,389 @@ class CsvImporter(object):
 
         rows = self.load_to_list()
         try:
+            if self.config.get('lookup_position'):
+                # sets the positions in place, keeping the order of the rows
+                self.lookup_positions(rows)
+                self.retry_positions()
             for row in rows:
                 if not self.replace:
                     new_models.append(the_model(**row))
-            if row:
-                self.update_flight_end(row[self.config['timefield_default']])
+            with self.profile_stage(WRITE):
+                if row:
+                    self.update_flight_end(row[self.config['timefield_default']])
+                if not self.replace:
+                    the_model.objects.bulk_create(new_models)
+                else:
+                    with transaction.atomic():
+                        stats = self.update_stored_data(the_model, rows, create_missing=True)
             if not self.replace:
-                the_model.objects.bulk_create(new_models)
                 print 'created %d records' % len(new_models)
             else:
-                self.update_stored_data(the_model, rows)
-                print 'updated %d records' % len(new_models)
+                print REPLACE_STATS % stats
             self.handle_last_row(row)
+            time_field = self.config['timefield_default']
+            times = [r[time_field] for r in rows if r.get(time_field)]
+            self.save_fingerprint(min(times) if times else None, max(times) if times else None)
         except Exception as e:
             print e
 
         return new_models
 
+    def load_csv_in_batches(self, batch_size=None):
+        """
+        Load the CSV file according to the self.configuration, streaming the rows and storing them in the database
+        in batches.  Each batch is created in its own transaction, so memory use does not grow with the size of the
+        file and data is committed as we go.
+        When checkpointing, the progress is saved with each batch, and if a checkpoint of an earlier run of this
+        file exists the import continues from it.
+        Warning: the model's save method will not be called as we are using bulk_create.
+        :param batch_size: the number of rows per batch, defaults to self.batch_size
+        :return: the number of rows loaded
+        """
+        if not batch_size:
+            batch_size = self.batch_size or settings.XGDS_CORE_IMPORT_BATCH_SIZE
+        the_model = getModelByName(self.config['class'])
+        count = 0
+        row = None
+        stats = {'matched': 0, 'updated': 0, 'created': 0, 'missing': 0}
+        time_field = self.config['timefield_default']
+        times = []
+        start_count = 0
+        checkpoint = self.load_checkpoint()
+        if checkpoint:
+            self.start_offset = checkpoint.byte_offset
+            start_count = checkpoint.row_count
+            print 'continuing after row %d' % start_count
+        for rows in self.iter_batches(batch_size):
+            count += len(rows)
+            row = rows[-1]
+            batch_times = [r[time_field] for r in rows if r.get(time_field)]
+            if batch_times:
+                times = [min(times + [min(batch_times)]), max(times + [max(batch_times)])]
+            rows = self.lookup_positions(rows)
+            if self.checkpoint and self.deferred_rows:
+                # a checkpointed batch has to be complete when it is committed
+                self.retry_positions()
+            self.store_batch(the_model, rows, stats, start_count + count)
+        if self.deferred_rows:
+            self.update_positions(the_model)
+        if self.checkpoint:
+            self.checkpoint.completed = True
+            self.checkpoint.save()
+
+        if self.replace:
+            print REPLACE_STATS % stats
+        else:
+            print 'created %d records' % count
+        if row:
+            self.handle_last_row(row)
+        start_time = times[0] if times else None
+        first_time = self.get_start_time() if checkpoint else None
+        if first_time and (start_time is None or first_time < start_time):
+            # a continued import only saw the rest of the file
+            start_time = first_time
+        self.save_fingerprint(start_time, times[-1] if times else None)
+        return count
+
+    def store_batch(self, the_model, rows, stats, row_count=None):
+        """
+        Create (or update, if replacing) a batch of rows in one transaction, and extend the flight to cover them
+        :param the_model: the model we are working with
+        :param rows: the cleaned up rows
+        :param stats: dictionary of counts to add the update_stored_data counts to
+        :param row_count: when checkpointing, the number of rows read up to the end of this batch
+        :return:
+        """
+        if not rows:
+            return
+        time_field = self.config['timefield_default']
+        times = [r[time_field] for r in rows if r.get(time_field)]
+        with self.profile_stage(WRITE):
+            with transaction.atomic():
+                if self.replace:
+                    for key, value in self.update_stored_data(the_model, rows, create_missing=True).iteritems():
+                        stats[key] += value
+                elif self.native:
+                    native_load(the_model, rows)
+                else:
+                    the_model.objects.bulk_create([the_model(**r) for r in rows])
+                if self.checkpoint and row_count is not None:
+                    self.save_checkpoint(row_count, max(times) if times else None)
+
+            # keep the flight times up to date with what has been committed
+            if times:
+                self.update_flight_start(min(times))
+                self.update_flight_end(max(times))
+
+    def load_checkpoint(self):
+        """
+        Get the checkpoint for importing this file with this config, when checkpointing.
+        The checkpoint of an earlier run is only kept if it did not complete and the file still has the same bytes
+        up to where it stopped; otherwise it starts over.
+        :return: the checkpoint if there are rows to continue after, or None
+        """
+        if not self.use_checkpoint or not self.csv_file_path:
+            return None
+        if self.checkpoint is None:
+            self.checkpoint, created = IMPORT_CHECKPOINT_MODEL.get().objects.get_or_create(
+                filename=os.path.abspath(self.csv_file_path), config=os.path.abspath(self.yaml_file_path))
+            checkpoint = self.checkpoint
+            if not created and checkpoint.byte_offset:
+                length = min(checkpoint.byte_offset, FINGERPRINT_BYTES)
+                if checkpoint.completed or os.path.getsize(self.csv_file_path) < checkpoint.byte_offset or \
+                        checkpoint.fingerprint != get_file_fingerprint(self.csv_file_path, length):
+                    checkpoint.byte_offset = 0
+                    checkpoint.row_count = 0
+                    checkpoint.last_timestamp = None
+                    checkpoint.completed = False
+                    checkpoint.save()
+        if self.checkpoint.byte_offset:
+            return self.checkpoint
+        return None
+
+    def save_checkpoint(self, row_count, last_timestamp=None):
+        """
+        Save how far the import got; call this in the transaction of the batch
+        :param row_count: the number of rows read
+        :param last_timestamp: the latest time in the batch
+        """
+        checkpoint = self.checkpoint
+        if checkpoint.byte_offset < FINGERPRINT_BYTES:
+            checkpoint.fingerprint = get_file_fingerprint(self.csv_file_path,
+                                                          min(self.line_reader.offset, FINGERPRINT_BYTES))
+        checkpoint.byte_offset = self.line_reader.offset
+        checkpoint.row_count = row_count
+        if last_timestamp:
+            checkpoint.last_timestamp = last_timestamp
+        checkpoint.save()
+
+    def get_track(self):
+        """
+        :return: the track of the flight, or None
+        """
+        try:
+            if self.flight:
+                return self.flight.track
+        except ObjectDoesNotExist:
+            pass
+        return None
+
+    def lookup_positions(self, rows):
+        """
+        If the config has lookup_position, set the position id of each row from the flight's track, or any track
+        without a flight, with one query.
+        Rows whose positions have not been stored yet are remembered in self.deferred_rows, see retry_positions.
+        :param rows: the cleaned up rows
+        :return: the rows, in order
+        """
+        if not self.config.get('lookup_position'):
+            return rows
+        self.deferred_rows.extend(lookup_positions(rows, self.get_track(), self.config['timefield_default'],
+                                                   self.config.get('position_id_key', 'position_id'),
+                                                   self.config.get('position_found_key')))
+        return rows
+
+    def retry_positions(self):
+        """
+        Look up the positions of the deferred rows again, all together, waiting POSITION_LOOKUP_DELAY before each
+        of the position_retries tries.  The positions are set in the rows.
+        :return: the deferred rows whose positions were found
+        """
+        rows = self.deferred_rows
+        self.deferred_rows = []
+        missing = rows
+        tries = 0
+        while missing and tries < self.config.get('position_retries', 1):
+            time.sleep(POSITION_LOOKUP_DELAY)
+            missing = lookup_positions(missing, self.get_track(), self.config['timefield_default'],
+                                       self.config.get('position_id_key', 'position_id'),
+                                       self.config.get('position_found_key'))
+            tries += 1
+        missing_ids = set(id(r) for r in missing)
+        return [r for r in rows if id(r) not in missing_ids]
+
+    def update_positions(self, the_model):
+        """
+        Retry the deferred rows after they have been stored, and update the stored rows whose positions were found.
+        The stored rows are matched on time, as when replacing.
+        :param the_model: the model we are working with
+        :return:
+        """
+        found = self.retry_positions()
+        if not found:
+            return
+        keys = [self.config['timefield_default'], self.config.get('position_id_key', 'position_id')]
+        if self.config.get('position_found_key'):
+            keys.append(self.config['position_found_key'])
+        with self.profile_stage(WRITE):
+            with transaction.atomic():
+                self.update_stored_data(the_model, [dict((key, row[key]) for key in keys) for row in found])
+
+    def follow(self, batch_size=None, poll_seconds=FOLLOW_POLL_SECONDS, idle_seconds=None):
+        """
+        Import rows as they are appended to the file, like tail -f.  Only complete lines are read; whatever has been
+        written is stored as soon as it is read, in batches of at most batch_size rows, and the flight end moves
+        along with it.  If the file is rotated, ie replaced with a new file or truncated, the new file is followed
+        from its start.  When checkpointing, as an importer made with follow=True always does, a restarted follow
+        continues after the last stored row.
+        :param batch_size: the maximum number of rows per batch, defaults to self.batch_size
+        :param poll_seconds: how long to wait when there is nothing new
+        :param idle_seconds: stop once nothing new has been written for this long, or None to follow forever
+        :return: the number of rows loaded
+        """
+        if not batch_size:
+            batch_size = self.batch_size or settings.XGDS_CORE_IMPORT_BATCH_SIZE
+        the_model = getModelByName(self.config['class'])
+        count = 0
+        row = None
+        stats = {'matched': 0, 'updated': 0, 'created': 0, 'missing': 0}
+
+        # rows read from the current file, for the checkpoint
+        file_count = 0
+        self.csv_file.close()
+        self.open_csv(self.csv_file_path, follow=True)
+        checkpoint = self.load_checkpoint()
+        if checkpoint:
+            self.line_reader.seek(checkpoint.byte_offset)
+            file_count = checkpoint.row_count
+            print 'continuing after row %d' % file_count
+
+        idle = 0
+        while True:
+            rows = self.read_new_rows(batch_size)
+            if rows:
+                idle = 0
+                count += len(rows)
+                file_count += len(rows)
+                row = rows[-1]
+                rows = self.lookup_positions(rows)
+                if self.deferred_rows:
+                    self.retry_positions()
+                self.store_batch(the_model, rows, stats, file_count)
+                continue
+
+            if self.is_rotated():
+                print 'following new %s' % self.csv_file_path
+                self.csv_file.close()
+                self.open_csv(self.csv_file_path, follow=True)
+                file_count = 0
+                if self.checkpoint:
+                    self.checkpoint.byte_offset = 0
+                    self.checkpoint.row_count = 0
+                    self.checkpoint.save()
+                continue
+
+            if idle_seconds is not None and idle >= idle_seconds:
+                break
+            time.sleep(poll_seconds)
+            idle += poll_seconds
+
+        self.csv_file.close()
+        if self.replace:
+            print REPLACE_STATS % stats
+        else:
+            print 'created %d records' % count
+        if row:
+            self.handle_last_row(row)
+        return count
+
+    def read_new_rows(self, batch_size):
+        """
+        Read and convert the complete records written since the last read, see follow
+        :param batch_size: the maximum number of rows to read
+        :return: list of rows as updated dicts
+        """
+        rows = []
+        while len(rows) < batch_size:
+            offset = self.line_reader.offset
+            try:
+                with self.profile_stage(READ):
+                    raw_row = next(self.csv_reader)
+            except StopIteration:
+                break
+            except csv.Error:
+                # a quoted value goes on past what has been written; read the record again later
+                self.line_reader.seek(offset)
+                break
+            rows.append(self.update_row(raw_row))
+        return rows
+
+    def is_rotated(self):
+        """
+        :return: True if the file at our path has been replaced, or truncated to before where we are reading
+        """
+        try:
+            stat = os.stat(self.csv_file_path)
+        except OSError:
+            # moved away and not created again yet
+            return False
+        if stat.st_ino != os.fstat(self.csv_file.fileno()).st_ino:
+            return True
+        return stat.st_size < self.line_reader.offset
+
+    def iter_batches(self, batch_size):
+        """
+        Read the rows of the CSV file in lists, from the parsed cache if we are caching
+        :param batch_size: the maximum number of rows in each list
+        :return: a generator of lists of rows as updated dicts
+        """
+        if self.cache and not self.start_offset and self.csv_file_path:
+            return self.iter_cached_batches(batch_size)
+        return self.convert_batches(batch_size)
+
+    def iter_cached_batches(self, batch_size):
+        """
+        Read the rows from the parsed cache of this file and yaml if there is one, skipping the text parsing.
+        Otherwise convert the CSV file, and write the cache once all of it has been read.
+        :param batch_size: the maximum number of rows in each list
+        :return: a generator of lists of rows as updated dicts
+        """
+        from xgds_core.importer import parsedCache
+
+        # defaults which are not fields are the same in every row, and may change from one import to the next
+        fields = self.config['fields']
+        defaults = {k: v for k, v in self.config['defaults'].iteritems() if k not in fields}
+        key = parsedCache.get_cache_key(self.get_source_hash(), get_content_hash(self.yaml_file_path),
+                                        self.timezone.zone,
+                                        repr(sorted((k, v) for k, v in self.config['defaults'].iteritems()
+                                                    if k in fields)))
+        cache_dir = settings.XGDS_CORE_IMPORT_CACHE_DIR
+        cache_path = parsedCache.get_cache_path(self.csv_file_path, key, cache_dir)
+        if os.path.exists(cache_path):
+            with self.profile_stage(READ):
+                records = parsedCache.read_cache(cache_path)
+                batches = parsedCache.iter_cached_batches(records, batch_size, defaults)
+            while True:
+                with self.profile_stage(READ):
+                    rows = next(batches, None)
+                if rows is None:
+                    break
+                yield rows
+            self.csv_file.close()
+            return
+
+        writer = parsedCache.CacheWriter(self.csv_file_path, key, defaults.keys(), cache_dir)
+        for rows in self.convert_batches(batch_size):
+            # before the rows are handed on and changed, ie by lookup_positions
+            writer.add(rows)
+            yield rows
+        writer.write()
+
+    def convert_batches(self, batch_size):
+        """
+        Read the CSV file one row at a time, grouping the updated rows into lists
+        :param batch_size: the maximum number of rows in each list
+        :return: a generator of lists of rows as updated dicts
+        """
+        batch = []
+        for row in self:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
     def __iter__(self):
         self.reset_csv()
         return self
@@ -558,7 +1180,8 @@ class CsvImporter(object):
         :return: the next entry as an updated dict
         """
         try:
-            row = next(self.csv_reader)
+            with self.profile_stage(READ):
+                row = next(self.csv_reader)
             row = self.update_row(row)
             return row
         except StopIteration:
@@ -570,29 +1193,77 @@ class CsvImporter(object):
         Load the CSV file according to the self.configuration, and store the values in a list of dicts
         :return: a list containing the rows as updated dicts, which may be an empty list
         """
+        if self.cache:
+            batch_size = self.batch_size or settings.XGDS_CORE_IMPORT_BATCH_SIZE
+            return [r for rows in self.iter_batches(batch_size) for r in rows]
         rows = [r for r in iter(self)]
         return rows
 
-    def update_stored_data(self, the_model, rows):
+    def update_stored_data(self, the_model, rows, create_missing=False):
         """
-        # search for matching data based on each row, and update it.
+        Search for stored data matching each row based on time (and flight), and update it.
+        The stored data for the time range of the rows is loaded in one query and compared in memory,
+        then only the values that changed are written with bulk_update, and the new rows with bulk_create.
+        Warning: the model's save method will not be called and no pre_save or post_save signals are sent.
         :param the_model: the model we are working with
         :param rows: the cleaned up rows we are working with
-        :return:
+        :param create_missing: create the rows which match no stored data, instead of counting them as missing
+        :return: dictionary with the number of rows matched, updated, created and missing
         """
+        stats = {'matched': 0, 'updated': 0, 'created': 0, 'missing': 0}
+        time_field = self.config['timefield_default']
+        times = [row[time_field] for row in rows if row.get(time_field)]
+        if not times:
+            stats['missing'] = len(rows)
+            return stats
+
+        # only concrete fields can be stored; the time matches by definition
+        fields = {}
+        for field in the_model._meta.concrete_fields:
+            if not field.primary_key and field.name != time_field:
+                fields[field.name] = field
+                fields[field.attname] = field
+
+        filter_dict = {time_field + '__range': (min(times), max(times))}
+        if self.flight:
+            filter_dict['flight'] = self.flight
+        attnames = set(field.attname for field in fields.itervalues())
+        stored_rows = {}
+        for stored in the_model.objects.filter(**filter_dict).values('pk', time_field, *attnames):
+            stored_rows.setdefault(stored[time_field], []).append(stored)
+
+        changes = {}
+        new_models = []
         for row in rows:
-            filter_dict = {self.config['timefield_default']: row[self.config['timefield_default']]}
-            if self.flight:
-                filter_dict['flight'] = self.flight
-            found = the_model.objects.filter(**filter_dict)
-            if found.count() != 1:
-                print "ERROR: DID NOT FIND MATCH FOR %s" % str(row[self.config['timefield_default']])
-            else:
-                item = found[0]
-                for key, value in row.iteritems():
-                    setattr(item, key, value)
-                print 'UPDATED: %s ' % str(item)
-                item.save()
+            found = stored_rows.get(row.get(time_field), [])
+            if not found and create_missing and row.get(time_field):
+                new_models.append(the_model(**row))
+                stats['created'] += 1
+                continue
+            if len(found) != 1:
+                print "ERROR: DID NOT FIND MATCH FOR %s" % str(row.get(time_field))
+                stats['missing'] += 1
+                continue
+            stats['matched'] += 1
+            stored = found[0]
+            changed = False
+            for key, value in row.iteritems():
+                field = fields.get(key)
+                if not field:
+                    continue
+                if key != field.attname:
+                    # a related object, we store its key
+                    value = getattr(value, 'pk', value)
+                if stored[field.attname] != value:
+                    changes.setdefault(field, {})[stored['pk']] = value
+                    changed = True
+            if changed:
+                stats['updated'] += 1
+
+        bulk_update(the_model, changes)
+        if new_models:
+            the_model.objects.bulk_create(new_models)
+        return stats
 
     def handle_last_row(self, row):
         """
@@ -615,13 +1286,62 @@ class CsvImporter(object):
             return result.exists()
         return False
 
+    def get_source_hash(self):
+        """
+        :return: the content hash of the csv file, computed once
+        """
+        if self.source_hash is None and self.csv_file_path:
+            self.source_hash = get_content_hash(self.csv_file_path)
+        return self.source_hash
+
+    def check_fingerprint_exists(self):
+        """
+        See if this file, under any name, has already been imported into our model; one indexed lookup
+        :return: True if it has been imported
+        """
+        if not self.csv_file_path:
+            return False
+        return FINGERPRINT_MODEL.get().objects.filter(content_hash=self.get_source_hash(),
+                                                      data_class=self.config['class']).exists()
+
+    def save_fingerprint(self, start_time, end_time, csv_file_path=None):
+        """
+        Record that this file has been imported into our model, with the time range of its data
+        :param start_time: the earliest time in the data
+        :param end_time: the latest time in the data
+        :param csv_file_path: the file that was imported, defaults to our csv file
+        :return: the fingerprint
+        """
+        if not csv_file_path or csv_file_path == self.csv_file_path:
+            csv_file_path = self.csv_file_path
+            if not csv_file_path:
+                return None
+            content_hash = self.get_source_hash()
+        else:
+            content_hash = get_content_hash(csv_file_path)
+        fingerprint_model = FINGERPRINT_MODEL.get()
+        try:
+            with transaction.atomic():
+                fingerprint, created = fingerprint_model.objects.get_or_create(
+                    content_hash=content_hash, data_class=self.config['class'],
+                    defaults={'size': os.path.getsize(csv_file_path),
+                              'filename': os.path.abspath(csv_file_path),
+                              'start_time': start_time,
+                              'end_time': end_time})
+        except IntegrityError:
+            # another import of the same content saved it first
+            fingerprint = fingerprint_model.objects.get(content_hash=content_hash, data_class=self.config['class'])
+        return fingerprint
+
     def reset_csv(self):
         """
-        Reset the CSV file for reading from the beginning
+        Reset the CSV file for reading from the beginning, or from the checkpoint we are continuing after
         :return:
         """
-        if self.csv_file:
-            self.csv_file.seek(0)
+        if self.line_reader:
+            self.line_reader.seek(self.start_offset)
+        elif self.csv_file:
+            self.csv_file.seek(self.start_offset)
 
     def get_first_row(self):
         """
@@ -632,15 +1352,85 @@ class CsvImporter(object):
             return None
 
         if not self.first_row:
-            the_list = list(self.csv_reader)
-            if the_list:
-                self.first_row = the_list[0]
-                self.reset_csv()
+            rows = self.get_sample_rows(1)
+            if rows:
+                self.first_row = rows[0]
             else:
                 return None
 
         return self.first_row
 
+    def get_sample_rows(self, count=SAMPLE_ROWS):
+        """
+        Read the first rows of the csv, without converting them, and go back to the start
+        :param count: the maximum number of rows to read
+        :return: list of the rows
+        """
+        if not self.csv_reader:
+            return []
+        self.reset_csv()
+        rows = list(islice(self.csv_reader, count))
+        self.reset_csv()
+        return rows
+
+    def get_last_row(self, tail_bytes=TAIL_BYTES):
+        """
+        Get the last row of the csv by reading only the end of the file, and go back to the start.
+        If the end of the file has quoted values, the whole file is read instead.
+        :param tail_bytes: how much of the end of the file to read first; doubled until a whole row is found
+        :return: the last row, not converted, or None
+        """
+        if not self.csv_reader:
+            return None
+        dialect = self.csv_reader.reader.dialect
+        self.csv_file.seek(0, os.SEEK_END)
+        size = self.csv_file.tell()
+        rows = []
+        while not rows:
+            start = max(0, size - tail_bytes)
+            self.csv_file.seek(start)
+            tail = self.csv_file.read()
+            if start > 0 and dialect.quotechar and dialect.quotechar in tail:
+                # a quoted value may hold line breaks, so a line of the tail may not be the start of a row;
+                # only reading from the start of the file finds the boundaries
+                self.csv_file.seek(0)
+                rows = deque(csv.DictReader(self.csv_file, fieldnames=self.config['fieldnames'], dialect=dialect),
+                             maxlen=1)
+                break
+            # the line breaks are kept, as they are part of any quoted values
+            lines = tail.splitlines(True)
+            if start > 0:
+                # the first line may be partial
+                lines = lines[1:]
+            rows = list(csv.DictReader(lines, fieldnames=self.config['fieldnames'], dialect=dialect))
+            if start == 0:
+                break
+            tail_bytes *= 2
+        self.reset_csv()
+        if rows:
+            return rows[-1]
+        return None
+
+    def get_time_span(self):
+        """
+        Get the times of the data from the sampled first rows and the last row, without reading the whole file
+        :return: tuple of the earliest and latest times, or (None, None)
+        """
+        rows = self.get_sample_rows()
+        last_row = self.get_last_row()
+        if last_row:
+            rows.append(last_row)
+        times = []
+        for row in rows:
+            try:
+                times.append(self.get_time(row))
+            except Exception:
+                # for example a header row
+                pass
+        if not times:
+            return None, None
+        return min(times), max(times)
+
     def get_start_time(self):
         """
         Get the start time of this data, as a datetime
@@ -664,6 +1454,8 @@ class CsvImporter(object):
         :param force: force load even if we already have existing data
         :return: the self.config, which will contain the vehicle, flight, csv_file and csv_reader
         """
+        # flights may have changed since the last import in this process, which may be a warm worker
+        FLIGHT_INTERVAL_INDEX.invalidate()
         self.vehicle = lookup_vehicle(vehicle_name)
         self.flight = lookup_flight(flight_name)
 
@@ -678,8 +1470,10 @@ class CsvImporter(object):
         if csv_file_path is not None:
             self.open_csv(csv_file_path)
             first_row = self.get_first_row()
-        if not force and not self.replace and first_row:
-            exists = self.check_data_exists(first_row)
+        if not force and not self.replace and not self.following and first_row and not self.load_checkpoint():
+            exists = self.check_fingerprint_exists()
+            if not exists and settings.XGDS_CORE_IMPORT_CHECK_FIRST_ROW:
+                exists = self.check_data_exists(first_row)
             if exists:
                 print " ABORTING: MATCHING DATA FOUND"
                 # TODO for subsea we will have new rows in existing files so we have to check each row
@@ -687,7 +1481,7 @@ class CsvImporter(object):
                 raise Exception('Matching data found, data already imported', first_row)
         if not self.flight and self.config['flight_required']:
             # read the first timestamp and find a flight for it
-            self.flight = getFlight(self.get_start_time(), self.vehicle)
+            self.flight = get_flights([self.get_start_time()], self.vehicle)[0]
             if self.flight:
                 self.config['defaults']['flight_id'] = self.flight.id
             else:
@@ -700,19 +1494,11 @@ class CsvImporter(object):
         return self.config
 
     def get_flight_any_row(self):
-        """ Loop through any and all rows and look for a matching flight
+        """ Look for a flight matching the time span of the file, from samples of its rows
         You must already have opened the csv_reader
         """
-        flight = None
-        if self.csv_reader:
-            for row in self.csv_reader:
-                row_time = self.get_time(row)
-                if row_time:
-                    flight = getFlight(row_time, self.vehicle)
-                    if flight:
-                        break
-            self.reset_csv()
-        return flight
+        start_time, end_time = self.get_time_span()
+        return get_flight_for_time_span(start_time, end_time, self.vehicle)
 
 
 class CsvSetImporter:
@@ -725,7 +1511,7 @@ class CsvSetImporter:
     """
 
     def __init__(self, yaml_file_path, csv_file_list, vehicle_name=None, flight_name=None, timezone_name='UTC',
-                 defaults=None, force=False, replace=False, skip_bad=False):
+                 defaults=None, force=False, replace=False, skip_bad=False, batch_size=None):
         """
         Initialize with a path to a configuration yaml file and a list of csv files
         :param yaml_file_path: The path to the yaml self.configuration file for import
@@ -736,7 +1522,9 @@ class CsvSetImporter:
         :param defaults: Optional additional defaults to add to objects
         :param force: force load even if data already exists
         :param replace: replace rows instead of creating new ones, matches based on timestamp.
+        Rows with no match are created.
         :param skip_bad: True to skip loading a row if it has bad/unparsable data
+        :param batch_size: number of rows per transaction for load_csv_in_batches
         :return: the imported items
         """
 
@@ -746,7 +1534,8 @@ class CsvSetImporter:
         # Initialize csv importer and load the first file
         self.csv_importer = CsvImporter(yaml_file_path, csv_file_list[0],
                                         vehicle_name=vehicle_name, flight_name=flight_name, timezone_name=timezone_name,
-                                        defaults=defaults, force=force, replace=replace, skip_bad=skip_bad)
+                                        defaults=defaults, force=force, replace=replace, skip_bad=skip_bad,
+                                        batch_size=batch_size)
         self.open_next_csv_file()
 
     def open_next_csv_file(self):
@@ -768,3 +1557,87 @@ class CsvSetImporter:
             self.open_next_csv_file()
             val = next(self.csv_importer)
             return val
+
+    def load_csv_in_batches(self, batch_size=None, processes=None):
+        """
+        Load all of the files, committing batches of rows in the order of the files.
+        Worker processes read and convert the files concurrently while this process, the only one that writes
+        to the database, stores their rows one file after another.
+        Each file gets its own fingerprint once its rows are stored.
+        Warning: the model's save method will not be called as we are using bulk_create.
+        :param batch_size: the number of rows per batch, defaults to the batch_size of the csv importer
+        :param processes: the number of worker processes, defaults to XGDS_CORE_IMPORT_PROCESSES or the cpu count.
+        1 converts the files in this process.
+        :return: the number of rows loaded
+        """
+        importer = self.csv_importer
+        if not batch_size:
+            batch_size = importer.batch_size or settings.XGDS_CORE_IMPORT_BATCH_SIZE
+        if not processes:
+            processes = settings.XGDS_CORE_IMPORT_PROCESSES or multiprocessing.cpu_count()
+        processes = min(processes, len(self.files))
+
+        the_model = getModelByName(importer.config['class'])
+        count = 0
+        row = None
+        stats = {'matched': 0, 'updated': 0, 'created': 0, 'missing': 0}
+        time_field = importer.config['timefield_default']
+        fingerprints = []
+        for csv_file_path, rows in izip(self.files, self.iter_converted_files(processes)):
+            for start in xrange(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                importer.store_batch(the_model, importer.lookup_positions(batch), stats)
+            if rows:
+                count += len(rows)
+                row = rows[-1]
+            times = [r[time_field] for r in rows if r.get(time_field)]
+            fingerprints.append((csv_file_path, min(times) if times else None, max(times) if times else None))
+        if importer.deferred_rows:
+            importer.update_positions(the_model)
+        for csv_file_path, start_time, end_time in fingerprints:
+            importer.save_fingerprint(start_time, end_time, csv_file_path)
+
+        if importer.replace:
+            print REPLACE_STATS % stats
+        else:
+            print 'created %d records' % count
+        if row:
+            importer.handle_last_row(row)
+        return count
+
+    def iter_converted_files(self, processes):
+        """
+        Convert the files, in worker processes if there is more than one.
+        Only a few files per process are converted ahead of the one being stored, to bound memory.
+        :param processes: the number of worker processes
+        :return: a generator of the list of converted rows of each file, in the order of the files
+        """
+        if processes <= 1:
+            for csv_file_path in self.files:
+                self.csv_importer.open_csv(csv_file_path)
+                yield self.csv_importer.load_to_list()
+            return
+
+        global WORKER_IMPORTER
+        WORKER_IMPORTER = self.csv_importer
+        # the workers must not share our database connection
+        connection.close()
+        pool = multiprocessing.Pool(processes)
+        try:
+            pending = deque()
+            files = iter(self.files)
+            for csv_file_path in files:
+                pending.append(pool.apply_async(convert_csv_file, (csv_file_path,)))
+                if len(pending) >= processes * 2:
+                    break
+            while pending:
+                rows = pending.popleft().get()
+                for csv_file_path in files:
+                    pending.append(pool.apply_async(convert_csv_file, (csv_file_path,)))
+                    break
+                yield rows
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            WORKER_IMPORTER = None
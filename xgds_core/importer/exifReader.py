@@ -0,0 +1,194 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+Reads the time an image was taken from its EXIF, see get_exif_timestamp.
+Only the segment headers of a JPEG are read until the EXIF segment, and only the IFD entries leading to
+DateTimeOriginal and SubSecTimeOriginal are parsed, so the image is not decoded.  PIL is used for images this
+cannot read.
+"""
+
+import datetime
+import struct
+
+import pytz
+from dateutil.parser import parse as dateparser
+
+# The start of the APP1 segment holding the EXIF
+EXIF_HEADER = 'Exif\0\0'
+JPEG_START = '\xff\xd8'
+TIFF_STARTS = ('II*\0', 'MM\0*')
+
+# JPEG markers
+APP1 = 0xe1
+START_OF_SCAN = 0xda
+END_OF_IMAGE = 0xd9
+
+# EXIF tags
+EXIF_IFD_POINTER = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+SUBSEC_TIME_ORIGINAL = 0x9291
+
+# IFD entry type of strings
+ASCII = 2
+
+# How far into a file to look for the EXIF; cameras write it first
+MAX_HEADER_BYTES = 128 * 1024
+
+
+def find_tiff(fp):
+    """
+    Find the TIFF structure holding the EXIF, in the APP1 segment of a JPEG or at the start of a TIFF based file
+    :param fp: the file, open in binary mode
+    :return: the TIFF data, or None if it was not found
+    """
+    start = fp.read(4)
+    if start in TIFF_STARTS:
+        fp.seek(0)
+        return fp.read(MAX_HEADER_BYTES)
+    if not start.startswith(JPEG_START):
+        return None
+
+    offset = len(JPEG_START)
+    while offset < MAX_HEADER_BYTES:
+        fp.seek(offset)
+        marker = fp.read(4)
+        if len(marker) < 4 or marker[0] != '\xff':
+            return None
+        code = ord(marker[1])
+        if code == 0xff:
+            # fill byte
+            offset += 1
+            continue
+        if code in (START_OF_SCAN, END_OF_IMAGE):
+            # the image data, there is no EXIF
+            return None
+        if 0xd0 <= code <= 0xd7 or code == 0x01:
+            # markers without a length
+            offset += 2
+            continue
+        length = struct.unpack('>H', marker[2:])[0]
+        if code == APP1:
+            data = fp.read(length - 2)
+            if data.startswith(EXIF_HEADER):
+                return data[len(EXIF_HEADER):]
+        offset += 2 + length
+    return None
+
+
+def read_ifd(tiff, endian, offset):
+    """
+    :param tiff: the TIFF data
+    :param endian: the struct byte order of the TIFF data
+    :param offset: the offset of the IFD in the TIFF data
+    :return: dictionary of tag to (type, count, raw value or offset)
+    """
+    count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+    entries = {}
+    for index in xrange(count):
+        tag, value_type, value_count = struct.unpack_from(endian + 'HHI', tiff, offset + 2 + index * 12)
+        start = offset + 2 + index * 12 + 8
+        entries[tag] = (value_type, value_count, tiff[start:start + 4])
+    return entries
+
+
+def get_string(tiff, endian, entry):
+    """
+    :param tiff: the TIFF data
+    :param endian: the struct byte order of the TIFF data
+    :param entry: an IFD entry, see read_ifd
+    :return: the string value of the entry, or None if it is not a string
+    """
+    value_type, count, value = entry
+    if value_type != ASCII:
+        return None
+    if count > 4:
+        start = struct.unpack(endian + 'I', value)[0]
+        value = tiff[start:start + count]
+        if len(value) < count:
+            raise ValueError('string beyond the data read')
+    return value[:count].split('\0', 1)[0].strip()
+
+
+def read_exif_times(filename):
+    """
+    Read DateTimeOriginal and SubSecTimeOriginal from the EXIF of an image, without PIL
+    :param filename: the image file
+    :return: tuple of the strings, with None for a missing SubSecTimeOriginal, or None if there is no EXIF which
+    can be read this way
+    """
+    with open(filename, 'rb') as fp:
+        tiff = find_tiff(fp)
+    if not tiff or tiff[:4] not in TIFF_STARTS:
+        return None
+    endian = '<' if tiff.startswith('II') else '>'
+    try:
+        ifd0 = read_ifd(tiff, endian, struct.unpack_from(endian + 'I', tiff, 4)[0])
+        if EXIF_IFD_POINTER not in ifd0:
+            return None
+        exif_offset = struct.unpack(endian + 'I', ifd0[EXIF_IFD_POINTER][2])[0]
+        exif = read_ifd(tiff, endian, exif_offset)
+        if DATE_TIME_ORIGINAL not in exif:
+            return None
+        date_time = get_string(tiff, endian, exif[DATE_TIME_ORIGINAL])
+        subsec = None
+        if SUBSEC_TIME_ORIGINAL in exif:
+            subsec = get_string(tiff, endian, exif[SUBSEC_TIME_ORIGINAL])
+    except (struct.error, ValueError):
+        return None
+    if not date_time:
+        return None
+    return date_time, subsec
+
+
+def read_exif_times_with_pil(filename):
+    """
+    Read DateTimeOriginal and SubSecTimeOriginal from the EXIF of an image with PIL
+    :param filename: the image file
+    :return: tuple of the strings, with None for a missing SubSecTimeOriginal
+    """
+    import PIL.Image
+
+    exif = PIL.Image.open(filename)._getexif() or {}
+    return exif[DATE_TIME_ORIGINAL], exif.get(SUBSEC_TIME_ORIGINAL)
+
+
+def parse_exif_time(date_time, subsec=None):
+    """
+    Note there is no timezone info standard defined for EXIF, although there is a standard for GPS time in
+    GPSInfo, but our robot is in a cave so none of the cameras will have GPSInfo.  The time is taken to be utc.
+    :param date_time: DateTimeOriginal, ie 2019:01:01 01:02:03
+    :param subsec: SubSecTimeOriginal, the digits of the fraction of a second, or None
+    :return: the utc time
+    """
+    try:
+        timestamp = datetime.datetime.strptime(date_time, '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        timestamp = dateparser(date_time)
+    if subsec and subsec.isdigit():
+        timestamp = timestamp.replace(microsecond=int(subsec[:6].ljust(6, '0')))
+    return timestamp.replace(tzinfo=pytz.utc)
+
+
+def get_exif_timestamp(filename):
+    """
+    :param filename: the image file
+    :return: the utc time the image was taken, from its EXIF DateTimeOriginal and SubSecTimeOriginal
+    """
+    times = read_exif_times(filename)
+    if times is None:
+        times = read_exif_times_with_pil(filename)
+    return parse_exif_time(*times)
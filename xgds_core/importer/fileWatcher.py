@@ -0,0 +1,291 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+Watch a directory tree for files which have been completely written, see ImportFinder.watch.
+On Linux the kernel reports them through inotify; elsewhere, or if inotify cannot watch the tree, the tree is
+polled instead.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from xgds_core.importer.scanManifest import ScanManifest
+
+# inotify event masks, from sys/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event, without the name which follows it
+EVENT = struct.Struct('iIII')
+
+# Seconds between scans when polling, and between checks of files found without an event that they were written
+POLL_SECONDS = 2
+
+
+def get_state(path):
+    """
+    :param path: the file
+    :return: the size and modification time of the file, or None if it is gone
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def unique(filenames):
+    """
+    :param filenames: list of file names
+    :return: the file names without repeats, in their order
+    """
+    seen = set()
+    return [f for f in filenames if not (f in seen or seen.add(f))]
+
+
+class InotifyWatcher(object):
+    """
+    Watches every directory of a tree with inotify, reporting files when they are closed after writing or moved
+    into the tree.  Directories which appear are watched as they are created; files already in them when they are
+    watched may still be being written, so they are held until they are closed or until their size and
+    modification time stop changing.
+    """
+
+    def __init__(self, root, stable_seconds=POLL_SECONDS):
+        """
+        :param root: the top of the tree to watch
+        :param stable_seconds: how long the files of new directories must go unchanged to be reported without an
+        event
+        """
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or not libc_name:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.root = root
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.stable_seconds = stable_seconds
+        # watch descriptor to directory
+        self.directories = {}
+        # files found in new directories, path to ((size, mtime), when it was last checked)
+        self.pending = {}
+        try:
+            self.watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, directory, WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOENT:
+                # already gone
+                return
+            raise OSError(error, 'inotify_add_watch failed for %s: %s' % (directory, os.strerror(error)))
+        self.directories[wd] = directory
+
+    def watch_tree(self, root):
+        """
+        Watch a directory and everything under it
+        :param root: the directory
+        :return: list of the files already in it
+        """
+        filenames = []
+        for dirName, subdirList, fileList in os.walk(root, followlinks=True):
+            self.watch(dirName)
+            for basename in fileList:
+                filenames.append(os.path.join(dirName, basename))
+        return filenames
+
+    def get_new_files(self, timeout):
+        """
+        Wait for files to be written
+        :param timeout: the most seconds to wait
+        :return: list of the full paths of the files, or None if events were lost and the tree has to be scanned
+        """
+        if self.pending:
+            timeout = min(timeout, self.stable_seconds)
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        filenames = self.check_pending()
+        if not ready:
+            return filenames
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return filenames
+            raise
+
+        lost = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip('\0')
+            offset += EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                lost = True
+            elif mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+            elif wd in self.directories:
+                path = os.path.join(self.directories[wd], name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # files may have been written, or be being written, before we were watching it
+                        try:
+                            now = time.time()
+                            for filename in self.watch_tree(path):
+                                self.pending[filename] = (get_state(filename), now)
+                        except OSError:
+                            lost = True
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self.pending.pop(path, None)
+                    filenames.append(path)
+        if lost:
+            self.pending = {}
+            return None
+        return unique(filenames)
+
+    def check_pending(self):
+        """
+        Check the files found in new directories which have gone stable_seconds since they were last checked
+        :return: list of those which have not changed since, which are no longer pending
+        """
+        filenames = []
+        now = time.time()
+        for path, (state, checked) in self.pending.items():
+            if now - checked < self.stable_seconds:
+                continue
+            new_state = get_state(path)
+            if new_state is None:
+                del self.pending[path]
+            elif new_state == state:
+                del self.pending[path]
+                filenames.append(path)
+            else:
+                self.pending[path] = (new_state, now)
+        return filenames
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher(object):
+    """
+    Finds new files by scanning the tree.  A file is reported once its size and modification time have not
+    changed between two scans, so files still being written are left until they are finished.  The scans only
+    list directories whose modification time has changed, see ScanManifest, so files changed in place in a
+    directory which has not changed are left to the import handler's full scans.
+    """
+
+    def __init__(self, root, interval=POLL_SECONDS):
+        """
+        :param root: the top of the tree to watch
+        :param interval: seconds between scans
+        """
+        self.root = root
+        self.interval = interval
+        self.next_scan = time.time() + interval
+        self.manifest = ScanManifest()
+        # files found by the scans, path to (size, mtime) when last seen
+        self.known = self.scan()
+        # new or changed files waiting for a scan in which they have not changed
+        self.pending = {}
+
+    def scan(self):
+        """
+        :return: dictionary of path to (size, mtime) of the files in the directories which have changed
+        """
+        files = {}
+        for path in self.manifest.scan(self.root, changed_only=True):
+            state = get_state(path)
+            if state is not None:
+                files[path] = state
+        return files
+
+    def get_new_files(self, timeout):
+        """
+        Wait for the next scan, if it is due within the timeout
+        :param timeout: the most seconds to wait
+        :return: list of the full paths of the files
+        """
+        wait = self.next_scan - time.time()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self.next_scan = time.time() + self.interval
+
+        files = self.scan()
+        # the pending files may be in directories which have not changed
+        for path in self.pending:
+            if path not in files:
+                state = get_state(path)
+                if state is not None:
+                    files[path] = state
+        filenames = []
+        for path, state in files.iteritems():
+            if path in self.pending:
+                if self.pending[path] == state:
+                    del self.pending[path]
+                    filenames.append(path)
+                else:
+                    self.pending[path] = state
+            elif self.known.get(path) != state:
+                self.pending[path] = state
+        for path in self.pending.keys():
+            if path not in files:
+                del self.pending[path]
+                self.known.pop(path, None)
+        self.known.update(files)
+        return filenames
+
+    def close(self):
+        pass
+
+
+def get_watcher(root):
+    """
+    :param root: the top of the tree to watch
+    :return: an InotifyWatcher, or a PollingWatcher where inotify is not available
+    """
+    try:
+        return InotifyWatcher(root)
+    except OSError as e:
+        print 'Polling %s for new files, %s' % (root, e)
+        return PollingWatcher(root)
@@ -0,0 +1,344 @@
+#! /usr/bin/env python
+#  __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+Benchmark the csv importer on synthetic data.
+For each yaml specification, csv files of the requested sizes are generated from the rows of a sample file,
+with the digits shuffled and new timestamps, plus any extra columns of the requested types.  They are imported
+with the profiler on, and each batch is stored with CsvImporter.store_batch as in a real import.  The rows go to
+a test database created for the run, so the site database is not touched.  Extra columns which the model does
+not have are converted but not stored.
+Results are appended to a json lines file and compared with the previous run of the same benchmark.
+"""
+
+import django
+django.setup()
+
+import csv
+import datetime
+import json
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+from collections import OrderedDict
+
+import pytz
+import yaml
+from django.db import connection
+from geocamUtil.loader import getModelByName
+
+import csvImporter
+
+TEST_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test', 'test_files')
+
+# yaml specifications and the sample files to generate rows from, or None to generate every value
+DEFAULT_SPECS = [(os.path.join(TEST_FILES, 'state.yaml'), None)]
+
+# one row per second from here
+START_TIME = datetime.datetime(2019, 1, 1, tzinfo=pytz.utc)
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+
+class BenchmarkMixin(object):
+    """
+    Configures an importer from the yaml alone; there is no vehicle, flight or existing data to look up
+    """
+
+    def configure(self, yaml_file_path, csv_file_path, vehicle_name=None, flight_name=None, defaults=None,
+                  force=False):
+        self.load_config(yaml_file_path, defaults)
+        if csv_file_path is not None:
+            self.open_csv(csv_file_path)
+        return self.config
+
+
+class OrderedDumper(yaml.SafeDumper):
+    pass
+
+
+OrderedDumper.add_representer(OrderedDict, lambda dumper, data: dumper.represent_dict(data.items()))
+
+
+def get_importer_class(engine):
+    """
+    :param engine: row or columnar
+    :return: the benchmark version of the importer class
+    """
+    if engine == 'columnar':
+        import columnarCsvImporter
+        base_class = columnarCsvImporter.ColumnarCsvImporter
+    else:
+        base_class = csvImporter.CsvImporter
+    return type('Benchmark' + base_class.__name__, (BenchmarkMixin, base_class), {})
+
+
+def parse_mix(mix):
+    """
+    :param mix: extra columns as comma separated type:count, ie float:4,integer:2
+    :return: list of (type, count)
+    """
+    result = []
+    if mix:
+        for part in mix.split(','):
+            field_type, count = part.split(':')
+            result.append((field_type.strip(), int(count)))
+    return result
+
+
+def write_spec(yaml_file_path, mix, output_path):
+    """
+    Write the yaml specification with the extra columns added
+    :param yaml_file_path: the original specification
+    :param mix: list of (type, count)
+    :param output_path: where to write the new specification
+    :return: the new config
+    """
+    with open(yaml_file_path, 'r') as stream:
+        config = csvImporter.ordered_load(stream)
+    for field_type, count in mix:
+        for index in range(count):
+            field_config = OrderedDict(type=field_type)
+            if field_type == 'datetime':
+                field_config['format'] = 'iso8601'
+            config['fields']['extra_%s_%d' % (field_type, index)] = field_config
+    with open(output_path, 'w') as stream:
+        yaml.dump(config, stream, Dumper=OrderedDumper, default_flow_style=False)
+    return config
+
+
+def format_time(the_time, time_format):
+    """
+    :param the_time: utc datetime
+    :param time_format: the format from the yaml
+    :return: the time as it would appear in a file
+    """
+    seconds = (the_time - EPOCH).total_seconds()
+    if time_format in ('unixtime_float_second', 'seconds'):
+        return '%.6f' % seconds
+    if time_format in ('unixtime_int_microsecond', 'microseconds'):
+        return '%d' % int(round(seconds * 1000000))
+    if time_format and '%' in time_format:
+        return the_time.strftime(time_format)
+    return the_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def shuffle_digits(value):
+    """
+    :param value: a value from the sample file
+    :return: the value with every digit replaced by a random digit
+    """
+    return ''.join(random.choice(string.digits) if c.isdigit() else c for c in value)
+
+
+def generate_value(field_name, field_config, the_time):
+    """
+    Generate a value for a field which is not in the sample file
+    :param field_name: the name of the field
+    :param field_config: the config for the field
+    :param the_time: the time of the row
+    :return: the value as a string
+    """
+    if 'regex' in field_config:
+        raise ValueError('%s has a regex, so it needs a sample file to generate values' % field_name)
+    field_type = field_config.get('type')
+    if field_type in ('datetime', 'date', 'time'):
+        return format_time(the_time, field_config.get('format'))
+    elif field_type == 'float':
+        return '%.4f' % random.uniform(-1000, 1000)
+    elif field_type == 'integer':
+        return str(random.randint(-100000, 100000))
+    elif field_type in ('boolean', 'nullboolean'):
+        return random.choice(['true', 'false'])
+    elif field_type == 'key_value':
+        return 'key:%d' % random.randint(0, 1000)
+    elif field_type == 'delimited':
+        # a delimited field without a delimiter is split on whitespace
+        return (field_config.get('delimiter') or ' ').join(generate_value(name, config, the_time)
+                                                       for name, config in field_config['fields'].iteritems())
+    return ''.join(random.choice(string.ascii_lowercase) for i in range(8))
+
+
+def write_csv(config, sample_rows, count, output_path):
+    """
+    Generate a csv file
+    :param config: the config of the specification
+    :param sample_rows: rows of the sample file, as lists of values, to vary; may be empty
+    :param count: the number of rows
+    :param output_path: where to write the file
+    """
+    delimiter = str(config.get('delimiter', ','))
+    if len(delimiter) > 1 and 't' in delimiter:
+        delimiter = '\t'
+    with open(output_path, 'wb') as stream:
+        writer = csv.writer(stream, delimiter=delimiter, quotechar=str(config.get('quotechar', '"')))
+        for index in xrange(count):
+            the_time = START_TIME + datetime.timedelta(seconds=index)
+            sample = random.choice(sample_rows) if sample_rows else []
+            row = []
+            for column, (field_name, field_config) in enumerate(config['fields'].iteritems()):
+                if field_config.get('type') == 'datetime':
+                    row.append(format_time(the_time, field_config.get('format')))
+                elif column < len(sample):
+                    row.append(shuffle_digits(sample[column]))
+                else:
+                    row.append(generate_value(field_name, field_config, the_time))
+            writer.writerow(row)
+
+
+def read_sample(config, sample_path):
+    """
+    :param config: the config of the specification
+    :param sample_path: the sample csv file, or None
+    :return: the rows of the sample file as lists of values
+    """
+    if not sample_path:
+        return []
+    delimiter = str(config.get('delimiter', ','))
+    if len(delimiter) > 1 and 't' in delimiter:
+        delimiter = '\t'
+    with open(sample_path, 'rbU') as stream:
+        return [r for r in csv.reader(stream, delimiter=delimiter, quotechar=str(config.get('quotechar', '"'))) if r]
+
+
+def run_benchmark(yaml_file_path, csv_file_path, engine, batch_size, native=False, cprofile_path=None):
+    """
+    Import the file with the profiler on, storing each batch with store_batch in the test database
+    :param native: True to create the rows with the database's bulk loader, see nativeLoader
+    :return: the profiler results
+    """
+    importer = get_importer_class(engine)(yaml_file_path, csv_file_path, batch_size=batch_size, native=native)
+    the_model = getModelByName(importer.config['class'])
+    field_names = set()
+    for field in the_model._meta.concrete_fields:
+        field_names.update([field.name, field.attname])
+    profiler = importer.profile(cprofile_path)
+    stats = {'matched': 0, 'updated': 0, 'created': 0, 'missing': 0}
+    count = 0
+    profiler.start()
+    try:
+        for rows in importer.iter_batches(batch_size):
+            rows = importer.lookup_positions(rows)
+            count += len(rows)
+            rows = [dict((k, v) for k, v in row.iteritems() if k in field_names) for row in rows]
+            importer.store_batch(the_model, rows, stats)
+    finally:
+        profiler.stop()
+        # so the next run can store the same rows
+        the_model.objects.all().delete()
+    return profiler.get_results(count)
+
+
+def get_previous(results_path, key):
+    """
+    :param results_path: the json lines results file
+    :param key: the benchmark settings to match
+    :return: the last result with the same settings, or None
+    """
+    previous = None
+    if os.path.exists(results_path):
+        with open(results_path, 'r') as stream:
+            for line in stream:
+                result = json.loads(line)
+                if all(result.get(k) == v for k, v in key.iteritems()):
+                    previous = result
+    return previous
+
+
+def main():
+    import optparse
+
+    parser = optparse.OptionParser('usage: %prog [-c config -s sample] [-n rows] [-m float:4,integer:2]')
+    parser.add_option('-c', '--config', help='path to config file (yaml), defaults to the test_files specs')
+    parser.add_option('-s', '--sample', help='path to a csv file with sample rows for the config')
+    parser.add_option('-n', '--rows', default='10000,100000', help='comma separated numbers of rows to generate')
+    parser.add_option('-m', '--mix', default='', help='extra columns to add, as comma separated type:count')
+    parser.add_option('-e', '--engine', type='choice', choices=['row', 'columnar', 'both'], default='both',
+                      help='which importer engine to benchmark')
+    parser.add_option('-b', '--batch_size', type='int', default=10000, help='rows per batch')
+    parser.add_option('-N', '--native', action="store_true", dest="native", default=False,
+                      help="create the rows with the database's bulk loader, see nativeLoader")
+    parser.add_option('-o', '--output', default='importBenchmark.jsonl',
+                      help='json lines file the results are appended to')
+    parser.add_option('-t', '--threshold', type='float', default=0.2,
+                      help='report a regression when rows/s drops by more than this fraction')
+    parser.add_option('--cprofile', action="store_true", dest="cprofile", default=False,
+                      help='also dump cProfile stats next to the results file')
+    parser.add_option('--keep', action="store_true", dest="keep", default=False,
+                      help='keep the generated files')
+
+    opts, args = parser.parse_args()
+
+    specs = DEFAULT_SPECS
+    if opts.config:
+        specs = [(opts.config, opts.sample)]
+    engines = ['row', 'columnar'] if opts.engine == 'both' else [opts.engine]
+    mix = parse_mix(opts.mix)
+
+    work_dir = tempfile.mkdtemp(prefix='importBenchmark')
+    regressions = 0
+    # the rows are written to a test database, created with the tables of all of the models
+    old_database_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        for yaml_file_path, sample_path in specs:
+            name = os.path.splitext(os.path.basename(yaml_file_path))[0]
+            spec_path = os.path.join(work_dir, name + '.yaml')
+            config = write_spec(yaml_file_path, mix, spec_path)
+            sample_rows = read_sample(config, sample_path)
+            for count in [int(n) for n in opts.rows.split(',')]:
+                csv_file_path = os.path.join(work_dir, '%s_%d.csv' % (name, count))
+                write_csv(config, sample_rows, count, csv_file_path)
+                for engine in engines:
+                    key = OrderedDict([('spec', name), ('engine', engine), ('size', count), ('mix', opts.mix),
+                                       ('batch_size', opts.batch_size), ('native', opts.native),
+                                       ('cprofile', opts.cprofile)])
+                    cprofile_path = None
+                    if opts.cprofile:
+                        cprofile_path = '%s_%s_%d_%s.prof' % (os.path.splitext(opts.output)[0], name, count, engine)
+                    previous = get_previous(opts.output, key)
+                    results = run_benchmark(spec_path, csv_file_path, engine, opts.batch_size, opts.native,
+                                            cprofile_path)
+
+                    result = OrderedDict(key)
+                    result['date'] = datetime.datetime.utcnow().isoformat()
+                    result.update(results)
+                    with open(opts.output, 'a') as stream:
+                        stream.write(json.dumps(result) + '\n')
+
+                    print '%s %s %d rows: %.1f rows/s' % (name, engine, count, result['rows_per_second'])
+                    for stage, seconds in result['stages'].iteritems():
+                        print '  %-8s %10.3f s' % (stage, seconds)
+                    if previous and previous['rows_per_second']:
+                        change = result['rows_per_second'] / previous['rows_per_second'] - 1
+                        print '  %+.1f%% rows/s since %s' % (100 * change, previous['date'])
+                        if change < -opts.threshold:
+                            print '  REGRESSION'
+                            regressions += 1
+    finally:
+        connection.creation.destroy_test_db(old_database_name, verbosity=0)
+        if opts.keep:
+            print 'generated files are in %s' % work_dir
+        else:
+            shutil.rmtree(work_dir)
+    return regressions
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
@@ -22,90 +22,186 @@ See ../../docs/dataImportYml.rst
 
 import yaml
 import os
-import re
+import hashlib
+import sys
 import datetime
 import pytz
-from subprocess import Popen, PIPE
-from threading import Timer
+from subprocess import Popen
 import shlex
+import tempfile
 import time
+import timeit
 import traceback
 import django
 django.setup()
-from django.db import connection
-from xgds_core.models import ImportedTelemetryFile
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+from xgds_core.models import ImportedTelemetryFile, ImportedFileFingerprint
+from xgds_core.util import get_content_hash
+from xgds_core.importer.registryMatcher import RegistryMatcher
+from xgds_core.importer.fileWatcher import get_watcher
+from xgds_core.importer.importWorkers import WorkerPool, WorkerJob
+from xgds_core.importer.scanManifest import ScanManifest
 from heapq import *
 
+# How often running imports are checked for completion and timeouts
+POLL_SECONDS = 0.05
+# When watching, how long to wait for new files at a time, and how often to scan everything anyway
+WATCH_TIMEOUT = 1
+RESCAN_SECONDS = 3600
+
+
+def get_file_state(filename):
+    """
+    :param filename: the file
+    :return: the size and modification time of the file, or None for both if it is gone
+    """
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None, None
+    return st.st_size, st.st_mtime
+
+
+class ImportJob(object):
+    """
+    An importer process for one file.  Its output goes to temporary files rather than pipes, so that many can run
+    without a thread each to read their output.
+    """
+
+    def __init__(self, order, filename, registry, cmd):
+        """
+        :param order: the order of the registry entry
+        :param filename: the file to import
+        :param registry: the registry entry the file matched
+        :param cmd: the command line
+        """
+        self.order = order
+        self.filename = filename
+        self.registry = registry
+        self.cmd = cmd
+        self.proc = None
+        self.deadline = None
+        self.start_time = None
+        self.end_time = None
+        self.returncode = None
+        self.stdout = None
+        self.stderr = None
+        self.stdout_file = None
+        self.stderr_file = None
+
+    def start(self):
+        self.stdout_file = tempfile.TemporaryFile()
+        self.stderr_file = tempfile.TemporaryFile()
+        try:
+            self.proc = Popen(shlex.split(self.cmd), stdout=self.stdout_file, stderr=self.stderr_file)
+        except:
+            self.close()
+            raise
+        self.start_time = pytz.timezone('utc').localize(datetime.datetime.utcnow())
+        # Set a timeout per the import handler config file
+        self.deadline = timeit.default_timer() + self.registry['timeout']
+
+    def poll(self):
+        """
+        Check on the process, killing it if it has run past its timeout
+        :return: True once it has finished
+        """
+        if self.proc.poll() is None:
+            if timeit.default_timer() < self.deadline:
+                return False
+            self.proc.kill()
+            self.proc.wait()
+        self.end_time = pytz.timezone('utc').localize(datetime.datetime.utcnow())
+        self.returncode = self.proc.returncode
+        self.stdout_file.seek(0)
+        self.stdout = self.stdout_file.read()
+        self.stderr_file.seek(0)
+        self.stderr = self.stderr_file.read()
+        self.close()
+        return True
+
+    def close(self):
+        for output in (self.stdout_file, self.stderr_file):
+            if output:
+                output.close()
+
 
 class ImportFinder:
-    def __init__(self, config_yaml_path, import_path=None):
+    def __init__(self, config_yaml_path, import_path=None, concurrency=None, workers=False, manifest_path=None):
         # config comes from a YAML file
-        self.config = yaml.load(open(config_yaml_path))
+        config_text = open(config_yaml_path).read()
+        self.config = yaml.load(config_text)
         if import_path:
             self.config['import_path'] = import_path
+        # The import directory as of the last scan, so a scan only lists the directories which have changed; it is
+        # saved for the next run if there is a path for it.  A changed config starts a new manifest.
+        self.manifest = ScanManifest(manifest_path or self.config.get('scan_manifest'),
+                                     hashlib.sha1(config_text).hexdigest())
+        # How many imports to run at once; a registry entry can also limit how many of its imports run at once
+        self.concurrency = concurrency or self.config.get('concurrency') or settings.XGDS_CORE_IMPORT_CONCURRENCY
+        # Run python importers in warm worker processes rather than starting one per file, unless the registry
+        # entry asks to be isolated; see importWorkers
+        self.pool = None
+        if workers or self.config.get('workers'):
+            self.pool = WorkerPool()
         self.registry = self.config['registry']
+        self.check_concurrency()
+        self.matcher = RegistryMatcher(self.registry)
         # Local copy of processed files, which are also tracked in the database
         # in order to keep state when the import finder is restarted and for
         # reporting import status to users
-        self.processed_files = []
+        self.processed_files = set()
+        # Files successfully imported according to the database, filename to (size, mtime); see load_catalog
+        self.catalog = None
         self.files_to_process = []
         # Keep track of the disposition of all discovered files:
         self.previously_imported_files = [] # were in the database
         self.ignored_files = [] # matched an explicit ignore rule
         self.ambiguous_files = [] # matched more than one config rule
         self.unmatched_files = [] # matched no config rule
+        self.unchanged_files = 0 # found by an earlier scan and not changed since
         self.imports_that_failed = [] # tried to import and failed
         self.imports_that_succeeded = [] # tried and succeeded
+        self.fingerprints = {} # filename to (content hash, data class) of the files being imported
+        self.file_states = {} # filename to (size, mtime) of the files being imported, as they were started
         self.duration = None
 
-    def get_new_files(self):
-        for dirName, subdirList, fileList in os.walk(self.config['import_path'],followlinks=True):
-            #print('Found directory: %s' % dirName)
-            for basename in fileList:
-                filename = os.path.join(dirName, basename)
-                # If the filename is in the list of processed files, skip it
-                if filename in self.processed_files:
-                    '%s is in processed files list' % filename
-                    continue
-                # If the filename is not in the locally cached list it might be in the db as
-                # having successfully imported previously
-                previous = ImportedTelemetryFile.objects.filter(filename=filename, returncode=0)
-                if previous:
-#                    print '%s is in the database as having been imported' % filename
-                    # Add it to the previously imported files for statistics
-                    self.previously_imported_files.append(filename)
-                    # Add it to the locally cached copy of processed files
-                    self.processed_files.append(filename)
-                    continue
+    def check_concurrency(self):
+        """
+        Make sure the concurrency, and that of each registry entry, lets at least one import run at a time
+        """
+        if self.concurrency < 1:
+            raise ValueError('concurrency must be at least 1, not %s' % self.concurrency)
+        for registry in self.registry:
+            if registry.get('concurrency', 1) < 1:
+                raise ValueError('concurrency of registry entry %s must be at least 1, not %s' %
+                                 (registry.get('name', registry.get('filepath_pattern')), registry['concurrency']))
 
-                # Identify which importer to use, and make sure it's a unique match
-                matches = []
-                for r in self.registry:
-                    #print r['filepath_pattern']
-                    match = re.search(r['filepath_pattern'], filename)
-                    if match:
-                        matches.append(r)
-                if 1 == len(matches):
-                    if 'ignore' in matches[0] and matches[0]['ignore']:
-                        # matched an explicit ignore rule
-#                        print 'Ignoring', basename
-                        self.ignored_files.append(filename)
-                        continue
-                    if 'order' in matches[0].keys():
-                        order = matches[0]['order']
-                    else:
-                        order = 10
-                    print 'Adding', basename
-                    # unique match, add to the list of things to import
-                    heappush(self.files_to_process, (order, (filename, matches[0])))
-                elif 0 == len(matches):
-                    #print 'Warning: file %s does not match any importer config' % filename
-                    self.unmatched_files.append(filename)
-                else:
-                    print 'Warning: file %s matches more than one importer config' % filename
-                    for m in matches:
-                        print m
-                    self.ambiguous_files.append(filename)
+    def load_catalog(self):
+        """
+        Load the files that were successfully imported, in one query, so that looking up a file needs no query
+        :return: dictionary of filename to (size, mtime) when it was imported
+        """
+        self.catalog = {}
+        for filename, size, mtime in ImportedTelemetryFile.objects.filter(returncode=0).values_list('filename',
+                                                                                                     'size',
+                                                                                                     'mtime'):
+            self.catalog[filename] = (size, mtime)
+        return self.catalog
+
+    def get_new_files(self, full=False):
+        """
+        Scan the import directory for files which are new or have changed since the last scan
+        :param full: list every directory, rather than only those whose modification time has changed
+        """
+        if self.catalog is None:
+            self.load_catalog()
+        for filename in self.manifest.scan(self.config['import_path'], changed_only=True, full=full):
+            self.add_file(filename)
+        self.unchanged_files += self.manifest.unchanged_files
+        print 'Listed %d directories, skipped %d unchanged directories' % (self.manifest.listed_directories,
+                                                                             self.manifest.skipped_directories)
 
         print 'Identified files to process:'
         for item in self.files_to_process:
@@ -114,84 +210,260 @@ class ImportFinder:
             registry = item[1][1]
             print '%s %s' % (order, filename)
 
-    def process_files(self, username=None, password=None):
-        while len(self.files_to_process) > 0:
-            order, pair = heappop(self.files_to_process)
-            filename, registry = pair
-            if 'arguments' in registry:
-                arguments = registry['arguments']
-                match = re.search(registry['filepath_pattern'], filename)
-                replacements = match.groupdict()
-                if '%(filename)s' in registry['arguments']:
-                    replacements['filename'] = filename
-                else:
-                    arguments = ' '.join([registry['arguments'], '"%s"' % filename])
-                arguments = arguments % replacements
+    def add_file(self, filename):
+        """
+        Add a file to the files to process, if it has not been imported and uniquely matches a registry entry
+        :param filename: the full path of the file
+        :return: True if it was added
+        """
+        if self.catalog is None:
+            self.load_catalog()
+        basename = os.path.basename(filename)
+        # If the filename is in the list of processed files, skip it
+        if filename in self.processed_files:
+            '%s is in processed files list' % filename
+            return False
+        # If the filename is not in the locally cached list it might be in the db as
+        # having successfully imported previously
+        if filename in self.catalog:
+#            print '%s is in the database as having been imported' % filename
+            size, mtime = self.catalog[filename]
+            if size is not None and get_file_state(filename) not in ((size, mtime), (None, None)):
+                print '%s has changed since it was imported, it is not imported again' % basename
+            # Add it to the previously imported files for statistics
+            self.previously_imported_files.append(filename)
+            # Add it to the locally cached copy of processed files
+            self.processed_files.add(filename)
+            return False
+
+        # Identify which importer to use, and make sure it's a unique match
+        matches = self.matcher.match(filename)
+        if 1 == len(matches):
+            if 'ignore' in matches[0] and matches[0]['ignore']:
+                # matched an explicit ignore rule
+#                print 'Ignoring', basename
+                self.ignored_files.append(filename)
+                return False
+            if 'order' in matches[0].keys():
+                order = matches[0]['order']
             else:
-                arguments = '"%s"' % filename
-
-            auth = False
-            if 'auth' in registry:
-                auth = registry['auth']
-            if auth and 'username' not in arguments and username:
-                arguments = '--username %s --password %s %s' % (username, password, arguments)
-            cmd = ' '.join([registry['importer'], arguments])
-            timeout = registry['timeout']
-            try:
-                print order, cmd
-                proc = Popen(shlex.split(cmd), stdout=PIPE, stderr=PIPE)
-            except Exception as e:
-                print str(e)
-                print traceback.format_exc()
+                order = 10
+            print 'Adding', basename
+            # unique match, add to the list of things to import
+            heappush(self.files_to_process, (order, (filename, matches[0])))
+            return True
+        elif 0 == len(matches):
+            #print 'Warning: file %s does not match any importer config' % filename
+            self.unmatched_files.append(filename)
+        else:
+            print 'Warning: file %s matches more than one importer config' % filename
+            for m in matches:
+                print m
+            self.ambiguous_files.append(filename)
+        return False
+
+    def get_fingerprints(self, pending):
+        """
+        Hash the files of registry entries with a data_class.  This is done for a whole order level before any of
+        its imports start, so that hashing large files does not hold up the polling of running imports.
+        :param pending: list of (filename, registry entry)
+        :return: dictionary of filename to (content hash, data class)
+        """
+        fingerprints = {}
+        for filename, registry in pending:
+            data_class = registry.get('data_class')
+            if not data_class:
                 continue
-            # Set a timeout per the import handler config file
-            timer = Timer(timeout, proc.kill)
-            start_import_time = pytz.timezone('utc').localize(datetime.datetime.utcnow())
             try:
-                timer.start()
-                (stdout, stderr) = proc.communicate()
-            finally:
-                timer.cancel()
-            end_import_time = pytz.timezone('utc').localize(datetime.datetime.utcnow())
+                fingerprints[filename] = (get_content_hash(filename), data_class)
+            except (IOError, OSError):
+                # gone; the import will fail and say so
+                pass
+        return fingerprints
 
-            # Add or update metadata about this import in the database
-            try:
-                connection.close()
-                connection.connect()
-            except:
-                traceback.print_exc()
+    def check_fingerprint(self, filename, fingerprint):
+        """
+        See if the same content was imported into the same data class before under another name, or is being
+        imported now
+        :param filename: the file about to be imported
+        :param fingerprint: its (content hash, data class), None if its registry entry has no data_class
+        :return: True if it has been imported
+        """
+        if not fingerprint:
+            return False
+        content_hash, data_class = fingerprint
+        if fingerprint in self.fingerprints.values():
+            print '%s has the same content as a file being imported' % os.path.basename(filename)
+        elif ImportedFileFingerprint.objects.filter(content_hash=content_hash, data_class=data_class).exists():
+            print '%s has the same content as a previously imported file' % os.path.basename(filename)
+        else:
+            self.fingerprints[filename] = fingerprint
+            return False
+        self.previously_imported_files.append(filename)
+        self.processed_files.add(filename)
+        return True
 
-            try:
-                itf = ImportedTelemetryFile()
-                previous_itf = ImportedTelemetryFile.objects.filter(filename=filename)
-                retry_count = 0
-                if previous_itf.count() > 0:
-                    itf = previous_itf[0]
-                    retry_count = itf.retry_count + 1
-                itf.filename = filename
-                itf.commandline = cmd
-                itf.timestamp = end_import_time
-                itf.duration = (end_import_time - start_import_time).total_seconds()
-                itf.returncode = proc.returncode
-                itf.runlog = stdout
-                itf.errlog = stderr
-                itf.retry_count = retry_count
-                itf.save()
-            except:
-                traceback.print_exc()
-
-            # If it succeeded, keep track that we did this one
-            if proc.returncode == 0:
-                self.imports_that_succeeded.append(filename)
-                self.processed_files.append(filename)
+    def get_command(self, filename, registry, username=None, password=None):
+        """
+        Build the command line to import a file
+        :param filename: the file
+        :param registry: the registry entry it matched
+        :return: the command line
+        """
+        if 'arguments' in registry:
+            arguments = registry['arguments']
+            match = self.matcher.search(registry, filename)
+            replacements = match.groupdict()
+            if '%(filename)s' in registry['arguments']:
+                replacements['filename'] = filename
             else:
-                self.imports_that_failed.append(filename)
+                arguments = ' '.join([registry['arguments'], '"%s"' % filename])
+            arguments = arguments % replacements
+        else:
+            arguments = '"%s"' % filename
+
+        auth = False
+        if 'auth' in registry:
+            auth = registry['auth']
+        if auth and 'username' not in arguments and username:
+            arguments = '--username %s --password %s %s' % (username, password, arguments)
+        return ' '.join([registry['importer'], arguments])
+
+    def get_job(self, order, filename, registry, username=None, password=None):
+        """
+        :return: the ImportJob, or WorkerJob when a worker can run the importer
+        """
+        cmd = self.get_command(filename, registry, username, password)
+        arguments = shlex.split(cmd)
+        if self.pool and arguments[0].endswith('.py') and not registry.get('isolate'):
+            return WorkerJob(self.pool, order, filename, registry, cmd, arguments)
+        return ImportJob(order, filename, registry, cmd)
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+
+    def process_files(self, username=None, password=None):
+        """
+        Run the imports, up to self.concurrency at a time.  Files are imported in order levels: all of the imports
+        of one order finish before any of the next order start, so later orders can depend on earlier ones.
+        """
+        while len(self.files_to_process) > 0:
+            order = self.files_to_process[0][0]
+            pending = []
+            while self.files_to_process and self.files_to_process[0][0] == order:
+                pending.append(heappop(self.files_to_process)[1])
+            self.process_level(order, pending, username, password)
+        self.manifest.save()
+
+    def process_level(self, order, pending, username=None, password=None):
+        """
+        Run the imports of one order concurrently, within the concurrency of each registry rule
+        :param order: the order
+        :param pending: list of (filename, registry entry) in the order to start them
+        """
+        running = []
+        fingerprints = self.get_fingerprints(pending)
+        while pending or running:
+            for job in list(running):
+                if job.poll():
+                    running.remove(job)
+                    self.finish_import(job)
+
+            index = 0
+            while index < len(pending) and len(running) < self.concurrency:
+                filename, registry = pending[index]
+                rule_running = len([job for job in running if job.registry is registry])
+                if rule_running >= registry.get('concurrency', self.concurrency):
+                    index += 1
+                    continue
+                del pending[index]
+                if self.check_fingerprint(filename, fingerprints.get(filename)):
+                    continue
+                job = self.get_job(order, filename, registry, username, password)
+                # the file as the importer will read it
+                self.file_states[filename] = get_file_state(filename)
+                try:
+                    print order, job.cmd
+                    job.start()
+                except Exception as e:
+                    print str(e)
+                    print traceback.format_exc()
+                    self.file_states.pop(filename, None)
+                    self.fingerprints.pop(filename, None)
+                    self.manifest.forget(filename)
+                    continue
+                running.append(job)
+
+            if running:
+                time.sleep(POLL_SECONDS)
+
+    def finish_import(self, job):
+        """
+        Record a finished import in the database and in our statistics
+        :param job: the ImportJob
+        """
+        filename = job.filename
+        size, mtime = self.file_states.pop(filename, (None, None))
+        fingerprint = self.fingerprints.pop(filename, None)
+        # Add or update metadata about this import in the database
+        try:
+            connection.close()
+            connection.connect()
+        except:
+            traceback.print_exc()
+
+        try:
+            itf = ImportedTelemetryFile()
+            previous_itf = ImportedTelemetryFile.objects.filter(filename=filename)
+            retry_count = 0
+            if previous_itf.count() > 0:
+                itf = previous_itf[0]
+                retry_count = itf.retry_count + 1
+            itf.filename = filename
+            itf.commandline = job.cmd
+            itf.timestamp = job.end_time
+            itf.duration = (job.end_time - job.start_time).total_seconds()
+            itf.returncode = job.returncode
+            itf.runlog = job.stdout
+            itf.errlog = job.stderr
+            itf.retry_count = retry_count
+            itf.size = size
+            itf.mtime = mtime
+            itf.save()
+        except:
+            traceback.print_exc()
+
+        # If it succeeded, keep track that we did this one
+        if job.returncode == 0:
+            self.imports_that_succeeded.append(filename)
+            self.processed_files.add(filename)
+            if self.catalog is not None:
+                self.catalog[filename] = (size, mtime)
+            if fingerprint:
+                content_hash, data_class = fingerprint
+                try:
+                    with transaction.atomic():
+                        ImportedFileFingerprint.objects.get_or_create(content_hash=content_hash,
+                                                                      data_class=data_class,
+                                                                      defaults={'size': size or 0,
+                                                                                'filename': filename})
+                except IntegrityError:
+                    # the importer, or another import of the same content, saved it first
+                    pass
+                except:
+                    traceback.print_exc()
+        else:
+            self.imports_that_failed.append(filename)
+            # so the next scan tries it again
+            self.manifest.forget(filename)
 
     def print_import_stats(self):
         print 'Found %d previously imported files' % len(self.previously_imported_files)
         print 'Found %d files configured to ignore' % len(self.ignored_files)
         print 'Found %d ambiguous files, matched more than one config rule' % len(self.ambiguous_files)
         print 'Found %d unmatched files, matched no config rule' % len(self.unmatched_files)
+        print 'Skipped %d files unchanged since an earlier scan' % self.unchanged_files
         if len(self.files_to_process)>0:
             print 'Found %d files to process' % len(self.files_to_process)
         print 'Tried %d imports that failed' % len(self.imports_that_failed)
@@ -199,15 +471,49 @@ class ImportFinder:
         if self.duration:
             print 'Total duration (H:M:S): %s ' % self.duration
 
-    def do_once(self,test):
+    def do_once(self, username=None, password=None):
         self.get_new_files()
-        self.process_files()
+        self.process_files(username, password)
 
-    def loop(self):
+    def loop(self, username=None, password=None):
         while True:
-            self.do_once()
+            self.do_once(username, password)
             time.sleep(10)
 
+    def watch(self, username=None, password=None, rescan_seconds=RESCAN_SECONDS):
+        """
+        Import files as soon as they are written, as reported by a fileWatcher, rather than by scanning the whole
+        import directory over and over.  The directory is scanned at startup, when the watcher has lost events,
+        and every rescan_seconds in case anything was missed.
+        :param rescan_seconds: seconds between full scans
+        """
+        # watch before scanning, so files written during the scan are not missed
+        watcher = get_watcher(self.config['import_path'])
+        try:
+            self.get_new_files()
+            last_scan = time.time()
+            while True:
+                self.process_files(username, password)
+                filenames = watcher.get_new_files(WATCH_TIMEOUT)
+                if filenames is None:
+                    self.get_new_files()
+                    last_scan = time.time()
+                elif time.time() - last_scan > rescan_seconds:
+                    # in case files were changed in place
+                    self.get_new_files(full=True)
+                    last_scan = time.time()
+                else:
+                    for filename in filenames:
+                        # a temporary file may be renamed as soon as it is written
+                        if os.path.isfile(filename):
+                            try:
+                                self.add_file(filename)
+                            except (IOError, OSError) as e:
+                                print 'Could not add %s: %s' % (filename, e)
+        finally:
+            watcher.close()
+            self.close()
+
 
 if __name__ == '__main__':
     import optparse
@@ -218,15 +524,35 @@ if __name__ == '__main__':
     parser.add_option('-u', '--username', default='irg', help='username for xgds auth')
     parser.add_option('-p', '--password', help='authtoken for xgds authentication.  Can get it from https://xgds_server_name/accounts/rest/genToken/<username>')
     parser.add_option('-d', '--directory', help='import directory to override default set in ImportHandlerConfig.yaml', default=None)
+    parser.add_option('-j', '--concurrency', type='int', default=None,
+                      help='number of imports to run at once, overrides the concurrency in ImportHandlerConfig.yaml')
+    parser.add_option('-W', '--workers', action='store_true', default=False,
+                      help='run python importers in warm worker processes instead of starting python for each file')
+    parser.add_option('-w', '--watch', action='store_true', default=False,
+                      help='keep running, importing files as soon as they are written')
+    parser.add_option('--rescan', type='float', default=RESCAN_SECONDS,
+                      help='with --watch, seconds between scans of the whole import directory')
+    parser.add_option('--manifest', default=None,
+                      help='file to keep the scan manifest in, so later runs skip unchanged directories; '
+                           'overrides the scan_manifest in ImportHandlerConfig.yaml')
+    parser.add_option('--full-scan', action='store_true', default=False,
+                      help='list every directory, to find files changed in place since the manifest was saved')
 
     opts, args = parser.parse_args()
 
     start_time = datetime.datetime.now()
     end_time = None
-    finder = ImportFinder(args[0], opts.directory)
-    finder.get_new_files()
+    finder = ImportFinder(args[0], opts.directory, opts.concurrency, opts.workers, opts.manifest)
+    if opts.watch and not opts.test:
+        try:
+            finder.watch(username=opts.username, password=opts.password, rescan_seconds=opts.rescan)
+        except KeyboardInterrupt:
+            finder.print_import_stats()
+        sys.exit(0)
+    finder.get_new_files(full=opts.full_scan)
     if not opts.test:
         finder.process_files(username=opts.username, password=opts.password)
+        finder.close()
         end_time = datetime.datetime.now()
     if end_time:
         finder.duration = end_time - start_time
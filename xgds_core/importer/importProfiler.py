@@ -0,0 +1,159 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+Timing of the stages of an import, see CsvImporter.profile
+"""
+
+import cProfile
+import timeit
+from collections import OrderedDict
+
+READ = 'read'
+REGEX = 'regex'
+TYPE = 'type'
+UNITS = 'units'
+LOOKUP = 'lookup'
+WRITE = 'write'
+STAGES = (READ, REGEX, TYPE, UNITS, LOOKUP, WRITE)
+
+
+class NullStage(object):
+    """
+    Does nothing, used as the stage context when we are not profiling
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage(object):
+    """
+    Context which times a stage of the profiler
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.push(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.pop()
+        return False
+
+
+class ImportProfiler(object):
+    """
+    Accumulates the time spent in each stage of an import.
+    Times are exclusive: while a stage runs inside another, for example the regex of a delimited field inside its
+    type conversion, the time counts only for the inner stage.
+    """
+
+    def __init__(self, cprofile_path=None):
+        """
+        :param cprofile_path: if given, also run cProfile between start and stop and dump its stats to this path
+        """
+        self.times = OrderedDict((name, 0.0) for name in STAGES)
+        self.stack = []
+        self.started = None
+        self.start_time = None
+        self.elapsed = 0.0
+        self.cprofile_path = cprofile_path
+        self.cprofile = None
+
+    def start(self):
+        self.start_time = timeit.default_timer()
+        if self.cprofile_path:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_path)
+            self.cprofile = None
+        if self.start_time is not None:
+            self.elapsed += timeit.default_timer() - self.start_time
+            self.start_time = None
+
+    def push(self, name):
+        now = timeit.default_timer()
+        if self.stack:
+            self.times[self.stack[-1]] += now - self.started
+        self.stack.append(name)
+        self.started = now
+
+    def pop(self):
+        now = timeit.default_timer()
+        self.times[self.stack.pop()] += now - self.started
+        self.started = now
+
+    def stage(self, name):
+        """
+        :param name: the name of the stage
+        :return: a context timing the stage
+        """
+        return Stage(self, name)
+
+    def timed(self, name, fcn):
+        """
+        Wrap a function so that its calls are timed as the stage
+        :param name: the name of the stage
+        :param fcn: the function
+        :return: the wrapped function
+        """
+        def wrapper(*args, **kwargs):
+            self.push(name)
+            try:
+                return fcn(*args, **kwargs)
+            finally:
+                self.pop()
+        return wrapper
+
+    def get_results(self, rows):
+        """
+        :param rows: the number of rows imported
+        :return: dictionary of the elapsed seconds, rows per second, and seconds per stage, including other
+        """
+        stages = OrderedDict(self.times)
+        stages['other'] = max(0.0, self.elapsed - sum(self.times.itervalues()))
+        return {'rows': rows,
+                'seconds': self.elapsed,
+                'rows_per_second': rows / self.elapsed if self.elapsed else 0.0,
+                'stages': stages}
+
+    def report(self, rows):
+        """
+        :param rows: the number of rows imported
+        :return: a printable summary of the rows per second and time per stage
+        """
+        results = self.get_results(rows)
+        lines = ['%(rows)d rows in %(seconds).3f seconds, %(rows_per_second).1f rows/s' % results]
+        for name, seconds in results['stages'].iteritems():
+            percent = 100.0 * seconds / self.elapsed if self.elapsed else 0.0
+            lines.append('  %-8s %10.3f s %6.1f%%' % (name, seconds, percent))
+        if self.cprofile_path:
+            lines.append('cProfile stats written to %s' % self.cprofile_path)
+        return '\n'.join(lines)
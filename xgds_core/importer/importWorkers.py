@@ -0,0 +1,302 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+Long lived worker processes which run python importer scripts for the import handler, see ImportFinder.
+The workers are forked from the import handler after Django is set up, so an import does not pay for starting
+python, setting up Django and importing the models; the script is run in the worker as if it was the main program.
+Modules the script imports from its own directory are forgotten after it runs, so their module level state does not
+carry over to the next import.  Other modules stay loaded: importing the apps' modules again would register their
+models and connect their signal receivers a second time.  The workers are not daemons, so importers can start processes of their own; the pool shuts them
+down when it is closed, or when the import handler exits.
+"""
+
+import atexit
+import multiprocessing
+import os
+import runpy
+import sys
+import tempfile
+import timeit
+import traceback
+import datetime
+
+import pytz
+from django.db import connections
+
+# Workers are replaced after this many imports, so that anything an importer leaves behind does not build up
+WORKER_MAX_JOBS = 100
+
+
+def close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+def get_returncode(exit):
+    """
+    :param exit: the SystemExit raised by a script
+    :return: the return code the script would have exited with
+    """
+    if exit.code is None:
+        return 0
+    if isinstance(exit.code, (int, long)):
+        return exit.code
+    print >> sys.stderr, exit.code
+    return 1
+
+
+def forget_script_modules(saved_modules, directory):
+    """
+    Forget the modules loaded from a script's directory since saved_modules, so the next run imports them afresh
+    :param saved_modules: the names of the modules loaded before the script ran
+    :param directory: the script's directory
+    """
+    directory = os.path.join(directory, '')
+    for name, module in list(sys.modules.items()):
+        if name in saved_modules:
+            continue
+        path = getattr(module, '__file__', None)
+        if path and os.path.abspath(path).startswith(directory):
+            del sys.modules[name]
+
+
+def run_importer(arguments, output_path, error_path):
+    """
+    Run an importer script as the main program, with its output going to files
+    :param arguments: the path to the script followed by its arguments
+    :param output_path: the file for its standard output
+    :param error_path: the file for its standard error
+    :return: the return code
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_output = os.dup(1)
+    saved_error = os.dup(2)
+    saved_argv = sys.argv
+    saved_path = list(sys.path)
+    saved_modules = set(sys.modules)
+    output = open(output_path, 'w')
+    error = open(error_path, 'w')
+    # at the file descriptor level, so output from extensions and child processes is caught too
+    os.dup2(output.fileno(), 1)
+    os.dup2(error.fileno(), 2)
+    script_directory = os.path.dirname(os.path.abspath(arguments[0]))
+    try:
+        script = arguments[0]
+        sys.argv = list(arguments)
+        # as when running the script, so its own directory is searched first for its imports
+        sys.path.insert(0, script_directory)
+        try:
+            runpy.run_path(script, run_name='__main__')
+            returncode = 0
+        except SystemExit as e:
+            returncode = get_returncode(e)
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved_output, 1)
+        os.dup2(saved_error, 2)
+        os.close(saved_output)
+        os.close(saved_error)
+        output.close()
+        error.close()
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        forget_script_modules(saved_modules, script_directory)
+        close_connections()
+    return returncode
+
+
+def run_worker(connection):
+    """
+    The main loop of a worker process: receive the arguments of an import, run it and send back its return code
+    :param connection: the worker's end of the pipe
+    """
+    for count in xrange(WORKER_MAX_JOBS):
+        job = connection.recv()
+        if job is None:
+            break
+        connection.send(run_importer(*job))
+    connection.close()
+
+
+class ImportWorker(object):
+    """
+    A worker process and the pipe to it
+    """
+
+    def __init__(self):
+        # the child must not share the parent's database connections
+        close_connections()
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=run_worker, args=(child_connection,))
+        self.process.start()
+        child_connection.close()
+        self.jobs = 0
+
+    def is_alive(self):
+        return self.jobs < WORKER_MAX_JOBS and self.process.is_alive()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+
+    def close(self):
+        if self.process.is_alive():
+            try:
+                self.connection.send(None)
+            except (IOError, OSError):
+                pass
+            self.process.join(1)
+            if self.process.is_alive():
+                self.kill()
+        self.connection.close()
+
+
+class WorkerPool(object):
+    """
+    The idle workers, started as needed
+    """
+
+    def __init__(self):
+        self.idle = []
+        # workers which are running an import
+        self.busy = []
+        # the workers are not daemons, so they have to be stopped before the import handler can exit
+        atexit.register(self.close)
+
+    def get_worker(self):
+        """
+        :return: an idle worker, started if there are none
+        """
+        worker = None
+        while self.idle and not worker:
+            worker = self.idle.pop()
+            if not worker.is_alive():
+                worker.close()
+                worker = None
+        if not worker:
+            worker = ImportWorker()
+        self.busy.append(worker)
+        return worker
+
+    def put_worker(self, worker):
+        """
+        :param worker: a worker which has finished its import
+        """
+        if worker in self.busy:
+            self.busy.remove(worker)
+        if worker.is_alive():
+            self.idle.append(worker)
+        else:
+            worker.close()
+
+    def close(self):
+        for worker in self.busy:
+            worker.kill()
+            worker.close()
+        for worker in self.idle:
+            worker.close()
+        self.busy = []
+        self.idle = []
+
+
+class WorkerJob(object):
+    """
+    An import run by a worker, with the same interface as importHandler.ImportJob
+    """
+
+    def __init__(self, pool, order, filename, registry, cmd, arguments):
+        """
+        :param pool: the WorkerPool
+        :param order: the order of the registry entry
+        :param filename: the file to import
+        :param registry: the registry entry the file matched
+        :param cmd: the command line, for the record of the import
+        :param arguments: the path to the importer script followed by its arguments
+        """
+        self.pool = pool
+        self.order = order
+        self.filename = filename
+        self.registry = registry
+        self.cmd = cmd
+        self.arguments = arguments
+        self.worker = None
+        self.deadline = None
+        self.start_time = None
+        self.end_time = None
+        self.returncode = None
+        self.stdout = None
+        self.stderr = None
+        self.output_path = None
+        self.error_path = None
+
+    def start(self):
+        try:
+            output, self.output_path = tempfile.mkstemp(prefix='import_stdout')
+            os.close(output)
+            error, self.error_path = tempfile.mkstemp(prefix='import_stderr')
+            os.close(error)
+            self.worker = self.pool.get_worker()
+            self.worker.connection.send((self.arguments, self.output_path, self.error_path))
+        except:
+            if self.worker:
+                # it may have been sent part of the job
+                self.worker.kill()
+                self.pool.put_worker(self.worker)
+                self.worker = None
+            self.close()
+            raise
+        self.worker.jobs += 1
+        self.start_time = pytz.timezone('utc').localize(datetime.datetime.utcnow())
+        self.deadline = timeit.default_timer() + self.registry['timeout']
+
+    def poll(self):
+        """
+        Check on the import, killing the worker if it has run past its timeout
+        :return: True once it has finished
+        """
+        try:
+            finished = self.worker.connection.poll()
+            if finished:
+                self.returncode = self.worker.connection.recv()
+        except (EOFError, IOError, OSError):
+            # the worker died
+            finished = True
+            self.returncode = self.worker.process.exitcode or 1
+        if not finished:
+            if timeit.default_timer() < self.deadline:
+                return False
+            self.worker.kill()
+            self.returncode = -9
+        self.end_time = pytz.timezone('utc').localize(datetime.datetime.utcnow())
+        self.pool.put_worker(self.worker)
+        self.worker = None
+        with open(self.output_path) as output:
+            self.stdout = output.read()
+        with open(self.error_path) as error:
+            self.stderr = error.read()
+        self.close()
+        return True
+
+    def close(self):
+        for path in (self.output_path, self.error_path):
+            if path and os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,348 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+A binary cache of the converted rows of a csv file, see CsvImporter.iter_cached_batches.
+The rows are stored as typed columns of one numpy record array in a .npy file in the cache directory, which later
+imports memory map instead of parsing the text again.  The name of the cache includes a hash of the path of the
+csv file and a key made from the hash of its contents and of its yaml, so a changed file or spec is parsed again.
+"""
+
+import datetime
+import hashlib
+import os
+import re
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import pytz
+
+# Change this when the layout of the cache changes, so old caches are not read
+CACHE_VERSION = 1
+CACHE_SUFFIX = '.cache.npy'
+# Where caches go if no cache directory is given, out of the way of the data and of the import handler
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'xgds_import_cache')
+
+# Prefix of the field holding the state of the values of a column, when some are None or missing
+STATE_PREFIX = '~'
+VALUE = 0
+NONE = 1
+MISSING = 2
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+# Marks a key that is not in a row
+ABSENT = object()
+
+
+class UnsupportedValue(Exception):
+    """
+    Raised when a column cannot be stored exactly, in which case the file is not cached
+    """
+    pass
+
+
+def get_cache_key(*parts):
+    """
+    :param parts: strings which determine the converted rows, ie the hash of the csv file and of the yaml
+    :return: the key as hex
+    """
+    key = hashlib.sha1(str(CACHE_VERSION))
+    for part in parts:
+        key.update('\0')
+        key.update(part)
+    return key.hexdigest()
+
+
+def get_cache_prefix(csv_file_path):
+    """
+    :param csv_file_path: the path to the csv file
+    :return: the start of the names of the caches of the file, from its name and a hash of its full path
+    """
+    path = os.path.abspath(csv_file_path)
+    return '%s.%s' % (os.path.basename(path), hashlib.sha1(path).hexdigest()[:16])
+
+
+def get_cache_path(csv_file_path, key, cache_dir=None):
+    """
+    :param csv_file_path: the path to the csv file
+    :param key: the cache key, see get_cache_key
+    :param cache_dir: the directory of the caches, defaults to DEFAULT_CACHE_DIR
+    :return: the path of the cache
+    """
+    return os.path.join(cache_dir or DEFAULT_CACHE_DIR,
+                        '%s.%s%s' % (get_cache_prefix(csv_file_path), key[:16], CACHE_SUFFIX))
+
+
+def read_cache(path):
+    """
+    :param path: the path of the cache
+    :return: the record array, memory mapped
+    """
+    return np.load(path, mmap_mode='r')
+
+
+def get_kind(value):
+    """
+    :param value: a converted value
+    :return: the kind of column which stores it exactly
+    """
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, long)):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not pytz.utc:
+            raise UnsupportedValue('%s is not a utc time' % value)
+        return 'datetime'
+    if isinstance(value, datetime.date):
+        return 'date'
+    if isinstance(value, str):
+        kind = 'str'
+    elif isinstance(value, unicode):
+        kind = 'unicode'
+    else:
+        raise UnsupportedValue('%s is a %s' % (value, type(value).__name__))
+    # numpy strips trailing nulls
+    if value.endswith('\0'):
+        raise UnsupportedValue('%r ends with a null' % value)
+    return kind
+
+
+def to_array(kind, values):
+    """
+    :param kind: the kind of the values, see get_kind
+    :param values: list of values
+    :return: the values as a numpy array
+    """
+    if kind == 'bool':
+        return np.array(values, dtype=np.bool_)
+    if kind == 'int':
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            raise UnsupportedValue('integer out of range')
+    if kind == 'float':
+        return np.array(values, dtype=np.float64)
+    if kind == 'datetime':
+        micros = []
+        for value in values:
+            delta = value - EPOCH
+            micros.append((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+        return np.array(micros, dtype=np.int64).astype('datetime64[us]')
+    if kind == 'date':
+        return np.array(values, dtype='datetime64[D]')
+    if kind == 'str':
+        return np.array(values, dtype=np.string_)
+    return np.array(values, dtype=np.unicode_)
+
+
+def from_array(array):
+    """
+    :param array: a column of the cache
+    :return: list of the values
+    """
+    values = array.tolist()
+    if array.dtype.kind == 'M' and np.datetime_data(array.dtype)[0] == 'us':
+        values = [t.replace(tzinfo=pytz.utc) for t in values]
+    return values
+
+
+class CacheColumn(object):
+    """
+    The values of one key of the rows, converted to an array a batch at a time
+    """
+
+    def __init__(self, name, count):
+        """
+        :param name: the key
+        :param count: the number of rows before the first one with this key
+        """
+        self.name = name
+        self.kind = None
+        self.arrays = []
+        self.states = []
+        if count:
+            self.states.append(np.full(count, MISSING, dtype=np.int8))
+
+    def add(self, values):
+        """
+        :param values: the values of a batch of rows, ABSENT where the row does not have the key
+        """
+        states = np.zeros(len(values), dtype=np.int8)
+        present = []
+        for index, value in enumerate(values):
+            if value is ABSENT:
+                states[index] = MISSING
+            elif value is None:
+                states[index] = NONE
+            else:
+                kind = get_kind(value)
+                if self.kind is None:
+                    self.kind = kind
+                elif kind != self.kind:
+                    raise UnsupportedValue('%s has %s and %s values' % (self.name, self.kind, kind))
+                present.append(value)
+        if present:
+            self.arrays.append(to_array(self.kind, present))
+        self.states.append(states)
+
+    def get_state(self):
+        """
+        :return: the states of all of the values, or None if every row has a value
+        """
+        states = np.concatenate(self.states)
+        if states.any():
+            return states
+        return None
+
+    def get_values(self, states):
+        """
+        :param states: see get_state
+        :return: array of all of the values, with zeros where a row has none
+        """
+        if not self.arrays:
+            # only None or missing
+            return np.zeros(len(states), dtype=np.int8)
+        present = np.concatenate(self.arrays)
+        if states is None:
+            return present
+        values = np.zeros(len(states), dtype=present.dtype)
+        values[states == VALUE] = present
+        return values
+
+
+class CacheWriter(object):
+    """
+    Collects the converted rows of a file as columns, and writes them to the cache once the whole file is read.
+    If a value cannot be stored exactly, collecting stops and no cache is written.
+    """
+
+    def __init__(self, csv_file_path, key, excluded=(), cache_dir=None):
+        """
+        :param csv_file_path: the path to the csv file
+        :param key: the cache key, see get_cache_key
+        :param excluded: keys not to store, ie those which come from the defaults
+        :param cache_dir: the directory of the caches, defaults to DEFAULT_CACHE_DIR
+        """
+        self.csv_file_path = csv_file_path
+        self.path = get_cache_path(csv_file_path, key, cache_dir)
+        self.excluded = set(excluded)
+        self.columns = OrderedDict()
+        self.count = 0
+        self.error = None
+
+    def add(self, rows):
+        """
+        Add a batch of rows.  The values are copied, so the rows can be changed afterwards.
+        :param rows: list of the converted rows
+        """
+        if self.error:
+            return
+        try:
+            for row in rows:
+                for key in row:
+                    if key not in self.columns and key not in self.excluded:
+                        self.columns[key] = CacheColumn(key, self.count)
+            for key, column in self.columns.iteritems():
+                column.add([row.get(key, ABSENT) for row in rows])
+            self.count += len(rows)
+        except UnsupportedValue as e:
+            self.error = e
+            self.columns = None
+
+    def get_records(self):
+        """
+        :return: the record array of all of the rows
+        """
+        fields = []
+        arrays = []
+        for key, column in self.columns.iteritems():
+            states = column.get_state()
+            values = column.get_values(states)
+            fields.append((str(key), values.dtype))
+            arrays.append(values)
+            if states is not None:
+                fields.append((STATE_PREFIX + str(key), states.dtype))
+                arrays.append(states)
+        records = np.zeros(self.count, dtype=fields)
+        for (name, dtype), array in zip(fields, arrays):
+            records[name] = array
+        return records
+
+    def write(self):
+        """
+        Write the cache, replacing any caches of older versions of the file or yaml.  The cache is only an
+        optimization, so if it cannot be written the import carries on without it.
+        :return: True if it was written
+        """
+        if self.error:
+            print 'not caching %s: %s' % (self.path, self.error)
+            return False
+        records = self.get_records()
+        directory = os.path.dirname(self.path)
+        temp_path = self.path + '.tmp'
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # only the caches of this file, not those of files whose names start the same
+            stale = re.compile(re.escape(get_cache_prefix(self.csv_file_path)) + r'\.[0-9a-f]{16}' +
+                               re.escape(CACHE_SUFFIX) + '$')
+            for name in os.listdir(directory):
+                if stale.match(name):
+                    os.remove(os.path.join(directory, name))
+            with open(temp_path, 'wb') as cache_file:
+                np.save(cache_file, records)
+            os.rename(temp_path, self.path)
+        except (IOError, OSError) as e:
+            print 'Warning: could not write the cache %s: %s' % (self.path, e)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+        return True
+
+
+def iter_cached_batches(records, batch_size, defaults=None):
+    """
+    Read the rows back from the cache
+    :param records: the record array, see read_cache
+    :param batch_size: the maximum number of rows in each list
+    :param defaults: dictionary of values to add to every row
+    :return: a generator of lists of rows as dicts
+    """
+    if not defaults:
+        defaults = {}
+    names = [name for name in records.dtype.names if not name.startswith(STATE_PREFIX)]
+    for start in xrange(0, len(records), batch_size):
+        chunk = records[start:start + batch_size]
+        columns = []
+        for name in names:
+            state_name = STATE_PREFIX + name
+            states = chunk[state_name].tolist() if state_name in records.dtype.names else None
+            columns.append((name, from_array(chunk[name]), states))
+        rows = []
+        for index in xrange(len(chunk)):
+            row = dict(defaults)
+            for name, values, states in columns:
+                if states is None or states[index] == VALUE:
+                    row[name] = values[index]
+                elif states[index] == NONE:
+                    row[name] = None
+            rows.append(row)
+        yield rows
@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+#  __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+Benchmark matching files to registry rules.  A synthetic tree of empty files is written, like the data delivered
+for a flight, with rules in the style of example/ImportHandlerConfig.yaml.  The files are matched by running each
+uncompiled pattern in turn, as the import handler used to, and with the RegistryMatcher, and the results compared.
+"""
+
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import timeit
+
+from registryMatcher import RegistryMatcher
+
+IGNORE_RULES = [{'name': 'Resource forks', 'filepath_pattern': '/\._', 'ignore': True},
+                {'name': 'Emacs backups', 'filepath_pattern': '~$', 'ignore': True},
+                {'name': 'DS Store', 'filepath_pattern': '/\.?_?DS_Store', 'ignore': True},
+                {'name': 'DSLR Raw file', 'filepath_pattern': 'SLR./[\d\w]*\.(?i)(CR)2$', 'ignore': True}]
+
+
+def make_registry(rule_count):
+    """
+    :param rule_count: the number of rules
+    :return: list of registry entries, one per instrument directory plus the ignore rules
+    """
+    registry = []
+    for index in range(rule_count - len(IGNORE_RULES)):
+        instrument = 'INST%02d' % index
+        kind = index % 3
+        if kind == 0:
+            pattern = '%s/[\d\-\.]+_%s\.csv$' % (instrument, instrument)
+        elif kind == 1:
+            pattern = '%s/[\d\-\.]+_(pc|\d+)\.jpg$' % instrument
+        else:
+            pattern = '%s/[\d]*_%s_[LS]W.*\.txt' % (instrument, instrument)
+        registry.append({'name': instrument, 'filepath_pattern': pattern})
+    return registry + IGNORE_RULES
+
+
+def make_names(registry, file_count):
+    """
+    :param registry: the registry, see make_registry
+    :param file_count: the number of files
+    :return: list of relative paths; most match one rule, some are ignored and some match none
+    """
+    instruments = [entry['name'] for entry in registry if 'ignore' not in entry]
+    names = []
+    for index in range(file_count):
+        instrument = random.choice(instruments)
+        kind = int(instrument[4:]) % 3
+        seconds = 1546300800 + index
+        roll = random.random()
+        if roll < 0.02:
+            name = '._%d.csv' % seconds
+        elif roll < 0.04:
+            name = '%d.csv~' % seconds
+        elif roll < 0.06:
+            name = 'notes_%d.doc' % seconds
+        elif kind == 0:
+            name = '%d.%04d_%s.csv' % (seconds, index % 10000, instrument)
+        elif kind == 1:
+            name = '%d.%04d_%d.jpg' % (seconds, index % 10000, index % 7)
+        else:
+            name = '%d_%s_%sW_%d.txt' % (seconds, instrument, random.choice('LS'), index)
+        names.append(os.path.join(instrument, name))
+    return names
+
+
+def write_tree(root, names):
+    """
+    Write an empty file for each name
+    :param root: the directory to write to
+    :param names: the relative paths
+    """
+    for name in names:
+        path = os.path.join(root, name)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        open(path, 'w').close()
+
+
+def walk(root):
+    """
+    :param root: the top of the tree
+    :return: list of the full paths of the files
+    """
+    filenames = []
+    for dirName, subdirList, fileList in os.walk(root, followlinks=True):
+        for basename in fileList:
+            filenames.append(os.path.join(dirName, basename))
+    return filenames
+
+
+def match_each(registry, filename):
+    """
+    Match the way the import handler did before the RegistryMatcher
+    """
+    matches = []
+    for r in registry:
+        match = re.search(r['filepath_pattern'], filename)
+        if match:
+            matches.append(r)
+    return matches
+
+
+def time_matching(fcn, filenames):
+    """
+    :param fcn: function of a filename returning the list of matching entries
+    :param filenames: the files
+    :return: tuple of the seconds taken and the results
+    """
+    start = timeit.default_timer()
+    results = [fcn(filename) for filename in filenames]
+    return timeit.default_timer() - start, results
+
+
+def main():
+    import optparse
+
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('-n', '--files', type='int', default=100000, help='number of files in the tree')
+    parser.add_option('-r', '--rules', type='int', default=50, help='number of registry rules')
+    parser.add_option('-d', '--directory', help='write the tree here and keep it, instead of a temporary directory')
+    parser.add_option('--seed', type='int', default=0, help='random seed for the tree')
+
+    opts, args = parser.parse_args()
+    random.seed(opts.seed)
+
+    registry = make_registry(opts.rules)
+    root = opts.directory or tempfile.mkdtemp(prefix='registryBenchmark')
+    try:
+        write_tree(root, make_names(registry, opts.files))
+
+        start = timeit.default_timer()
+        filenames = walk(root)
+        walk_seconds = timeit.default_timer() - start
+
+        each_seconds, expected = time_matching(lambda f: match_each(registry, f), filenames)
+        start = timeit.default_timer()
+        matcher = RegistryMatcher(registry)
+        compile_seconds = timeit.default_timer() - start
+        matcher_seconds, results = time_matching(matcher.match, filenames)
+    finally:
+        if not opts.directory:
+            shutil.rmtree(root)
+
+    unique = sum(1 for r in results if len(r) == 1)
+    print '%d files, %d rules: %d unique, %d unmatched, %d ambiguous' % (
+        len(filenames), len(registry), unique, sum(1 for r in results if not r),
+        sum(1 for r in results if len(r) > 1))
+    print 'walk               %8.3f s' % walk_seconds
+    print 'each pattern       %8.3f s' % each_seconds
+    print 'registry matcher   %8.3f s (compiled in %.3f s), %.1fx' % (
+        matcher_seconds, compile_seconds, each_seconds / matcher_seconds if matcher_seconds else 0.0)
+    if results != expected:
+        print 'ERROR: the registry matcher results differ'
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
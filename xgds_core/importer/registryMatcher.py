@@ -0,0 +1,160 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+Matches filenames against the filepath_pattern rules of an import registry, as used by the import handler and
+the timestamp validator.  The patterns are compiled once, and the literal text each pattern requires is used to
+skip the rules that cannot match before any regular expression is run.
+"""
+
+import re
+import sre_parse
+import sre_constants
+
+# Rules whose pattern does not end with a literal extension
+ANY_EXTENSION = None
+
+
+def get_literals(pattern):
+    """
+    Find the literal text a pattern requires, from its leading and trailing literal characters.
+    Returns nothing for case insensitive patterns, and for alternations at the top of the pattern.
+    :param pattern: the regular expression
+    :return: tuple of the leading literal, which must be found in a matching name, and the trailing literal
+    which a matching name must end with; either may be ''
+    """
+    parsed = sre_parse.parse(pattern)
+    if parsed.pattern.flags & re.IGNORECASE:
+        return '', ''
+    items = list(parsed)
+
+    to_character = unichr if isinstance(pattern, unicode) else chr
+
+    leading = []
+    for op, value in items:
+        if op != sre_constants.LITERAL:
+            break
+        leading.append(to_character(value))
+
+    trailing = []
+    if items and items[-1] == (sre_constants.AT, sre_constants.AT_END):
+        for op, value in reversed(items[:-1]):
+            if op != sre_constants.LITERAL:
+                break
+            trailing.append(to_character(value))
+    return ''.join(leading), ''.join(reversed(trailing))
+
+
+def get_extension(name):
+    """
+    :param name: a file name or a literal a name ends with
+    :return: the text from the last dot, or None if there is no dot
+    """
+    index = name.rfind('.')
+    if index < 0 or '/' in name[index:]:
+        return None
+    return name[index:]
+
+
+class RegistryRule(object):
+    """
+    A registry entry with its compiled pattern
+    """
+
+    def __init__(self, index, entry):
+        """
+        :param index: the position of the entry in the registry
+        :param entry: the registry entry, a dictionary with a filepath_pattern
+        """
+        self.index = index
+        self.entry = entry
+        self.regex = re.compile(entry['filepath_pattern'])
+        self.leading, self.trailing = get_literals(entry['filepath_pattern'])
+        self.extension = get_extension(self.trailing) if self.trailing else ANY_EXTENSION
+
+    def search(self, filename):
+        """
+        :param filename: the full path of the file
+        :return: the match, or None
+        """
+        if self.leading and self.leading not in filename:
+            return None
+        if self.trailing and not filename.endswith(self.trailing):
+            # $ also matches before a final newline
+            if not filename.endswith(self.trailing + '\n'):
+                return None
+        return self.regex.search(filename)
+
+
+class RegistryMatcher(object):
+    """
+    Finds the registry entries matching a filename, with the same results as running re.search with each
+    filepath_pattern in turn
+    """
+
+    def __init__(self, registry):
+        """
+        :param registry: list of registry entries, each a dictionary with a filepath_pattern
+        """
+        self.rules = [RegistryRule(index, entry) for index, entry in enumerate(registry)]
+        self.rules_by_entry = {id(rule.entry): rule for rule in self.rules}
+        # the rules to check for each extension, so a file is only checked against the rules for its extension and
+        # those which do not end with one
+        self.any_extension_rules = [rule for rule in self.rules if rule.extension is ANY_EXTENSION]
+        self.rules_by_extension = {}
+        for rule in self.rules:
+            if rule.extension is not ANY_EXTENSION and rule.extension not in self.rules_by_extension:
+                self.rules_by_extension[rule.extension] = [r for r in self.rules
+                                                           if r.extension in (rule.extension, ANY_EXTENSION)]
+
+    def get_candidates(self, filename):
+        """
+        :param filename: the full path of the file
+        :return: the rules which may match, in registry order
+        """
+        if filename.endswith('\n'):
+            # $ also matches before a final newline, so the literal endings do not apply
+            return self.rules
+        return self.rules_by_extension.get(get_extension(filename), self.any_extension_rules)
+
+    def match(self, filename):
+        """
+        :param filename: the full path of the file
+        :return: list of the matching registry entries, in registry order.  One entry is a unique match, none is
+        unmatched and more than one is ambiguous.
+        """
+        matches = []
+        for rule in self.get_candidates(filename):
+            # RegistryRule.search, inlined as this runs for every rule and file
+            if rule.leading and rule.leading not in filename:
+                continue
+            if rule.trailing and not filename.endswith(rule.trailing) and \
+                    not filename.endswith(rule.trailing + '\n'):
+                continue
+            if rule.regex.search(filename):
+                matches.append(rule.entry)
+        return matches
+
+    def search(self, entry, filename):
+        """
+        :param entry: a registry entry
+        :param filename: the full path of the file
+        :return: the match of the entry's compiled pattern, for its groups
+        """
+        rule = self.rules_by_entry.get(id(entry))
+        if rule:
+            return rule.regex.search(filename)
+        return re.search(entry['filepath_pattern'], filename)
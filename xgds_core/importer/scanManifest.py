@@ -0,0 +1,198 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+A record of a directory tree as of the last scan, see ScanManifest.
+A directory's modification time changes when a file is added to it, removed from it or renamed, so a directory
+whose modification time has not changed since the last scan is not listed again and the files in it are not
+stat'ed; only its subdirectories are checked.  Files changed in place in an unchanged directory are only seen
+by a full scan.
+"""
+
+import os
+import stat
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Change this when the layout of the manifest changes, so old manifests are not read
+MANIFEST_VERSION = 1
+
+# Modification times this close to the scan are not trusted, as the directory or file may change again within
+# the resolution of the file system's timestamps
+RACY_SECONDS = 2
+
+
+class ScanManifest(object):
+    """
+    The directories of a tree, each with its modification time, subdirectories and the size and modification
+    time of each of its files.  It can be kept in memory between scans, and saved to a file for the next run.
+    """
+
+    def __init__(self, path=None, key=''):
+        """
+        :param path: the file to load the manifest from and save it to, or None to keep it in memory only
+        :param key: a string which must match for a saved manifest to be used, ie the hash of the registry
+        """
+        self.path = path
+        self.key = key
+        # directory to (mtime, list of subdirectory names, dictionary of file name to (size, mtime))
+        self.directories = {}
+        self.root = None
+        self.followlinks = None
+        self.dirty = False
+        # counts from the last scan
+        self.listed_directories = 0
+        self.skipped_directories = 0
+        self.unchanged_files = 0
+        if path:
+            self.load()
+
+    def load(self):
+        """
+        Load the saved manifest, if there is one for this key
+        :return: True if it was loaded
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as manifest_file:
+                saved = pickle.load(manifest_file)
+        except Exception as e:
+            print 'Ignoring scan manifest %s: %s' % (self.path, e)
+            return False
+        if saved.get('version') != MANIFEST_VERSION or saved.get('key') != self.key:
+            print 'Ignoring scan manifest %s, it is for another version or configuration' % self.path
+            return False
+        self.root = saved['root']
+        self.followlinks = saved['followlinks']
+        self.directories = saved['directories']
+        return True
+
+    def save(self):
+        """
+        Save the manifest, if it has changed since it was loaded or saved
+        :return: True if it was written
+        """
+        if not self.path or not self.dirty:
+            return False
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as manifest_file:
+            pickle.dump({'version': MANIFEST_VERSION,
+                         'key': self.key,
+                         'root': self.root,
+                         'followlinks': self.followlinks,
+                         'directories': self.directories}, manifest_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, self.path)
+        self.dirty = False
+        return True
+
+    def list_directory(self, directory, record, followlinks, changed_only, filenames, racy_time):
+        """
+        List a directory and stat everything in it
+        :return: the new record of the directory
+        """
+        old_files = record[2] if record else {}
+        subdirs = []
+        files = {}
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # gone, or a broken link
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                if followlinks or not os.path.islink(path):
+                    subdirs.append(name)
+                continue
+            state = (st.st_size, st.st_mtime if st.st_mtime < racy_time else None)
+            files[name] = state
+            if not changed_only or old_files.get(name) != state or state[1] is None:
+                filenames.append(path)
+        st = os.stat(directory)
+        mtime = st.st_mtime if st.st_mtime < racy_time else None
+        return mtime, subdirs, files
+
+    def scan(self, root, followlinks=True, changed_only=False, full=False):
+        """
+        Find the files in a tree, listing only the directories which have changed since the last scan
+        :param root: the top of the tree
+        :param followlinks: descend into symbolic links to directories, as with os.walk
+        :param changed_only: only return files which are new, or whose size or modification time has changed
+        :param full: list every directory, to find files which were changed in place
+        :return: list of the full paths of the files
+        """
+        if root != self.root or followlinks != self.followlinks:
+            self.directories = {}
+            self.root = root
+            self.followlinks = followlinks
+        racy_time = time.time() - RACY_SECONDS
+        self.listed_directories = 0
+        self.skipped_directories = 0
+        self.unchanged_files = 0
+
+        filenames = []
+        directories = {}
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            if directory in directories:
+                # a link back into the tree
+                continue
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                continue
+            record = self.directories.get(directory)
+            if not full and record and record[0] is not None and record[0] == mtime:
+                self.skipped_directories += 1
+                if changed_only:
+                    self.unchanged_files += len(record[2])
+                else:
+                    filenames.extend(os.path.join(directory, name) for name in record[2])
+            else:
+                try:
+                    record = self.list_directory(directory, record, followlinks, changed_only, filenames,
+                                                 racy_time)
+                except OSError:
+                    continue
+                self.listed_directories += 1
+                self.dirty = True
+            directories[directory] = record
+            pending.extend(os.path.join(directory, name) for name in reversed(record[1]))
+
+        if len(directories) != len(self.directories):
+            self.dirty = True
+        self.directories = directories
+        return filenames
+
+    def forget(self, filename):
+        """
+        Forget a file, so it is found by the next scan with changed_only, ie after its import failed
+        :param filename: the full path of the file
+        """
+        directory, name = os.path.split(filename)
+        record = self.directories.get(directory)
+        if record:
+            files = dict(record[2])
+            files.pop(name, None)
+            # list the directory again
+            self.directories[directory] = (None, record[1], files)
+            self.dirty = True
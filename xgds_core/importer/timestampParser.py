@@ -0,0 +1,190 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+Fast parsing of the timestamps found in import files.
+dateutil can parse almost anything but it is slow, and telemetry files use the same layout on every row.
+The TimestampParser detects the iso8601 layout from the first value it sees and parses the following values
+with a fixed pattern, falling back to dateutil for anything that does not match.
+"""
+
+import re
+import datetime
+from datetime import timedelta
+
+import pytz
+from dateutil.parser import parse as dateparser
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Formats which are not strptime format strings
+ISO8601 = 'iso8601'
+UNIXTIME_FLOAT_SECOND = 'unixtime_float_second'
+UNIXTIME_INT_MICROSECOND = 'unixtime_int_microsecond'
+TIME_FORMATS = (ISO8601, UNIXTIME_FLOAT_SECOND, UNIXTIME_INT_MICROSECOND)
+
+# Names used by the timestamp validator config
+FORMAT_ALIASES = {'seconds': UNIXTIME_FLOAT_SECOND,
+                  'microseconds': UNIXTIME_INT_MICROSECOND,
+                  'dateparser': ISO8601}
+
+ISO8601_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})([T ])(\d{2}):(\d{2}):(\d{2})(\.\d{1,6})?'
+                             r'(Z|[+-]\d{2}(?::?\d{2})?)?$')
+
+ONE_HOUR = timedelta(hours=1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def is_supported_format(time_format):
+    """
+    :param time_format: the format from the yaml
+    :return: True if the format is one of TIME_FORMATS, an alias for one, or a strptime format string
+    """
+    return time_format in TIME_FORMATS or time_format in FORMAT_ALIASES or '%' in time_format
+
+
+def build_iso8601_pattern(value):
+    """
+    Build a regex for exactly the iso8601 layout of the given value, ie the separator, number of fractional
+    digits and the form of the timezone.
+    :param value: a sample time string
+    :return: the compiled regex, or None if the value is not in a layout we can parse without dateutil
+    """
+    match = ISO8601_PATTERN.match(value)
+    if not match:
+        return None
+    separator, fraction, zone = match.group(4, 8, 9)
+    pattern = r'(\d{4})-(\d{2})-(\d{2})%s(\d{2}):(\d{2}):(\d{2})' % separator
+    if fraction:
+        pattern += r'\.(\d{%d})' % (len(fraction) - 1)
+    else:
+        pattern += '()'
+    if not zone:
+        pattern += '()'
+    elif zone == 'Z':
+        pattern += '(Z)'
+    elif ':' in zone:
+        pattern += r'([+-]\d{2}:\d{2})'
+    elif len(zone) > 3:
+        pattern += r'([+-]\d{4})'
+    else:
+        pattern += r'([+-]\d{2})'
+    return re.compile(pattern + '$')
+
+
+def get_offset_minutes(zone):
+    """
+    :param zone: the timezone part of an iso8601 string, ie Z, +07, -0700 or -07:00
+    :return: the offset from utc in minutes
+    """
+    if zone == 'Z':
+        return 0
+    digits = zone[1:].replace(':', '')
+    minutes = int(digits[:2]) * 60
+    if len(digits) > 2:
+        minutes += int(digits[2:])
+    if zone[0] == '-':
+        return -minutes
+    return minutes
+
+
+class TimestampParser(object):
+    """
+    Parses time strings of one format into timezone aware utc datetimes.
+    Times without a timezone are in the given timezone; the offset is looked up once per hour of local time.
+    """
+
+    def __init__(self, time_format=ISO8601, timezone=pytz.utc):
+        """
+        :param time_format: iso8601, unixtime_float_second, unixtime_int_microsecond or a strptime format string
+        :param timezone: the pytz timezone of times which do not include one
+        """
+        time_format = FORMAT_ALIASES.get(time_format, time_format)
+        if not is_supported_format(time_format):
+            raise ValueError('Unsupported time format %s' % time_format)
+        self.time_format = time_format
+        self.timezone = timezone
+        self.is_utc = timezone.zone == 'UTC'
+        # the fixed pattern for the detected iso8601 layout
+        self.pattern = None
+        # utc offsets by hour of local time
+        self.offsets = {}
+
+    def parse(self, value):
+        """
+        Parse a time string
+        :param value: the string
+        :return: the timezone aware time in utc
+        """
+        if self.time_format == UNIXTIME_FLOAT_SECOND:
+            # unix time is always UTC
+            return datetime.datetime.utcfromtimestamp(float(value)).replace(tzinfo=pytz.utc)
+        elif self.time_format == UNIXTIME_INT_MICROSECOND:
+            # keep every microsecond; going through float seconds can round the last one
+            return (EPOCH + timedelta(microseconds=int(value))).replace(tzinfo=pytz.utc)
+        the_time = self.parse_datetime(value)
+        return self.to_utc(the_time)
+
+    def parse_datetime(self, value):
+        """
+        Parse a time string without converting it to utc
+        :param value: the string
+        :return: the time, naive if the string has no timezone
+        """
+        if self.time_format != ISO8601:
+            return datetime.datetime.strptime(value, self.time_format)
+
+        match = self.pattern.match(value) if self.pattern else None
+        if not match:
+            # first value, or the layout changed
+            self.pattern = build_iso8601_pattern(value)
+            match = self.pattern.match(value) if self.pattern else None
+            if not match:
+                return dateparser(value)
+        year, month, day, hour, minute, second, fraction, zone = match.groups()
+        try:
+            the_time = datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                                         int(fraction.ljust(6, '0')) if fraction else 0)
+        except ValueError:
+            # for example leap seconds; let dateutil decide
+            return dateparser(value)
+        if zone:
+            offset = get_offset_minutes(zone)
+            if offset:
+                return the_time.replace(tzinfo=pytz.FixedOffset(offset))
+            return the_time.replace(tzinfo=pytz.utc)
+        return the_time
+
+    def to_utc(self, the_time):
+        """
+        Convert a time to utc, treating naive times as being in our timezone
+        :param the_time: the datetime
+        :return: the timezone aware time in utc
+        """
+        if the_time.tzinfo and the_time.tzinfo.utcoffset(the_time) is not None:
+            return the_time.astimezone(pytz.utc)
+        if self.is_utc:
+            return the_time.replace(tzinfo=pytz.utc)
+
+        hour = the_time.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+        offset = self.offsets.get(hour)
+        if offset is None:
+            offset = self.timezone.localize(hour).utcoffset()
+            if offset != self.timezone.localize(hour + ONE_HOUR - ONE_MICROSECOND).utcoffset():
+                # the offset changes within this hour so it cannot be cached
+                return self.timezone.localize(the_time).astimezone(pytz.utc)
+            self.offsets[hour] = offset
+        return (the_time - offset).replace(tzinfo=pytz.utc)
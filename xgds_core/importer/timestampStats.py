@@ -0,0 +1,104 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+"""
+Statistics of the timestamps from one source, kept as they are found instead of keeping every timestamp, see
+TimestampValidator.
+"""
+
+# Number of timestamps kept for plotting, per source
+SAMPLE_SIZE = 1000
+
+# Number of timestamps before the start time kept to report, per source
+MAX_EXAMPLES = 10
+
+
+class TimestampStats(object):
+    """
+    The count, first and last of the timestamps from a source, the ones before the start time, and an evenly
+    spaced sample of them for plotting.  The sample holds every stride'th timestamp; when it grows to twice the
+    sample size every other one is dropped and the stride doubles, so it never holds more than that.
+    """
+
+    def __init__(self, start_time=None, sample_size=SAMPLE_SIZE):
+        """
+        :param start_time: timestamps before this are counted as errors, if given
+        :param sample_size: the number of timestamps to keep for plotting
+        """
+        self.start_time = start_time
+        self.sample_size = sample_size
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.before_start = 0
+        # (label, timestamp) of the first few timestamps before the start time
+        self.examples = []
+        self.sample = []
+        self.stride = 1
+
+    def add(self, timestamp, label=None):
+        """
+        :param timestamp: the timestamp
+        :param label: what to call it if it is before the start time, ie the file name
+        """
+        if self.count % self.stride == 0:
+            self.sample.append(timestamp)
+            if len(self.sample) >= 2 * self.sample_size:
+                self.decimate()
+        self.count += 1
+        if self.first is None or timestamp < self.first:
+            self.first = timestamp
+        if self.last is None or timestamp > self.last:
+            self.last = timestamp
+        if self.start_time and timestamp < self.start_time:
+            self.before_start += 1
+            if len(self.examples) < MAX_EXAMPLES:
+                self.examples.append((label, timestamp))
+
+    def decimate(self):
+        self.sample = self.sample[::2]
+        self.stride *= 2
+
+    def merge(self, other):
+        """
+        Add the statistics of more timestamps from the same source, ie those of another file
+        :param other: the TimestampStats of the timestamps which came after these
+        """
+        if not other.count:
+            return
+        # bring both samples to the same stride
+        while self.stride < other.stride:
+            self.decimate()
+        step = self.stride // other.stride
+        # continue the spacing of our sample into the other's
+        offset = (-self.count % self.stride) // other.stride
+        self.sample.extend(other.sample[offset::step])
+        while len(self.sample) >= 2 * self.sample_size:
+            self.decimate()
+
+        self.count += other.count
+        if self.first is None or other.first < self.first:
+            self.first = other.first
+        if self.last is None or other.last > self.last:
+            self.last = other.last
+        self.before_start += other.before_start
+        self.examples.extend(other.examples[:MAX_EXAMPLES - len(self.examples)])
+
+    def get_plot_times(self):
+        """
+        :return: sorted list of the sampled timestamps, with the first and last
+        """
+        return sorted(self.sample + [self.first, self.last])
@@ -25,16 +25,46 @@ import yaml
 import os
 import re
 import datetime
+import multiprocessing
+import timeit
+import traceback
+from collections import OrderedDict
 import pytz
 
 from PNGinfo import PNGinfo
-import PIL.Image
-import PIL.ExifTags
+from timestampParser import TimestampParser
+from registryMatcher import RegistryMatcher
+from scanManifest import ScanManifest
+from timestampStats import TimestampStats
+from exifReader import get_exif_timestamp
 
 from csv import DictReader
 from dateutil.parser import parse as dateparser
 
 
+# Parsers by time format, shared across files so the layout is only detected once
+TIMESTAMP_PARSERS = {}
+
+# The validator used by the worker processes of TimestampValidator.process_files, inherited when the pool forks
+WORKER_VALIDATOR = None
+
+# Seconds between progress reports while processing files
+PROGRESS_SECONDS = 10
+
+QUIET = False
+
+
+def get_timestamp_parser(time_format):
+    """
+    Get the shared utc TimestampParser for a time format
+    :param time_format: seconds, microseconds, dateparser, iso8601 or a strptime format string
+    :return: the TimestampParser
+    """
+    if time_format not in TIMESTAMP_PARSERS:
+        TIMESTAMP_PARSERS[time_format] = TimestampParser(time_format)
+    return TIMESTAMP_PARSERS[time_format]
+
+
 def get_timestamp_from_filename(filename, time_format, regex=None):
     """
     Returns a utz timezone aware time parsed from the filename given the time format & regex
@@ -51,7 +81,7 @@ def get_timestamp_from_filename(filename, time_format, regex=None):
         match = re.search(timestamp_pattern, filename)
         if match:
             timestamp_string = match.groups()[-1]
-            result = datetime.datetime.utcfromtimestamp(float(timestamp_string)).replace(tzinfo=pytz.UTC)
+            result = get_timestamp_parser(time_format).parse(timestamp_string)
         else:
             raise ValueError('Could not find expected time string in %s' % filename)
 
@@ -60,7 +90,7 @@ def get_timestamp_from_filename(filename, time_format, regex=None):
         match = re.search(timestamp_pattern, filename)
         if match:
             timestamp_string = match.groups()[-1]
-            result = datetime.datetime.utcfromtimestamp(1e-6 * int(timestamp_string)).replace(tzinfo=pytz.UTC)
+            result = get_timestamp_parser(time_format).parse(timestamp_string)
         else:
             raise ValueError('Could not find expected time string in %s' % filename)
     elif time_format == 'dateparser':
@@ -74,7 +104,7 @@ def get_timestamp_from_filename(filename, time_format, regex=None):
                 else:
                     timestamp_string = match.groups()[-1]
 
-                zoneless_timestamp = dateparser(timestamp_string)
+                zoneless_timestamp = get_timestamp_parser(time_format).parse_datetime(timestamp_string)
                 result = pytz.utc.localize(zoneless_timestamp)
             else:
                 raise ValueError('Could not find expected time string in %s' % filename)
@@ -85,11 +115,24 @@ def get_timestamp_from_filename(filename, time_format, regex=None):
         raise ValueError('invalid type for filename timestamp: %s' % time_format)
     return result
 
+
+def extract_timestamps(index):
+    """
+    Get the timestamps of one of the files to process with WORKER_VALIDATOR, in a worker process
+    :param index: the index of the file in files_to_process
+    :return: see TimestampValidator.extract_timestamps
+    """
+    return WORKER_VALIDATOR.extract_timestamps(index)
+
+
 class TimestampValidator:
-    def __init__(self, config_yaml_path):
+    def __init__(self, config_yaml_path, manifest_path=None, start_time=None):
         # config comes from a YAML file
         self.config = yaml.load(open(config_yaml_path))
         self.registry = self.config['registry']
+        self.matcher = RegistryMatcher(self.registry)
+        # The tree as of the last run, so unchanged directories are not listed again
+        self.manifest = ScanManifest(manifest_path)
         # Local copy of processed files, which are also tracked in the database
         # in order to keep state when the import finder is restarted and for
         # reporting import status to users
@@ -101,43 +144,42 @@ class TimestampValidator:
         self.unmatched_files = [] # matched no config rule
         self.timestamps_that_failed = [] # tried to import and failed
         self.timestamps_that_succeeded = [] # tried and succeeded
-        # The actual timestamps
-        self.timestamps = []
+        # Timestamps before this are errors
+        self.start_time = start_time
+        # The statistics of the actual timestamps, source name to TimestampStats
+        self.timestamps = OrderedDict()
+        # Registry name to [files, timestamps, seconds spent getting them]
+        self.source_stats = {}
+        self.duration = None
 
     def find_files(self, root_dir):
-        for dirName, subdirList, fileList in os.walk(root_dir):
-            # print('Found directory: %s' % dirName)
-            for basename in fileList:
-                filename = os.path.join(dirName, basename)
-
-                # Identify which importer to use, and make sure it's a unique match
-                matches = []
-                for r in self.registry:
-                    #print r['filepath_pattern']
-                    match = re.search(r['filepath_pattern'], filename)
-                    if match:
-                        matches.append(r)
-                if 1 == len(matches):
-                    if 'ignore' in matches[0] and matches[0]['ignore']:
-                        # matched an explicit ignore rule
-                        if not QUIET:
-                            print 'Ignoring', basename
-                        self.ignored_files.append(filename)
-                        continue
+        for filename in self.manifest.scan(root_dir, followlinks=False):
+            basename = os.path.basename(filename)
+
+            # Identify which importer to use, and make sure it's a unique match
+            matches = self.matcher.match(filename)
+            if 1 == len(matches):
+                if 'ignore' in matches[0] and matches[0]['ignore']:
+                    # matched an explicit ignore rule
                     if not QUIET:
-                        print 'Adding', basename
-                    # unique match, add to the list of things to import
-                    self.files_to_process.append((filename, matches[0]))
-                elif 0 == len(matches):
-                    if not QUIET:
-                        print 'Warning: file %s does not match any importer config' % filename
-                    self.unmatched_files.append(filename)
-                else:
-                    if not QUIET:
-                        print 'Warning: file %s matches more than one importer config' % filename
-                        for m in matches:
-                            print m
-                    self.ambiguous_files.append(filename)
+                        print 'Ignoring', basename
+                    self.ignored_files.append(filename)
+                    continue
+                if not QUIET:
+                    print 'Adding', basename
+                # unique match, add to the list of things to import
+                self.files_to_process.append((filename, matches[0]))
+            elif 0 == len(matches):
+                if not QUIET:
+                    print 'Warning: file %s does not match any importer config' % filename
+                self.unmatched_files.append(filename)
+            else:
+                if not QUIET:
+                    print 'Warning: file %s matches more than one importer config' % filename
+                    for m in matches:
+                        print m
+                self.ambiguous_files.append(filename)
+        self.manifest.save()
 
         if not QUIET:
             print 'Identified files to process:'
@@ -147,23 +189,104 @@ class TimestampValidator:
             if not QUIET:
                 print '%s' % (filename)
 
-    def process_files(self, username=None, password=None):
-        for pair in self.files_to_process:
-            filename, registry = pair
-            if 'from' in registry:
-                if registry['from'] == 'filename':
-                    self.get_timestamp_from_filename(filename, registry)
-                elif registry['from'] == 'csv':
-                    self.get_timestamps_from_csv(filename, registry)
-                elif registry['from'] == 'exif':
-                    self.get_timestamp_from_exif(filename, registry)
-                elif registry['from'] == 'doc':
-                    self.get_timestamp_from_doc(filename, registry)
-                elif registry['from'] == 'text':
-                    # TODO IMPLEMENT for example for html parsing
-                    pass
-                else:
-                    raise ValueError('Invalid from argument: %s' % registry['from'])
+    def process_files(self, username=None, password=None, processes=1):
+        """
+        Get the timestamps of the files to process, in worker processes if there is more than one.  The timestamps
+        are merged in the order of the files, so they are the same as with one process.
+        :param processes: the number of worker processes
+        """
+        total = len(self.files_to_process)
+        start = timeit.default_timer()
+        last_report = start
+        for index, (timestamps, seconds, error, error_traceback) in enumerate(
+                self.iter_extracted(min(processes, total))):
+            count = 0
+            for name, stats in timestamps.iteritems():
+                if name not in self.timestamps:
+                    self.timestamps[name] = TimestampStats(self.start_time)
+                self.timestamps[name].merge(stats)
+                count += stats.count
+            if error:
+                # the traceback of the error is lost on its way back from a worker process
+                print >> sys.stderr, 'Error getting timestamps from %s:' % self.files_to_process[index][0]
+                print >> sys.stderr, error_traceback
+                raise error
+            name = self.files_to_process[index][1].get('name')
+            stats = self.source_stats.setdefault(name, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += count
+            stats[2] += seconds
+
+            now = timeit.default_timer()
+            if not QUIET and now - last_report >= PROGRESS_SECONDS:
+                print 'Processed %d of %d files, %.1f files/s' % (index + 1, total, (index + 1) / (now - start))
+                last_report = now
+        self.duration = timeit.default_timer() - start
+
+    def iter_extracted(self, processes):
+        """
+        Get the timestamps of each file to process, in worker processes if there is more than one
+        :param processes: the number of worker processes
+        :return: a generator of the results of extract_timestamps, in the order of the files
+        """
+        if processes <= 1:
+            for index in xrange(len(self.files_to_process)):
+                yield self.extract_timestamps(index)
+            return
+
+        global WORKER_VALIDATOR
+        WORKER_VALIDATOR = self
+        pool = multiprocessing.Pool(processes)
+        try:
+            # enough files per task to keep the workers busy between results, but few enough to balance the load
+            chunksize = max(1, min(100, len(self.files_to_process) / (processes * 4)))
+            for result in pool.imap(extract_timestamps, xrange(len(self.files_to_process)), chunksize):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            WORKER_VALIDATOR = None
+
+    def extract_timestamps(self, index):
+        """
+        Get the timestamps of one of the files to process, without adding them to self.timestamps
+        :param index: the index of the file in files_to_process
+        :return: tuple of the dictionary of source name to the TimestampStats of the file, the seconds taken, the
+        exception raised or None, and its formatted traceback.  The timestamps found before an exception are
+        included.
+        """
+        filename, registry = self.files_to_process[index]
+        timestamps = self.timestamps
+        self.timestamps = OrderedDict()
+        error = None
+        error_traceback = None
+        start = timeit.default_timer()
+        try:
+            self.process_file(filename, registry)
+        except Exception as e:
+            error = e
+            error_traceback = traceback.format_exc()
+        finally:
+            extracted = self.timestamps
+            self.timestamps = timestamps
+        return extracted, timeit.default_timer() - start, error, error_traceback
+
+    def process_file(self, filename, registry):
+        if 'from' in registry:
+            if registry['from'] == 'filename':
+                self.get_timestamp_from_filename(filename, registry)
+            elif registry['from'] == 'csv':
+                self.get_timestamps_from_csv(filename, registry)
+            elif registry['from'] == 'exif':
+                self.get_timestamp_from_exif(filename, registry)
+            elif registry['from'] == 'doc':
+                self.get_timestamp_from_doc(filename, registry)
+            elif registry['from'] == 'text':
+                # TODO IMPLEMENT for example for html parsing
+                pass
+            else:
+                raise ValueError('Invalid from argument: %s' % registry['from'])
 
     def get_timestamp_from_filename(self, full_filename, registry):
         # Some filenames contain float seconds, some int microseconds
@@ -175,7 +298,7 @@ class TimestampValidator:
             regex = registry['regex']
 
         timestamp = get_timestamp_from_filename(filename, format, regex)
-        self.timestamps.append(('%s: %s' % (registry['name'], filename), timestamp))
+        self.add_timestamp(registry['name'], timestamp, filename)
 
     def get_timestamps_from_csv(self, filename, registry):
         delimiter = ','
@@ -196,34 +319,20 @@ class TimestampValidator:
             column = registry['column_name']
             reader = DictReader(open(filename, 'r'), delimiter=delimiter)
 
+        if registry['format'] not in ('seconds', 'microseconds', 'iso8601') and '%' not in registry['format']:
+            raise ValueError('Invalid type for csv timestamp: %s' % registry['format'])
+        parser = TimestampParser(registry['format'])
+
         for row in reader:
             timestamp_string = row[column]
             if timestamp_string:
-                if registry['format'] == 'seconds':
-                    timestamp = datetime.datetime.utcfromtimestamp(float(timestamp_string)).replace(tzinfo=pytz.UTC)
-                elif registry['format'] == 'microseconds':
-                    timestamp = datetime.datetime.utcfromtimestamp(1e-6 * int(timestamp_string)).replace(tzinfo=pytz.UTC)
-                elif registry['format'] == 'iso8601':
-                    timestamp = dateparser(timestamp_string)
-                    # print 'timezone:', timestamp.tzname()
-                else:
-                    raise ValueError('Invalid type for csv timestamp: %s' % registry['format'])
-
-                self.timestamps.append((registry['name'], timestamp))
+                timestamp = parser.parse(timestamp_string)
+                self.add_timestamp(registry['name'], timestamp, filename)
 
     def get_timestamp_from_exif(self, filename, registry):
-        img = PIL.Image.open(filename)
-        exif_data = img._getexif()
-        exif = {
-            PIL.ExifTags.TAGS[k]: v
-            for k, v in img._getexif().items()
-            if k in PIL.ExifTags.TAGS
-        }
-        # Note there is no timezone info standard defined for EXIF,
-        # although there is a standard for GPS time in GPSInfo,
-        # but our robot is in a cave so none of the cameras will have GPSInfo
-        timestamp = dateparser(exif['DateTimeOriginal']).replace(tzinfo=pytz.utc)
-        self.timestamps.append((registry['name'], timestamp))
+        # read from the EXIF without decoding the image; see exifReader for the time zone
+        timestamp = get_exif_timestamp(filename)
+        self.add_timestamp(registry['name'], timestamp, filename)
 
     def get_timestamp_from_doc(self, filename, registry):
         """
@@ -233,40 +342,57 @@ class TimestampValidator:
         :return:
         """
         info = PNGinfo(filename)
+        # the last date; other text, such as zTXt and iTXt chunks, may follow it
+        match = None
         for entry in info.text:
-            match = re.search('date:(\D+)([\d\-T\:]+)', entry)
+            match = re.search('date:(\D+)([\d\-T\:]+)', entry) or match
         if match:
             timestamp = dateparser(match.group(2)).astimezone(pytz.utc)
-            self.timestamps.append((registry['name'], timestamp))
+            self.add_timestamp(registry['name'], timestamp, filename)
         else:
             raise ValueError('Cannot parse DOC timestamp')
 
+    def add_timestamp(self, name, timestamp, label=None):
+        """
+        :param name: the source of the timestamp, ie the registry name
+        :param timestamp: the timestamp
+        :param label: what to call it in errors, ie the file name
+        """
+        if name not in self.timestamps:
+            self.timestamps[name] = TimestampStats(self.start_time)
+        self.timestamps[name].add(timestamp, label)
+
+    def get_time_span(self):
+        """
+        :return: tuple of the first and last timestamps of all of the sources, or None if there are none
+        """
+        stats = [s for s in self.timestamps.values() if s.count]
+        if not stats:
+            return None, None
+        return min(s.first for s in stats), max(s.last for s in stats)
+
     def print_stats(self):
         print 'Found %d files configured to ignore' % len(self.ignored_files)
         print 'Found %d ambiguous files, matched more than one config rule' % len(self.ambiguous_files)
         print 'Found %d unmatched files, matched no config rule' % len(self.unmatched_files)
         if len(self.files_to_process) > 0:
             print 'Found %d files to process' % len(self.files_to_process)
+        for name in sorted(self.source_stats):
+            # with several processes the seconds overlap, so they are the time spent on the source, not elapsed
+            files, timestamps, seconds = self.source_stats[name]
+            print '%s: %d files, %d timestamps, %.2f s of processing' % (name, files, timestamps, seconds)
+        if self.duration:
+            files = sum(s[0] for s in self.source_stats.values())
+            print 'Processed %d files in %.2f s, %.1f files/s' % (files, self.duration, files / self.duration)
 
     def plot_times(self,pdffile):
-        # Convert list of tuples of source name, timestamp to a dictionary of source name key, timestamp list value
-        plot_data = {}
-        for name,timestamp in self.timestamps:
-            if name not in plot_data.keys():
-                plot_data[name] = []
-            plot_data[name].append(timestamp)
-
-        # decimate big datasets because otherwise the plot is kinda unmanageable
-        for k in plot_data.keys():
-            if len(plot_data[k])>1000:
-                print 'there were', len(plot_data[k]), k
-                plot_data[k].sort()
-                n = len(plot_data[k])/1000
-                newlist = plot_data[k][0::n]
-                # just in case we need to see the last one...
-                newlist.append(plot_data[k][-1])
-                plot_data[k] = newlist
-                print 'now there are', len(plot_data[k]), k
+        # Plot a sample of each source's timestamps, as the plot is unmanageable with all of them
+        plot_data = OrderedDict()
+        for name, stats in self.timestamps.iteritems():
+            if stats.count:
+                plot_data[name] = stats.get_plot_times()
+                if stats.count > len(plot_data[name]):
+                    print 'plotting %d of the %d timestamps of %s' % (len(plot_data[name]), stats.count, name)
 
         import matplotlib as mpl
         mpl.use('pdf')
@@ -323,6 +449,10 @@ if __name__ == '__main__':
                       help='Silence most printouts, only include times')
     parser.add_option('-d', '--dirname_pattern', default=None,
                       help='pattern regex for dirname matching')
+    parser.add_option('--manifest', default=None,
+                      help='file to keep the scan manifest in, so later runs do not list unchanged directories')
+    parser.add_option('-j', '--processes', type='int', default=1,
+                      help='number of worker processes getting timestamps from the files')
 
     opts, args = parser.parse_args()
 
@@ -330,7 +460,6 @@ if __name__ == '__main__':
         parser.print_help()
         sys.exit(0)
 
-    global QUIET
     QUIET = opts.quiet
 
     # the top level directory should contain all the data for a flight
@@ -354,15 +483,13 @@ if __name__ == '__main__':
 
     # If we were given a timestamp validation config, go validate timestamps for all data
     if opts.configfile is not None:
-        validator = TimestampValidator(opts.configfile)
+        validator = TimestampValidator(opts.configfile, opts.manifest, start_time)
         validator.find_files(flight_dir)
         if not opts.test:
-            validator.process_files()
+            validator.process_files(processes=opts.processes)
         if not QUIET:
             validator.print_stats()
-        timestamps = [t[1] for t in validator.timestamps]
-        first_data_time = min(timestamps)
-        last_data_time = max(timestamps)
+        first_data_time, last_data_time = validator.get_time_span()
         print 'Timestamps for', basename
         if start_time:
             print 'start time:     ', start_time
@@ -370,9 +497,12 @@ if __name__ == '__main__':
         print 'last data time: ', last_data_time
 
         if start_time:
-            for name, timestamp in validator.timestamps:
-                if timestamp < start_time:
-                    print 'Error: %s in %s is before start time %s' % (timestamp, name, start_time)
+            for name, stats in validator.timestamps.iteritems():
+                for label, timestamp in stats.examples:
+                    print 'Error: %s in %s: %s is before start time %s' % (timestamp, name, label, start_time)
+                if stats.before_start > len(stats.examples):
+                    print 'Error: %d more timestamps in %s are before start time %s' % (
+                        stats.before_start - len(stats.examples), name, start_time)
 
         # If we were asked to create a flight, create it
         # Note that we cannot make a flight with an end time if we didn't get a config
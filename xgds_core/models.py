@@ -44,10 +44,11 @@ from geocamUtil.modelJson import modelToDict
 from geocamUtil import TimeUtil
 
 from xgds_core.util import get100Years, get_all_subclasses
+from xgds_core.flightUtils import FLIGHT_INTERVAL_INDEX, FLIGHT_MODEL, ACTIVE_FLIGHT_MODEL
 from fastkml import kml, styles
 from shapely.geometry import Point, LineString, Polygon
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 if settings.XGDS_CORE_REDIS:
@@ -205,6 +206,17 @@ if settings.XGDS_CORE_REDIS and settings.XGDS_SSE:
         #     print 'NO BROADCAST METHOD FOR %s %s' % (instance.__class__.__name__, str(instance))
 
 
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_flight_index(sender, **kwargs):
+    """
+    Invalidate the flight index when a flight or an active flight changes.  The flight models may belong to any
+    app, so they are looked up when a model is saved, after all of the apps are loaded.
+    """
+    if sender in (FLIGHT_MODEL.get(), ACTIVE_FLIGHT_MODEL.get()):
+        FLIGHT_INTERVAL_INDEX.invalidate()
+
+
 class SearchableModel(object):
     """
     Mixin this class to have your model get the methods it needs to be searchable and
@@ -1290,6 +1302,9 @@ class ImportedTelemetryFile(models.Model):
     errlog = models.TextField()
     # If the import fails and we keep trying keep track of how many times
     retry_count = models.IntegerField()
+    # Size in bytes and modification time in seconds since the epoch of the file when it was imported
+    size = models.BigIntegerField(blank=True, null=True)
+    mtime = models.FloatField(blank=True, null=True)
 
     def __unicode__(self):
         status = 'success'
@@ -1298,6 +1313,62 @@ class ImportedTelemetryFile(models.Model):
         return '%s @ %s (%s)' % (self.filename, self.timestamp, status)
 
 
+class ImportCheckpoint(models.Model):
+    """
+    How far the import of a csv file got, saved in the transaction of each batch so a failed import can continue
+    where it stopped.  See CsvImporter.load_csv_in_batches
+    """
+    # The name of the file being imported
+    filename = models.CharField(max_length=256, blank=False, null=False, db_index=True)
+    # The yaml configuration it is imported with
+    config = models.CharField(max_length=256, blank=False, null=False)
+    # Hash of the start of the file, to tell whether it is still the same file
+    fingerprint = models.CharField(max_length=64, blank=False, null=False)
+    # Where to continue reading the file
+    byte_offset = models.BigIntegerField(default=0)
+    # How many rows have been read
+    row_count = models.BigIntegerField(default=0)
+    # The latest time imported
+    last_timestamp = models.DateTimeField(blank=True, null=True)
+    # When the checkpoint was saved
+    timestamp = models.DateTimeField(auto_now=True)
+    # True once the whole file is imported
+    completed = models.BooleanField(default=False)
+
+    def __unicode__(self):
+        return '%s: %d rows (%d bytes)%s' % (self.filename, self.row_count, self.byte_offset,
+                                             ' completed' if self.completed else '')
+
+    class Meta:
+        unique_together = ('filename', 'config')
+
+
+class ImportedFileFingerprint(models.Model):
+    """
+    The content hash of an imported file, so the same data is recognized whatever the file is called or wherever
+    it was copied to.  Looking up the hash is one indexed query.
+    """
+    # sha1 of the file contents
+    content_hash = models.CharField(max_length=64, blank=False, null=False, db_index=True)
+    # Size of the file in bytes
+    size = models.BigIntegerField(default=0)
+    # The name of the file when it was imported
+    filename = models.CharField(max_length=256, blank=False, null=False)
+    # The model the data was imported into, blank if not known
+    data_class = models.CharField(max_length=128, blank=True, null=False, default='')
+    # The range of the times in the data, if known
+    start_time = models.DateTimeField(blank=True, null=True)
+    end_time = models.DateTimeField(blank=True, null=True)
+    # When it was imported
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return '%s: %s' % (self.content_hash, self.filename)
+
+    class Meta:
+        unique_together = ('content_hash', 'data_class')
+
+
 def downsample_queryset(queryset, downsample_seconds=0, timestamp_field_name='timestamp'):
     """
     Downsample a queryset by the number of seconds
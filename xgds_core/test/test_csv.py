@@ -16,10 +16,23 @@
 
 import os
 import pytz
+import shutil
+import tempfile
 import datetime
+import threading
+from collections import OrderedDict
 from django.conf import settings
 from django.test import TransactionTestCase
-from xgds_core.importer.csvImporter import CsvImporter
+from xgds_core.importer import csvImporter
+from xgds_core.importer.csvImporter import CsvImporter, CsvSetImporter
+from xgds_core.importer.importProfiler import STAGES
+from xgds_core.importer.timestampParser import TimestampParser
+from xgds_core.importer.nativeLoader import native_load
+from xgds_core.models import State, ImportCheckpoint, ImportedFileFingerprint
+from xgds_core.util import get_content_hash
+
+STATE_YAML = os.path.join(os.path.dirname(__file__), 'test_files/state.yaml')
+STATE_START = datetime.datetime(2019, 1, 1, tzinfo=pytz.utc)
 
 
 class test_csv(TransactionTestCase):
@@ -27,14 +40,55 @@ class test_csv(TransactionTestCase):
     Tests for csv importer
     """
     fixtures = ['xgds_core_testing.json']
-    
+    yamlfile = os.path.join(os.path.dirname(__file__), 'test_files/csv.yaml')
+    csvfile = os.path.join(os.path.dirname(__file__), 'test_files/data.csv')
+    vehicle = 'Generic Vehicle'
+    flight = 'Christmast in a Generic Vehicle'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # written by write_lines, for test_files/state.yaml
+        self.statefile = os.path.join(self.directory, 'states.csv')
+        # test_files/data.csv with test_files/csv.yaml, replacing any data
+        self.importer = CsvImporter(self.yamlfile, self.csvfile, self.vehicle, self.flight, replace=True)
+
+    def tearDown(self):
+        self.importer.csv_file.close()
+        shutil.rmtree(self.directory)
+
+    def get_state_lines(self, keys, start=STATE_START):
+        """
+        :param keys: the keys of the states
+        :param start: the start of the first state, the others follow a second apart
+        :return: the lines of a csv file of states, for test_files/state.yaml
+        """
+        lines = []
+        for i, key in enumerate(keys):
+            timestamp = (start + datetime.timedelta(seconds=i)).isoformat()
+            lines.append('%s,%s,%s,,false\n' % (timestamp, timestamp, key))
+        return lines
+
+    def write_lines(self, lines, csvfile=None, mode='w'):
+        """
+        :param lines: the lines to write
+        :param csvfile: the file, defaulting to self.statefile
+        :param mode: 'a' to append to the file
+        :return: the file
+        """
+        csvfile = csvfile or self.statefile
+        with open(csvfile, mode) as stream:
+            stream.writelines(lines)
+        return csvfile
+
+    def get_keys(self, prefix):
+        """
+        :param prefix: the start of the keys
+        :return: the keys of the stored states, in the order of their start
+        """
+        return list(State.objects.filter(key__startswith=prefix).values_list('key', flat=True))
+
     def test_parse(self):
-        import os
-        yamlfile = os.path.join(os.path.dirname(__file__),'test_files/csv.yaml')
-        csvfile = os.path.join(os.path.dirname(__file__),'test_files/data.csv')
-        vehicle = 'Generic Vehicle'
-        flight = 'Christmast in a Generic Vehicle'
-        importer = CsvImporter(yamlfile, csvfile, vehicle, flight, replace=True)
+        importer = self.importer
         values = importer.load_to_list()
 
         self.assertEqual(values[0]['timestamp'], datetime.datetime(2019,1,1,1,2,3,456789).replace(tzinfo=pytz.UTC))
@@ -68,3 +122,277 @@ class test_csv(TransactionTestCase):
         # and there should be nothing left
         self.assertEqual(len(values[0].keys()), 0)
         self.assertEqual(len(values[1].keys()), 0)
+
+    def test_plan(self):
+        # the results of the conversions by parse_regex, convert_type, convert_units and delete_skip_fields
+        # which the plan replaced
+        importer = self.importer
+        config = {'defaults': {'flight_id': 1},
+                  'fields': OrderedDict([('skipped', {'type': 'string', 'skip': True}),
+                                         ('count', {'type': 'integer'}),
+                                         ('depth', {'type': 'float', 'regex': r'(-?[\d.]+)m'}),
+                                         ('angle', {'type': 'float', 'units': 'radians',
+                                                    'storage_units': 'degrees'}),
+                                         ('flag', {'type': 'boolean'}),
+                                         ('maybe', {'type': 'nullboolean'}),
+                                         ('pair', {'type': 'key_value'}),
+                                         ('optional', {'type': 'integer', 'required': False}),
+                                         ('label', {'type': 'string'})])}
+        row = {'skipped': 'x', 'count': '3', 'depth': '2.5m', 'angle': '3.141592653589793', 'flag': 'True',
+               'maybe': 'null', 'pair': 'a:b:c', 'optional': 'n/a', 'label': 'None'}
+        self.assertEqual(importer.update_row(dict(row), config),
+                         {'flight_id': 1, 'count': 3, 'depth': 2.5, 'angle': 180.0, 'flag': True, 'maybe': None,
+                          'pair': {'a': 'b:c'}, 'label': None})
+        row = {'skipped': 'y', 'count': '-4', 'depth': '-1m', 'angle': '0', 'flag': 'false',
+               'maybe': 'TRUE', 'pair': 'key:value', 'optional': '7', 'label': 'deep'}
+        self.assertEqual(importer.update_row(dict(row), config),
+                         {'flight_id': 1, 'count': -4, 'depth': -1.0, 'angle': 0.0, 'flag': False, 'maybe': True,
+                          'pair': {'key': 'value'}, 'optional': 7, 'label': 'deep'})
+        # convert_type raised KeyError for a boolean which is neither true nor false; it is now read as an integer
+        row['flag'] = '1'
+        self.assertEqual(importer.update_row(dict(row), config)['flag'], 1)
+        row['count'] = 'many'
+        with self.assertRaises(ValueError):
+            importer.update_row(dict(row), config)
+
+    def test_batches(self):
+        batches = list(self.importer.iter_batches(1))
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(batches[0][0]['description'], 'cold')
+        self.assertEqual(batches[1][0]['description'], 'hot')
+
+    def test_time_span(self):
+        importer = self.importer
+        self.assertEqual(importer.get_last_row(tail_bytes=10)['myfieldname'], 'FieldName2')
+        start_time, end_time = importer.get_time_span()
+        self.assertEqual(start_time, datetime.datetime(2019, 1, 1, 1, 2, 3, 456789, tzinfo=pytz.utc))
+        self.assertEqual(end_time, datetime.datetime(2019, 1, 1, 1, 2, 4, 567899, tzinfo=pytz.utc))
+        self.assertEqual(len(importer.load_to_list()), 2)
+
+    def test_last_row_quoted(self):
+        lines = self.get_state_lines(['quoted%d' % i for i in range(3)])
+        # the last record has a line break in a quoted value
+        lines[-1] = lines[-1].replace(',,', ',"a note\nover two lines",')
+        importer = CsvImporter(STATE_YAML, self.write_lines(lines))
+        for tail_bytes in (10, 1024):
+            last_row = importer.get_last_row(tail_bytes=tail_bytes)
+            self.assertEqual((last_row['key'], last_row['notes']), ('quoted2', 'a note\nover two lines'))
+        self.assertEqual(len(importer.load_to_list()), 3)
+
+    def test_fingerprint(self):
+        importer = self.importer
+        self.assertEqual(importer.get_source_hash(), get_content_hash(self.csvfile))
+        self.assertFalse(importer.check_fingerprint_exists())
+        start_time, end_time = importer.get_time_span()
+        fingerprint = importer.save_fingerprint(start_time, end_time)
+        self.assertEqual(fingerprint.end_time, end_time)
+        self.assertTrue(importer.check_fingerprint_exists())
+
+    def test_parsed_cache(self):
+        directory = os.path.join(self.directory, 'data')
+        cache_directory = os.path.join(self.directory, 'cache')
+        os.mkdir(directory)
+        csvfile = os.path.join(directory, 'data.csv')
+        shutil.copy(self.csvfile, csvfile)
+        # a file whose name starts with the name of the other, which keeps its own cache
+        otherfile = os.path.join(directory, 'data.csv.old.csv')
+        shutil.copy(csvfile, otherfile)
+
+        def load(csv_file_path):
+            return CsvImporter(self.yamlfile, csv_file_path, self.vehicle, self.flight, replace=True,
+                               cache=True).load_to_list()
+
+        with self.settings(XGDS_CORE_IMPORT_CACHE_DIR=cache_directory):
+            expected = self.importer.load_to_list()
+            load(otherfile)
+            written = load(csvfile)
+            self.assertEqual(len([f for f in os.listdir(cache_directory) if f.endswith('.cache.npy')]), 2)
+            self.assertEqual(sorted(os.listdir(directory)), ['data.csv', 'data.csv.old.csv'])
+            cached = load(csvfile)
+        self.assertEqual(written, expected)
+        self.assertEqual(cached, expected)
+
+    def test_checkpoint(self):
+        lines = self.get_state_lines(['checkpoint%d' % i for i in range(5)])
+        # the third row is bad, so the import fails after its first batch is committed
+        csvfile = self.write_lines(lines[:2] + ['not a time,not a time,checkpoint2,,false\n'] + lines[3:])
+        importer = CsvImporter(STATE_YAML, csvfile, checkpoint=True, batch_size=2)
+        with self.assertRaises(ValueError):
+            importer.load_csv_in_batches()
+        self.assertEqual(self.get_keys('checkpoint'), ['checkpoint0', 'checkpoint1'])
+        checkpoint = ImportCheckpoint.objects.get(filename=csvfile)
+        self.assertEqual(checkpoint.row_count, 2)
+        self.assertEqual(checkpoint.byte_offset, len(''.join(lines[:2])))
+        self.assertFalse(checkpoint.completed)
+        self.assertFalse(importer.check_fingerprint_exists())
+
+        # fixed and run again, it continues after the committed rows, which are unchanged so the checkpoint holds
+        self.write_lines(lines)
+        importer = CsvImporter(STATE_YAML, csvfile, checkpoint=True, batch_size=2)
+        self.assertEqual(importer.load_csv_in_batches(), 3)
+        self.assertEqual(self.get_keys('checkpoint'), ['checkpoint%d' % i for i in range(5)])
+        self.assertTrue(ImportCheckpoint.objects.get(filename=csvfile).completed)
+        self.assertTrue(importer.check_fingerprint_exists())
+        fingerprint = ImportedFileFingerprint.objects.get(content_hash=get_content_hash(csvfile))
+        self.assertEqual((fingerprint.start_time, fingerprint.end_time),
+                         (STATE_START, STATE_START + datetime.timedelta(seconds=4)))
+
+    def test_set_processes(self):
+        def write_set(prefix):
+            return [self.write_lines(self.get_state_lines(['%s%d_%d' % (prefix, index, i) for i in range(3)],
+                                                          STATE_START + datetime.timedelta(minutes=index)),
+                                     os.path.join(self.directory, '%s_%d.csv' % (prefix, index)))
+                    for index in range(3)]
+
+        # converted by two workers, stored in the order of the files
+        importer = CsvSetImporter(STATE_YAML, write_set('set'), batch_size=2)
+        self.assertEqual(importer.load_csv_in_batches(processes=2), 9)
+        self.assertEqual(csvImporter.WORKER_IMPORTER, None)
+        self.assertEqual(list(State.objects.filter(key__startswith='set').order_by('pk').values_list('key',
+                                                                                                    flat=True)),
+                         ['set%d_%d' % (index, i) for index in range(3) for i in range(3)])
+
+        # a worker fails on the second file; the first file is stored and the pool is cleaned up
+        csvfiles = write_set('bad')
+        self.write_lines(['not a time,not a time,bad,,false\n'], csvfiles[1], 'a')
+        importer = CsvSetImporter(STATE_YAML, csvfiles, batch_size=2)
+        with self.assertRaises(ValueError):
+            importer.load_csv_in_batches(processes=2)
+        self.assertEqual(csvImporter.WORKER_IMPORTER, None)
+        self.assertEqual(self.get_keys('bad'), ['bad0_0', 'bad0_1', 'bad0_2'])
+
+    def test_replace(self):
+        csvfile = self.write_lines(self.get_state_lines(['replace%d' % i for i in range(3)]))
+        CsvImporter(STATE_YAML, csvfile).load_csv_in_batches()
+        pks = list(State.objects.filter(key__startswith='replace').values_list('pk', flat=True))
+
+        # one row changed and one added
+        self.write_lines(self.get_state_lines(['replace0', 'changed1', 'replace2', 'replace3']))
+        importer = CsvImporter(STATE_YAML, csvfile, replace=True)
+        self.assertEqual(importer.load_csv_in_batches(), 4)
+        states = State.objects.filter(key__regex='^(replace|changed)')
+        self.assertEqual(list(states.values_list('key', flat=True)),
+                         ['replace0', 'changed1', 'replace2', 'replace3'])
+        self.assertEqual(list(states.values_list('pk', flat=True)[:3]), pks)
+
+        # nothing is left to update or create
+        rows = importer.load_to_list()
+        self.assertEqual(importer.update_stored_data(State, rows, create_missing=True),
+                         {'matched': 4, 'updated': 0, 'created': 0, 'missing': 0})
+        self.assertEqual(State.objects.filter(key__regex='^(replace|changed)').count(), 4)
+
+    def test_profile(self):
+        csvfile = self.write_lines(self.get_state_lines(['profile%d' % i for i in range(5)]))
+        cprofile_path = os.path.join(self.directory, 'import.prof')
+        importer = CsvImporter(STATE_YAML, csvfile, batch_size=2)
+        profiler = importer.profile(cprofile_path)
+        profiler.start()
+        rows = importer.load_csv_in_batches()
+        profiler.stop()
+
+        # the timed import stores the same rows
+        self.assertEqual(rows, 5)
+        self.assertEqual(self.get_keys('profile'), ['profile%d' % i for i in range(5)])
+        results = profiler.get_results(rows)
+        self.assertEqual(results['rows'], 5)
+        self.assertEqual(tuple(results['stages']), STAGES + ('other',))
+        self.assertTrue(results['stages']['type'] > 0)
+        self.assertTrue(results['stages']['write'] > 0)
+        self.assertTrue(os.path.exists(cprofile_path))
+
+    def test_follow(self):
+        lines = self.get_state_lines(['follow%d' % i for i in range(5)])
+        # the third line is only partly written
+        csvfile = self.write_lines(lines[:2] + [lines[2][:10]])
+        importer = CsvImporter(STATE_YAML, csvfile, batch_size=10, follow=True)
+        self.assertEqual(importer.follow(poll_seconds=0, idle_seconds=0), 2)
+        self.assertEqual(self.get_keys('follow'), ['follow0', 'follow1'])
+
+        # restarted once the line is finished, it continues after the stored rows rather than stopping because
+        # they exist
+        self.write_lines([lines[2][10:], lines[3]], mode='a')
+        importer = CsvImporter(STATE_YAML, csvfile, batch_size=10, follow=True)
+        self.assertEqual(importer.follow(poll_seconds=0, idle_seconds=0), 2)
+        self.assertEqual(self.get_keys('follow'), ['follow%d' % i for i in range(4)])
+
+        # the file is rotated while it is followed, and the new file is followed from its start
+        self.write_lines([lines[4]], mode='a')
+        importer = CsvImporter(STATE_YAML, csvfile, batch_size=10, follow=True)
+
+        def rotate():
+            new_file = self.write_lines(self.get_state_lines(['rotated%d' % i for i in range(2)],
+                                                             STATE_START + datetime.timedelta(hours=1)),
+                                        os.path.join(self.directory, 'new.csv'))
+            os.rename(new_file, csvfile)
+
+        rotation = threading.Timer(0.2, rotate)
+        rotation.start()
+        try:
+            self.assertEqual(importer.follow(poll_seconds=0.05, idle_seconds=1), 3)
+        finally:
+            rotation.join()
+        self.assertEqual(self.get_keys('follow'), ['follow%d' % i for i in range(5)])
+        self.assertEqual(self.get_keys('rotated'), ['rotated0', 'rotated1'])
+        self.assertEqual(ImportCheckpoint.objects.get(filename=csvfile).row_count, 2)
+
+    def test_native_load(self):
+        def write_and_load(prefix, native):
+            lines = self.get_state_lines(['%s%d' % (prefix, i) for i in range(3)],
+                                         STATE_START + datetime.timedelta(microseconds=456789))
+            lines[0] = lines[0].replace(',,false', ',"a ""quoted"", note",true')
+            lines[1] = lines[1].replace(',,', ',None,')
+            csvfile = self.write_lines(lines, os.path.join(self.directory, '%s.csv' % prefix))
+            self.assertEqual(CsvImporter(STATE_YAML, csvfile, native=native).load_csv_in_batches(), 3)
+            return list(State.objects.filter(key__startswith=prefix).values_list('start', 'end', 'active',
+                                                                                 'dateModified', 'notes', 'values'))
+
+        # the database's bulk loader stores the same values as bulk_create
+        expected = write_and_load('created', False)
+        self.assertEqual(write_and_load('native', True), expected)
+        self.assertEqual([state[4] for state in expected], ['a "quoted", note', None, ''])
+        self.assertEqual([state[2] for state in expected], [True, False, False])
+        self.assertEqual(expected[0][0], STATE_START + datetime.timedelta(microseconds=456789))
+        self.assertEqual(native_load(State, []), 0)
+
+    def test_columnar(self):
+        from xgds_core.importer.columnarCsvImporter import ColumnarCsvImporter
+        expected = self.importer.load_to_list()
+        importer = ColumnarCsvImporter(self.yamlfile, self.csvfile, self.vehicle, self.flight, replace=True,
+                                       batch_size=1)
+        values = importer.load_to_list()
+        self.assertEqual(values, expected)
+
+    def test_columnar_conversions(self):
+        # unix times, floats and the numpy unit conversions, with None and an unconvertible optional value
+        from xgds_core.importer.columnarCsvImporter import ColumnarCsvImporter
+        yamlfile = os.path.join(os.path.dirname(__file__), 'test_files/columnar.yaml')
+        csvfile = os.path.join(os.path.dirname(__file__), 'test_files/columnar.csv')
+        expected = CsvImporter(yamlfile, csvfile, replace=True).load_to_list()
+        self.assertEqual(len(expected), 5)
+        self.assertTrue('value' not in expected[4])
+        for batch_size in (2, 10):
+            importer = ColumnarCsvImporter(yamlfile, csvfile, replace=True, batch_size=batch_size)
+            self.assertEqual(importer.load_to_list(), expected)
+
+    def test_time_parser(self):
+        parser = TimestampParser()
+        self.assertEqual(parser.parse('2019-01-01T01:02:03.456789Z'),
+                         datetime.datetime(2019,1,1,1,2,3,456789).replace(tzinfo=pytz.UTC))
+        self.assertEqual(parser.parse('2019-01-01T01:02:04.5Z'),
+                         datetime.datetime(2019,1,1,1,2,4,500000).replace(tzinfo=pytz.UTC))
+        self.assertEqual(parser.parse('2019-01-01T01:02:03-07:00'),
+                         datetime.datetime(2019,1,1,8,2,3).replace(tzinfo=pytz.UTC))
+        # not iso8601, falls back to dateutil
+        self.assertEqual(parser.parse('Jan 1 2019 01:02:03'),
+                         datetime.datetime(2019,1,1,1,2,3).replace(tzinfo=pytz.UTC))
+
+        # naive times are in the given timezone, across daylight savings
+        parser = TimestampParser('%Y-%m-%d %H:%M:%S', pytz.timezone('America/Los_Angeles'))
+        self.assertEqual(parser.parse('2019-03-10 01:30:00'),
+                         datetime.datetime(2019,3,10,9,30).replace(tzinfo=pytz.UTC))
+        self.assertEqual(parser.parse('2019-03-10 03:30:00'),
+                         datetime.datetime(2019,3,10,10,30).replace(tzinfo=pytz.UTC))
+
+        parser = TimestampParser('unixtime_int_microsecond')
+        self.assertEqual(parser.parse('1546304523456789'),
+                         datetime.datetime(2019,1,1,1,2,3,456789).replace(tzinfo=pytz.UTC))
@@ -0,0 +1,52 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+import datetime
+import os
+import shutil
+import struct
+import tempfile
+
+import pytz
+from django.test import SimpleTestCase
+
+from xgds_core.importer.exifReader import get_exif_timestamp
+
+
+class test_exif_reader(SimpleTestCase):
+    """
+    Tests for reading the time an image was taken from its EXIF
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_exif_timestamp(self):
+        # little endian TIFF: IFD0 with the EXIF pointer, then the EXIF IFD with DateTimeOriginal and
+        # SubSecTimeOriginal, then the date string
+        tiff = 'II*\x00' + struct.pack('<I', 8)
+        tiff += struct.pack('<HHHII', 1, 0x8769, 4, 1, 26) + struct.pack('<I', 0)
+        tiff += struct.pack('<HHHII', 2, 0x9003, 2, 20, 56) + struct.pack('<HHI', 0x9291, 2, 4) + '250\x00'
+        tiff += struct.pack('<I', 0) + '2019:01:02 03:04:05\x00'
+        app1 = 'Exif\x00\x00' + tiff
+        jpgfile = os.path.join(self.directory, 'test.jpg')
+        with open(jpgfile, 'wb') as fp:
+            fp.write('\xff\xd8\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1 + '\xff\xda')
+        self.assertEqual(get_exif_timestamp(jpgfile),
+                         datetime.datetime(2019, 1, 2, 3, 4, 5, 250000, tzinfo=pytz.utc))
@@ -0,0 +1,105 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from xgds_core.importer.fileWatcher import InotifyWatcher, PollingWatcher
+
+
+class test_file_watcher(SimpleTestCase):
+    """
+    Tests for the watchers used by importHandler.py -w
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_inotify_watcher(self):
+        try:
+            # check the files of new directories with each call
+            return InotifyWatcher(self.directory, stable_seconds=0)
+        except OSError as e:
+            self.skipTest(str(e))
+
+    def test_inotify_written_file(self):
+        watcher = self.get_inotify_watcher()
+        try:
+            path = os.path.join(self.directory, 'data.csv')
+            with open(path, 'w') as data_file:
+                data_file.write('one\n')
+                data_file.flush()
+                self.assertEqual(watcher.get_new_files(0.1), [])
+            self.assertEqual(watcher.get_new_files(0.1), [path])
+        finally:
+            watcher.close()
+
+    def test_inotify_new_directory(self):
+        watcher = self.get_inotify_watcher()
+        try:
+            subdirectory = os.path.join(self.directory, 'new')
+            os.mkdir(subdirectory)
+            written = os.path.join(subdirectory, 'written.csv')
+            with open(written, 'w') as data_file:
+                data_file.write('one\n')
+            growing = os.path.join(subdirectory, 'growing.csv')
+            filenames = []
+            with open(growing, 'w') as data_file:
+                # the files are found with the directory, but held until they stop changing or are closed
+                for line in range(5):
+                    data_file.write('line\n')
+                    data_file.flush()
+                    filenames.extend(watcher.get_new_files(0.1))
+                    self.assertNotIn(growing, filenames)
+            filenames.extend(watcher.get_new_files(0.1))
+            filenames.extend(watcher.get_new_files(0.1))
+            # each once
+            self.assertEqual(sorted(filenames), [growing, written])
+            self.assertEqual(watcher.pending, {})
+        finally:
+            watcher.close()
+
+    def test_polling(self):
+        subdirectory = os.path.join(self.directory, 'old')
+        os.mkdir(subdirectory)
+        with open(os.path.join(subdirectory, 'old.csv'), 'w') as data_file:
+            data_file.write('one\n')
+        # older than the scans trust
+        an_hour_ago = time.time() - 3600
+        os.utime(os.path.join(subdirectory, 'old.csv'), (an_hour_ago, an_hour_ago))
+        os.utime(subdirectory, (an_hour_ago, an_hour_ago))
+        watcher = PollingWatcher(self.directory)
+        path = os.path.join(self.directory, 'data.csv')
+        with open(path, 'w') as data_file:
+            for line in range(3):
+                data_file.write('line\n')
+                data_file.flush()
+                # not while it is being written
+                watcher.next_scan = 0
+                self.assertEqual(watcher.get_new_files(0), [])
+        watcher.next_scan = 0
+        self.assertEqual(watcher.get_new_files(0), [path])
+        watcher.next_scan = 0
+        self.assertEqual(watcher.get_new_files(0), [])
+        # the directory which has not changed is not listed again
+        self.assertEqual(watcher.manifest.skipped_directories, 1)
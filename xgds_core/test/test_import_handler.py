@@ -0,0 +1,161 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+import os
+import shutil
+import tempfile
+
+import yaml
+from django.test import TransactionTestCase
+
+from xgds_core.importer.importHandler import ImportFinder
+from xgds_core.models import ImportedTelemetryFile, ImportedFileFingerprint
+
+
+class test_import_handler(TransactionTestCase):
+    """
+    Tests for the scheduling of imports by the ImportFinder, with quick shell commands as the importers
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.import_path = os.path.join(self.directory, 'data')
+        os.mkdir(self.import_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_finder(self, registry, filenames, concurrency=4):
+        """
+        :param registry: the registry entries, with the timeout defaulting to 10 seconds
+        :param filenames: the names of the files to write to the import directory
+        :return: the ImportFinder, with its jobs recorded in jobs as they are made
+        """
+        for entry in registry:
+            entry.setdefault('timeout', 10)
+        config_path = os.path.join(self.directory, 'ImportHandlerConfig.yaml')
+        with open(config_path, 'w') as config_file:
+            yaml.dump({'import_path': self.import_path, 'concurrency': concurrency, 'registry': registry},
+                      config_file)
+        for filename in filenames:
+            with open(os.path.join(self.import_path, filename), 'w') as data_file:
+                data_file.write(filename)
+        finder = ImportFinder(config_path)
+        finder.jobs = []
+        get_job = finder.get_job
+
+        def record_job(*args):
+            job = get_job(*args)
+            finder.jobs.append(job)
+            return job
+
+        finder.get_job = record_job
+        return finder
+
+    def test_order_barrier(self):
+        finder = self.make_finder([{'filepath_pattern': r'first_\d$', 'importer': 'sh -c "sleep 0.2"', 'order': 1},
+                                   {'filepath_pattern': r'second_\d$', 'importer': 'true', 'order': 2}],
+                                  ['first_1', 'first_2', 'second_1', 'second_2'])
+        finder.do_once()
+        self.assertEqual(len(finder.imports_that_succeeded), 4)
+        first = [job for job in finder.jobs if job.order == 1]
+        second = [job for job in finder.jobs if job.order == 2]
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 2)
+        # both of the first order run at once, and the second order waits for them
+        self.assertTrue(max(job.start_time for job in first) < min(job.end_time for job in first))
+        self.assertTrue(min(job.start_time for job in second) >= max(job.end_time for job in first))
+
+    def test_rule_concurrency(self):
+        finder = self.make_finder([{'filepath_pattern': r'slow_\d$', 'importer': 'sh -c "sleep 0.1"',
+                                    'concurrency': 1},
+                                   {'filepath_pattern': r'fast_\d$', 'importer': 'true'}],
+                                  ['slow_1', 'slow_2', 'slow_3', 'fast_1'])
+        finder.do_once()
+        self.assertEqual(len(finder.imports_that_succeeded), 4)
+        slow = sorted([job for job in finder.jobs if 'slow' in job.filename], key=lambda job: job.start_time)
+        # one at a time for the rule, while the other rule's import ran alongside
+        for previous, job in zip(slow, slow[1:]):
+            self.assertTrue(job.start_time >= previous.end_time)
+        fast = [job for job in finder.jobs if 'fast' in job.filename][0]
+        self.assertTrue(fast.end_time < slow[-1].start_time)
+
+    def test_timeout(self):
+        finder = self.make_finder([{'filepath_pattern': r'stuck$', 'importer': 'sh -c "sleep 10"', 'timeout': 0.2}],
+                                  ['stuck'])
+        finder.do_once()
+        self.assertEqual(finder.imports_that_failed, [os.path.join(self.import_path, 'stuck')])
+        self.assertEqual(finder.jobs[0].returncode, -9)
+        self.assertTrue((finder.jobs[0].end_time - finder.jobs[0].start_time).total_seconds() < 5)
+
+    def test_changed_file(self):
+        finder = self.make_finder([{'filepath_pattern': r'data_\d$', 'importer': 'true'}], ['data_1', 'data_2'])
+        finder.do_once()
+        self.assertEqual(len(finder.imports_that_succeeded), 2)
+        with open(os.path.join(self.import_path, 'data_2'), 'a') as data_file:
+            data_file.write('more')
+        # a new finder, which knows the files from the database
+        finder = self.make_finder([{'filepath_pattern': r'data_\d$', 'importer': 'true'}], [])
+        finder.get_new_files(full=True)
+        # the changed file is not imported again
+        self.assertEqual(finder.files_to_process, [])
+        self.assertEqual(sorted(finder.previously_imported_files),
+                         [os.path.join(self.import_path, 'data_1'), os.path.join(self.import_path, 'data_2')])
+
+    def test_removed_file(self):
+        # the importer removes the file, which is still recorded
+        finder = self.make_finder([{'filepath_pattern': r'data$', 'importer': 'rm'}], ['data'])
+        finder.do_once()
+        filename = os.path.join(self.import_path, 'data')
+        self.assertEqual(finder.imports_that_succeeded, [filename])
+        itf = ImportedTelemetryFile.objects.filter(filename=filename)[0]
+        self.assertEqual(itf.returncode, 0)
+        self.assertEqual(itf.size, len('data'))
+
+    def test_fingerprint(self):
+        finder = self.make_finder([{'filepath_pattern': r'copy_\d$', 'importer': 'true', 'concurrency': 1,
+                                    'data_class': 'xgds_core.Flight'},
+                                   {'filepath_pattern': r'other_\d$', 'importer': 'true'}],
+                                  ['copy_1', 'copy_2', 'other_1', 'other_2'])
+        for filename in ('copy_1', 'copy_2', 'other_1', 'other_2'):
+            with open(os.path.join(self.import_path, filename), 'w') as data_file:
+                data_file.write('the same')
+        finder.do_once()
+        # the second copy is skipped, and only the entry with a data class is fingerprinted
+        self.assertEqual(sorted(os.path.basename(f) for f in finder.imports_that_succeeded),
+                         ['copy_1', 'other_1', 'other_2'])
+        self.assertEqual(finder.previously_imported_files, [os.path.join(self.import_path, 'copy_2')])
+        self.assertEqual(list(ImportedFileFingerprint.objects.values_list('data_class', flat=True)),
+                         ['xgds_core.Flight'])
+
+    def test_concurrent_copies(self):
+        finder = self.make_finder([{'filepath_pattern': r'copy_\d$', 'importer': 'sh -c "sleep 0.2"',
+                                    'data_class': 'xgds_core.Flight'}],
+                                  ['copy_1', 'copy_2'])
+        for filename in ('copy_1', 'copy_2'):
+            with open(os.path.join(self.import_path, filename), 'w') as data_file:
+                data_file.write('the same')
+        finder.do_once()
+        # the second copy is not started while the first is being imported
+        self.assertEqual(finder.imports_that_succeeded, [os.path.join(self.import_path, 'copy_1')])
+        self.assertEqual(finder.previously_imported_files, [os.path.join(self.import_path, 'copy_2')])
+        self.assertEqual(ImportedFileFingerprint.objects.count(), 1)
+
+    def test_concurrency_below_one(self):
+        with self.assertRaises(ValueError):
+            self.make_finder([{'filepath_pattern': r'data$', 'importer': 'true', 'concurrency': 0}], [])
+        with self.assertRaises(ValueError):
+            self.make_finder([{'filepath_pattern': r'data$', 'importer': 'true'}], [], concurrency=-1)
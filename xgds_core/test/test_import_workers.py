@@ -0,0 +1,107 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from xgds_core.importer.importWorkers import WorkerPool, WorkerJob
+
+
+class test_import_workers(SimpleTestCase):
+    """
+    Tests for running importer scripts in warm worker processes, see importHandler.py -W
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pool = WorkerPool()
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.directory)
+
+    def write_script(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as script:
+            script.write(text)
+        return path
+
+    def run_job(self, script, timeout=10):
+        """
+        :return: the finished WorkerJob
+        """
+        job = WorkerJob(self.pool, 1, script, {'timeout': timeout}, script, [script])
+        job.start()
+        while not job.poll():
+            time.sleep(0.05)
+        return job
+
+    def test_child_processes(self):
+        script = self.write_script('children.py', 'import multiprocessing\n'
+                                                  'print(multiprocessing.Pool(2).map(abs, [-1, -2]))\n')
+        job = self.run_job(script)
+        self.assertEqual(job.returncode, 0, job.stderr)
+        self.assertEqual(job.stdout, '[1, 2]\n')
+
+    def test_module_state(self):
+        self.write_script('counter.py', 'count = 0\n')
+        script = self.write_script('count.py', 'import counter\n'
+                                               'counter.count += 1\n'
+                                               'print(counter.count)\n')
+        first = self.run_job(script)
+        second = self.run_job(script)
+        # the same worker, with a fresh copy of the module
+        self.assertEqual(len(self.pool.idle), 1)
+        self.assertEqual((first.stdout, second.stdout), ('1\n', '1\n'))
+
+    def test_library_modules(self):
+        # outside the script's directory
+        library = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, library)
+        with open(os.path.join(library, 'shared.py'), 'w') as module:
+            module.write('count = 0\n')
+        script = self.write_script('shared_count.py', 'import sys\n'
+                                                      'sys.path.append(%r)\n'
+                                                      'import shared\n'
+                                                      'shared.count += 1\n'
+                                                      'print(shared.count)\n' % library)
+        first = self.run_job(script)
+        second = self.run_job(script)
+        # modules from outside the script's directory, like those of the apps, are imported once per worker
+        self.assertEqual((first.stdout, second.stdout), ('1\n', '2\n'))
+
+    def test_timeout(self):
+        script = self.write_script('stuck.py', 'import time\n'
+                                               'time.sleep(10)\n')
+        job = self.run_job(script, timeout=0.2)
+        self.assertEqual(job.returncode, -9)
+        self.assertEqual(self.pool.idle, [])
+
+    def test_start_failure(self):
+        def get_worker():
+            raise OSError('no workers')
+
+        self.pool.get_worker = get_worker
+        job = WorkerJob(self.pool, 1, 'script.py', {'timeout': 10}, 'script.py', ['script.py'])
+        with self.assertRaises(OSError):
+            job.start()
+        # the files for its output are removed
+        self.assertFalse(os.path.exists(job.output_path))
+        self.assertFalse(os.path.exists(job.error_path))
@@ -0,0 +1,61 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+from django.test import SimpleTestCase
+
+from xgds_core.importer.PNGinfo import PNGinfo
+
+
+def chunk(chunk_type, data):
+    """
+    :return: the PNG chunk of the type and data, with its length and crc
+    """
+    return struct.pack('>I', len(data)) + chunk_type + data + \
+        struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+
+class test_png_info(SimpleTestCase):
+    """
+    Tests for reading the header and text chunks of a PNG
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_text(self):
+        pngfile = os.path.join(self.directory, 'test.png')
+        with open(pngfile, 'wb') as fp:
+            fp.write('\x89PNG\r\n\x1a\n')
+            fp.write(chunk('IHDR', struct.pack('>IIBBBBB', 2, 1, 8, 0, 0, 0, 0)))
+            fp.write(chunk('tEXt', 'date:create\x002019-01-01T01:02:03+00:00'))
+            fp.write(chunk('IDAT', zlib.compress('\x00\x00\x00')))
+            fp.write(chunk('zTXt', 'Comment\x00\x00' + zlib.compress('after the image')))
+            fp.write(chunk('IEND', ''))
+        for use_mmap in False, True:
+            info = PNGinfo(pngfile, use_mmap=use_mmap)
+            self.assertEqual(info.header['Width'], 2)
+            self.assertEqual(info.text, [u'date:create\x002019-01-01T01:02:03+00:00',
+                                         u'Comment\x00after the image'])
+        self.assertEqual(len(PNGinfo(pngfile, stop_at_image=True).text), 1)
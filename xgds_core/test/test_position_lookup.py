@@ -0,0 +1,80 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+import datetime
+import os
+import shutil
+import tempfile
+
+import pytz
+from django.test import TransactionTestCase
+
+from xgds_core.importer.csvImporter import CsvImporter, PositionIndex, PAST_POSITION_MODEL
+from xgds_core.models import State
+
+POSITION_YAML = os.path.join(os.path.dirname(__file__), 'test_files/state_position.yaml')
+# a minute into the positions of the H1708 track, one a second
+START = datetime.datetime(2018, 9, 2, 22, 59, tzinfo=pytz.utc)
+
+
+class test_position_lookup(TransactionTestCase):
+    """
+    Tests for looking up the positions of imported rows a batch at a time
+    """
+    fixtures = ['xgds_core_testing.json', 'test_h1708_herc_flight.json', 'test_h1708_herc_track.json',
+                'test_h1708_herc_positions.json']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.positions = list(PAST_POSITION_MODEL.get().objects.filter(
+            timestamp__gte=START, timestamp__lt=START + datetime.timedelta(seconds=4)).order_by('timestamp'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_index_without_track(self):
+        with self.settings(GEOCAM_TRACK_INTERPOLATE_MAX_SECONDS=0):
+            index = PositionIndex(None, START, START + datetime.timedelta(seconds=3))
+        self.assertEqual([index.get_position_id(p.timestamp) for p in self.positions],
+                         [p.id for p in self.positions])
+        self.assertEqual(index.get_position_id(START + datetime.timedelta(seconds=0.5)), None)
+
+    def test_deferred_positions(self):
+        csvfile = os.path.join(self.directory, 'states.csv')
+        with open(csvfile, 'w') as stream:
+            for i, position in enumerate(self.positions):
+                timestamp = position.timestamp.isoformat()
+                stream.write('%s,%s,position%d\n' % (timestamp, timestamp, i))
+        # the positions of the first rows are only stored once the import is under way
+        late = self.positions[:2]
+        PAST_POSITION_MODEL.get().objects.filter(pk__in=[p.pk for p in late]).delete()
+        importer = CsvImporter(POSITION_YAML, csvfile, batch_size=2)
+        store_batch = importer.store_batch
+
+        def store_and_add_positions(*args):
+            store_batch(*args)
+            for position in late:
+                position.save()
+            del late[:]
+
+        importer.store_batch = store_and_add_positions
+        with self.settings(GEOCAM_TRACK_INTERPOLATE_MAX_SECONDS=0):
+            self.assertEqual(importer.load_csv_in_batches(), 4)
+        # stored in the order of the file, with the positions found later filled in
+        states = list(State.objects.order_by('pk'))
+        self.assertEqual([s.key for s in states], ['position%d' % i for i in range(4)])
+        self.assertEqual([s.notes for s in states], [str(p.id) for p in self.positions])
+        self.assertTrue(all(s.active for s in states))
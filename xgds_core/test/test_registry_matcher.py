@@ -0,0 +1,40 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+import os
+import re
+
+import yaml
+from django.test import SimpleTestCase
+
+from xgds_core.importer.registryMatcher import RegistryMatcher
+
+
+class test_registry_matcher(SimpleTestCase):
+    """
+    Tests for matching file names to the registry entries of the import handler
+    """
+
+    def test_match(self):
+        configfile = os.path.join(os.path.dirname(__file__), '../importer/example/ImportHandlerConfig.yaml')
+        registry = yaml.load(open(configfile))['registry']
+        matcher = RegistryMatcher(registry)
+        for filename in ['/data/MAPS/localizations_xgds.txt', '/data/TILT/20190101.1_TILT.csv',
+                         '/data/TILT/20190101.1_TILT.csv~', '/data/NRVS/123_NRVS_LW_1.csv', '/data/SLR1/IMG_1.cr2',
+                         '/data/SLR1/IMG_1.CR2', '/data/._notes.txt', '/data/TILT/notes.txt', '/data/DS_Store']:
+            expected = [r for r in registry if re.search(r['filepath_pattern'], filename)]
+            self.assertEqual(matcher.match(filename), expected)
+        self.assertEqual(matcher.search(registry[1], '/data/TILT/1_TILT.csv').group(0), 'TILT/1_TILT.csv')
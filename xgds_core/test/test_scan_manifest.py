@@ -0,0 +1,56 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from xgds_core.importer.scanManifest import ScanManifest
+
+
+class test_scan_manifest(SimpleTestCase):
+    """
+    Tests for skipping unchanged directories when scanning for files to import
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_scan(self):
+        root = os.path.join(self.directory, 'data')
+        os.makedirs(os.path.join(root, 'TILT'))
+        old_file = os.path.join(root, 'TILT', 'old.csv')
+        open(old_file, 'w').close()
+        # old enough that the manifest trusts the times
+        for path in [old_file, os.path.join(root, 'TILT'), root]:
+            os.utime(path, (0, 0))
+        path = os.path.join(self.directory, 'manifest.pickle')
+        manifest = ScanManifest(path)
+        self.assertEqual(manifest.scan(root, changed_only=True), [old_file])
+        self.assertTrue(manifest.save())
+        manifest = ScanManifest(path)
+        self.assertEqual(manifest.scan(root, changed_only=True), [])
+        self.assertEqual(manifest.scan(root), [old_file])
+        new_file = os.path.join(root, 'TILT', 'new.csv')
+        open(new_file, 'w').close()
+        self.assertEqual(manifest.scan(root, changed_only=True), [new_file])
+        manifest.forget(old_file)
+        self.assertEqual(sorted(manifest.scan(root, changed_only=True)), [new_file, old_file])
@@ -0,0 +1,47 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+import datetime
+
+import pytz
+from django.test import SimpleTestCase
+
+from xgds_core.importer.timestampStats import TimestampStats
+
+
+class test_timestamp_stats(SimpleTestCase):
+    """
+    Tests for the streaming timestamp statistics of validate_timestamps.py
+    """
+
+    def test_merge(self):
+        start = datetime.datetime(2019, 1, 1, tzinfo=pytz.utc)
+        times = [start + datetime.timedelta(seconds=i) for i in range(-5, 995)]
+        stats = TimestampStats(start, sample_size=10)
+        merged = TimestampStats(start, sample_size=10)
+        for index in range(0, len(times), 100):
+            part = TimestampStats(start, sample_size=10)
+            for timestamp in times[index:index + 100]:
+                stats.add(timestamp, 'file%d' % index)
+                part.add(timestamp, 'file%d' % index)
+            merged.merge(part)
+        for result in stats, merged:
+            self.assertEqual(result.count, 1000)
+            self.assertEqual((result.first, result.last), (times[0], times[-1]))
+            self.assertEqual(result.before_start, 5)
+            self.assertEqual(result.examples[0], ('file0', times[0]))
+            self.assertTrue(len(result.sample) < 20)
+        self.assertEqual(stats.sample, times[::stats.stride])
@@ -21,11 +21,12 @@ from django.conf import settings
 from django.test import TransactionTestCase
 
 from xgds_core.flightUtils import get_default_vehicle
-from xgds_core.flightUtils import getFlight, getActiveFlight
+from xgds_core.flightUtils import getFlight, getActiveFlight, get_flights, FlightIntervalIndex, FLIGHT_INTERVAL_INDEX
+from xgds_core.flightUtils import get_flight_for_time_span
 from xgds_core.flightUtils import getNextAlphabet
 from xgds_core.flightUtils import create_group_flight, get_next_available_group_flight_name
 from xgds_core.flightUtils import lookup_vehicle, lookup_flight
-from xgds_core.models import Vehicle
+from xgds_core.models import Vehicle, Flight
 
 class xgds_AllTheUtils(TransactionTestCase):
     """
@@ -71,6 +72,37 @@ class xgds_AllTheUtils(TransactionTestCase):
         assert(flight.uuid=='abc123')
         assert(flight.name=='Christmas in a Generic Vehicle')
 
+    def test_flightIntervalIndex(self):
+        times = [datetime.datetime(year,12,25,12,0,0,0,pytz.utc) for year in (2014, 2015, 2016)]
+        index = FlightIntervalIndex()
+        for vehicle in (None, 1):
+            expected = [getFlight(t, vehicle) for t in times]
+            self.assertEqual(index.get_flight_ids(times, vehicle), [f.id if f else None for f in expected])
+            self.assertEqual(get_flights(times, vehicle), expected)
+
+    def test_flightIntervalIndexInvalidation(self):
+        time = datetime.datetime(2015,12,25,12,0,0,0,pytz.utc)
+        self.assertEqual(get_flight_for_time_span(time, time), getFlight(time, get_default_vehicle()))
+        self.assertTrue(FLIGHT_INTERVAL_INDEX.loaded)
+        # saving other models keeps the index
+        get_default_vehicle().save()
+        self.assertTrue(FLIGHT_INTERVAL_INDEX.loaded)
+        flight = Flight.objects.get(pk=1)
+        flight.save()
+        self.assertFalse(FLIGHT_INTERVAL_INDEX.loaded)
+
+    def test_flightIntervalIndexMaxAge(self):
+        time = datetime.datetime(2015,12,25,12,0,0,0,pytz.utc)
+        index = FlightIntervalIndex()
+        with self.settings(XGDS_CORE_FLIGHT_INDEX_MAX_AGE=60):
+            index.get_flight_id(time)
+            index.check_age()
+            self.assertTrue(index.loaded)
+            # as if it was loaded over a minute ago
+            index.load_time -= 61
+            index.check_age()
+            self.assertFalse(index.loaded)
+
     def test_getNextAlphabet(self):
         assert('b'==getNextAlphabet('a'))
         assert('c'==getNextAlphabet('b'))
@@ -0,0 +1,87 @@
+# __BEGIN_LICENSE__
+# Copyright (c) 2015, United States Government, as represented by the
+# Administrator of the National Aeronautics and Space Administration.
+# All rights reserved.
+#
+# The xGDS platform is licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+# __END_LICENSE__
+
+import os
+import shutil
+import tempfile
+
+import yaml
+from django.test import SimpleTestCase
+
+from xgds_core.importer import validate_timestamps
+from xgds_core.importer.validate_timestamps import TimestampValidator
+
+# the first timestamp of the generated files, 2019-01-01
+START_SECONDS = 1546300800
+
+
+class test_validate_timestamps(SimpleTestCase):
+    """
+    Tests for getting the timestamps of a tree of files with validate_timestamps.py
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.root = os.path.join(self.directory, 'data')
+        os.makedirs(os.path.join(self.root, 'TILT'))
+        os.makedirs(os.path.join(self.root, 'MAPS'))
+        for index in range(40):
+            open(os.path.join(self.root, 'MAPS', '%d.%06d_pc.jpg' % (START_SECONDS + index, index)), 'w').close()
+        for index in range(10):
+            with open(os.path.join(self.root, 'TILT', '%d_TILT.csv' % (START_SECONDS + index)), 'w') as data_file:
+                for row in range(20):
+                    data_file.write('%d,1,2\n' % ((START_SECONDS + index * 20 + row) * 1000000 + row))
+        self.config_path = os.path.join(self.directory, 'validate.yaml')
+        with open(self.config_path, 'w') as config_file:
+            yaml.dump({'registry': [{'name': 'TILT', 'filepath_pattern': r'TILT/[\d\-\.]+_TILT\.csv',
+                                     'from': 'csv', 'column_number': 0, 'format': 'microseconds'},
+                                    {'name': 'MAPS jpg', 'filepath_pattern': r'MAPS/[\d\-\.]+_pc\.jpg$',
+                                     'from': 'filename', 'format': 'seconds'}]}, config_file)
+        self.quiet = validate_timestamps.QUIET
+        validate_timestamps.QUIET = True
+
+    def tearDown(self):
+        validate_timestamps.QUIET = self.quiet
+        shutil.rmtree(self.directory)
+
+    def validate(self, processes):
+        """
+        :return: the validator, after getting the timestamps with the processes
+        """
+        validator = TimestampValidator(self.config_path)
+        validator.find_files(self.root)
+        validator.process_files(processes=processes)
+        return validator
+
+    def test_parallel(self):
+        serial = self.validate(1)
+        parallel = self.validate(3)
+        self.assertEqual(sorted(serial.timestamps), ['MAPS jpg', 'TILT'])
+        self.assertEqual(serial.timestamps['TILT'].count, 200)
+        self.assertEqual(serial.timestamps['MAPS jpg'].count, 40)
+        self.assertEqual(parallel.timestamps.keys(), serial.timestamps.keys())
+        for name, stats in serial.timestamps.iteritems():
+            self.assertEqual(vars(parallel.timestamps[name]), vars(stats))
+        self.assertEqual(parallel.get_time_span(), serial.get_time_span())
+        self.assertEqual([s[:2] for s in parallel.source_stats.values()],
+                         [s[:2] for s in serial.source_stats.values()])
+
+    def test_error(self):
+        with open(os.path.join(self.root, 'TILT', '%d_TILT.csv' % (START_SECONDS + 99)), 'w') as data_file:
+            data_file.write('%d,1,2\nbad,1,2\n' % (START_SECONDS * 1000000))
+        for processes in (1, 3):
+            with self.assertRaises(ValueError):
+                self.validate(processes)
@@ -16,6 +16,7 @@
 
 import os
 import sys
+import hashlib
 import pytz
 import datetime
 import time
@@ -141,6 +142,22 @@ def get_file_size(input_file):
     return size
 
 
+def get_content_hash(file_path, chunk_size=1024 * 1024):
+    """
+    Hash the contents of a file, reading it a chunk at a time
+    :param file_path: the path to the file
+    :param chunk_size: how many bytes to read at a time
+    :return: the sha1 of the contents as hex
+    """
+    content_hash = hashlib.sha1()
+    with open(file_path, 'rb') as input_file:
+        chunk = input_file.read(chunk_size)
+        while chunk:
+            content_hash.update(chunk)
+            chunk = input_file.read(chunk_size)
+    return content_hash.hexdigest()
+
+
 def persist_error(error, stacktrace=None):
     cache = caches['default']
     # Get current list of error keys or default to empty list